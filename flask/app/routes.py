@@ -1,17 +1,57 @@
-from flask import render_template, flash, redirect, request
+from flask import render_template, flash, redirect, request, Response, stream_with_context, jsonify, abort, url_for
 from app import app
 from app.forms import UrlSearchForm
 
+from collections import OrderedDict
+
 import sys, os
 sys.path.append(os.path.abspath('../'))
+from utilities.cache_toolkit import MemoryBackend, SQLiteBackend, UrlResultCache
 from utilities.flask_interface import Interface
+from utilities.job_queue import JobQueue, serializable
+from utilities.metrics import metrics
+from utilities.reddit_scheduler import RedditScheduler
+
+metrics.enabled = app.config['METRICS_ENABLED']
+
+# Every Interface makes its Reddit requests through one scheduler, so that they share the rate limit budget and
+# concurrent searches for the same article make its requests once.
+scheduler = RedditScheduler(app.config['REDDIT_BUDGET_PATH'], rate=app.config['REDDIT_RATE'],
+                            capacity=app.config['REDDIT_BURST'])
 
-interface = Interface(abs_path=os.path.abspath('../utilities') + '/')
+# The interface's components are loaded on first use, unless warming up is enabled, in which case they are loaded
+# now and the time taken by each is logged.
+interface = Interface(abs_path=os.path.abspath('../utilities') + '/',
+                      sentiment_backend=app.config['SENTIMENT_BACKEND'], scheduler=scheduler)
+if app.config['WARM_UP']:
+    interface.warm_up()
+    app.logger.info('Startup profile:\n' + interface.startup_report())
+
+# Searches for the same article, common during breaking stories, are answered from the cache.
+if app.config['RESULT_CACHE_PATH']:
+    result_backend = SQLiteBackend(app.config['RESULT_CACHE_PATH'])
+else:
+    result_backend = MemoryBackend()
+results_cache = UrlResultCache(lambda url, max_number: interface.flask_packaging(url=url, max_number=max_number),
+                               backend=result_backend, ttl=app.config['RESULT_CACHE_TTL'])
+
+# With asynchronous jobs, searches are analyzed by a separate pool of workers, each with its own Interface.
+jobs = None
+if app.config['ASYNC_JOBS']:
+    jobs = JobQueue(lambda: Interface(abs_path=os.path.abspath('../utilities') + '/',
+                                      sentiment_backend=app.config['SENTIMENT_BACKEND'], scheduler=scheduler),
+                    workers=app.config['JOB_WORKERS'],
+                    on_complete=lambda job: results_cache.put(job.url, job.max_number, job.results))
+    jobs.start()
 
 @app.route('/', methods=['GET', 'POST'])
 def search():
     search = UrlSearchForm()
     if request.method == 'POST':
+        if jobs is not None:
+            return submit_job(search.data['url'])
+        if app.config['STREAM_RESULTS']:
+            return stream_results_for(search.data['url'])
         return find_results(search)
     return render_template('index.html', title='Home', form=search)
 
@@ -21,9 +61,107 @@ def find_results(url):
     url_string = url.data['url']
     # Keep it from checking junk or empty strings, which can occasionally
     # return results for some reason.
-    if 'http' in url_string:
-        results = interface.flask_packaging(url=url_string, max_number=5)
-    else:
-        results = {}
+    with metrics.trace() as timings:
+        if 'http' in url_string:
+            results = results_cache.get(url_string, max_number=5)
+        else:
+            results = {}
     results = [r for r in results if r['comment_count'] > 0]
-    return render_template('results.html', results=results, url=url_string)
+    return render_template('results.html', results=results, url=url_string, timings=breakdown(timings))
+
+
+@app.route('/results/stream', methods=['GET', 'POST'])
+def stream_results():
+    return stream_results_for(request.values.get('url', ''))
+
+
+def stream_results_for(url_string):
+    """
+    Sends the results page in chunks, with each submission's card pushed to the browser as soon as it has been
+    analyzed rather than once all of them have.
+    """
+    timings = OrderedDict()
+
+    def generate_results():
+        # Keep it from checking junk or empty strings, which can occasionally
+        # return results for some reason.
+        if 'http' not in url_string:
+            return
+        cached = results_cache.lookup(url_string, max_number=5)
+        if cached is not None:
+            for result in cached:
+                if result['comment_count'] > 0:
+                    yield result
+            return
+
+        results = []
+        with metrics.trace(timings):
+            for result in interface.iter_packaging(url=url_string, max_number=5):
+                results.append(result)
+                if result['comment_count'] > 0:
+                    yield result
+        results_cache.put(url_string, 5, results)
+
+    # The breakdown is filled in as the results are generated, so it is complete by the end of the page.
+    context = {'results': generate_results(), 'url': url_string,
+               'timings': timings if app.config['TIMING_BREAKDOWN'] else None}
+    app.update_template_context(context)
+    template = app.jinja_env.get_template('stream_results.html')
+    return Response(stream_with_context(template.stream(context)))
+
+
+def submit_job(url_string):
+    """
+    Queues the analysis of a url. API clients receive the job id, and browsers are sent to the job's page. Urls with
+    results in the cache are answered directly, without a job.
+    """
+    wants_json = request.accept_mimetypes.best_match(['application/json', 'text/html']) == 'application/json'
+    cached = results_cache.lookup(url_string, max_number=5) if 'http' in url_string else None
+    if cached is not None:
+        if wants_json:
+            return jsonify({'status': 'done', 'url': url_string, 'results': serializable(cached)})
+        results = [r for r in cached if r['comment_count'] > 0]
+        return render_template('results.html', results=results, url=url_string)
+
+    job_id = jobs.submit(url_string, max_number=5)
+    if wants_json:
+        return jsonify({'job_id': job_id, 'status_url': url_for('job_status', job_id=job_id)}), 202
+    return redirect(url_for('job_results', job_id=job_id))
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    if jobs is None:
+        abort(404)
+    status = jobs.status(job_id, include_results=request.args.get('results') == 'true')
+    if status is None:
+        abort(404)
+    return jsonify(status)
+
+
+@app.route('/jobs/<job_id>/results')
+def job_results(job_id):
+    if jobs is None:
+        abort(404)
+    # The job is read once, as it may be evicted between two reads.
+    status = jobs.status(job_id, include_results=True)
+    if status is None:
+        abort(404)
+    if status['status'] != 'done':
+        return render_template('job.html', job=status)
+    results = [r for r in status['results'] if r['comment_count'] > 0]
+    return render_template('results.html', results=results, url=status['url'])
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    if not app.config['METRICS_ENABLED']:
+        abort(404)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+def breakdown(timings):
+    """
+    :return: The stage timings of a request for the results page, if the breakdown is enabled, otherwise None.
+    """
+    return timings if app.config['TIMING_BREAKDOWN'] else None
@@ -1,4 +1,36 @@
 import os
 
 class Config(object):
-        SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
\ No newline at end of file
+        SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
+
+        # Seconds for which the analysis of an article is served from the cache before being refreshed, and the path of
+        # an SQLite file to share the cache between worker processes. Without a path, each process keeps its own.
+        RESULT_CACHE_TTL = int(os.environ.get('RESULT_CACHE_TTL') or 300)
+        RESULT_CACHE_PATH = os.environ.get('RESULT_CACHE_PATH')
+
+        # Whether searches render each discussion as soon as it has been analyzed, rather than all of them at once. Off
+        # by default, as it replaces the results page of POST / with a streamed one.
+        STREAM_RESULTS = (os.environ.get('STREAM_RESULTS') or 'false').lower() == 'true'
+
+        # Whether searches are queued and analyzed by a pool of JOB_WORKERS background workers, each with its own
+        # models, instead of in the request thread.
+        ASYNC_JOBS = (os.environ.get('ASYNC_JOBS') or 'false').lower() == 'true'
+        JOB_WORKERS = int(os.environ.get('JOB_WORKERS') or 2)
+
+        # Whether the models are loaded when the app starts, rather than by the first request to need them.
+        WARM_UP = (os.environ.get('WARM_UP') or 'false').lower() == 'true'
+
+        # Whether the sentiment model runs in 'tflearn' or, without loading TensorFlow, in 'numpy'.
+        SENTIMENT_BACKEND = os.environ.get('SENTIMENT_BACKEND') or 'tflearn'
+
+        # Whether stage timings and counters are recorded and served at /metrics, and whether the results page ends
+        # with a breakdown of the time spent on each stage of its analysis, for debugging.
+        METRICS_ENABLED = (os.environ.get('METRICS_ENABLED') or 'true').lower() == 'true'
+        TIMING_BREAKDOWN = (os.environ.get('TIMING_BREAKDOWN') or 'false').lower() == 'true'
+
+        # The shared budget of Reddit requests: REDDIT_RATE requests per second on average, in bursts of at most
+        # REDDIT_BURST. Every process using the SQLite file at REDDIT_BUDGET_PATH, including batch runs, draws on one
+        # budget, and batch runs leave half of it to searches. Without a path, each process keeps its own.
+        REDDIT_RATE = float(os.environ.get('REDDIT_RATE') or 1.0)
+        REDDIT_BURST = int(os.environ.get('REDDIT_BURST') or 10)
+        REDDIT_BUDGET_PATH = os.environ.get('REDDIT_BUDGET_PATH')
@@ -0,0 +1,203 @@
+# Command line analysis of many article URLs, writing one json line per URL. The output doubles as a checkpoint, so an
+# interrupted run started again with the same output picks up where it stopped.
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from utilities.job_queue import serializable
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+
+def read_urls(lines):
+    """
+    :param lines: An iterable of lines, such as an open file.
+    :return: The URLs of the lines, in order and without repeats. Blank lines and lines starting with # are skipped.
+    """
+    urls = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            urls.append(line)
+    return list(dict.fromkeys(urls))
+
+
+def completed_urls(path):
+    """
+    :param path: Path of the output of an earlier run.
+    :action: Truncates the output after its last complete line, dropping a record cut short by a crash.
+    :return: The set of URLs analyzed without error in the output, or an empty set if there is no output yet. URLs
+             whose analysis failed are retried, and the last record of a URL is its latest.
+    """
+    if not os.path.isfile(path):
+        return set()
+    urls = set()
+    end = 0
+    with open(path, 'rb') as infile:
+        for line in infile:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(line.decode('utf-8'))
+                if record.get('error') is None:
+                    urls.add(record['url'])
+            except (ValueError, KeyError, AttributeError):
+                break
+            end += len(line)
+    if end != os.path.getsize(path):
+        with open(path, 'r+b') as outfile:
+            outfile.truncate(end)
+    return urls
+
+
+class BatchRunner(object):
+    """
+    Analyzes URLs on a pool of worker threads, each holding its own Interface, as the JobQueue workers do. Records are
+    written in the order the analyses finish, each flushed as soon as it's written.
+    """
+
+    def __init__(self, interface_factory, *, workers=4, max_number=5):
+        """
+        :param interface_factory: A function returning a new Interface, called once by each worker.
+        :param workers: The number of URLs analyzed at once.
+        :param max_number: The maximum number of submissions of each article to analyze.
+        """
+        self.interface_factory = interface_factory
+        self.workers = workers
+        self.max_number = max_number
+        self._local = threading.local()
+
+    def analyze(self, url):
+        """
+        :param url: Article URL
+        :return: The record of the URL: its results, or the error which stopped its analysis.
+        """
+        start = time.perf_counter()
+        record = {'url': url, 'results': [], 'error': None}
+        try:
+            interface = getattr(self._local, 'interface', None)
+            if interface is None:
+                interface = self._local.interface = self.interface_factory()
+            record['results'] = serializable(interface.flask_packaging(url=url, max_number=self.max_number))
+        except Exception as e:
+            record['error'] = '{}: {}'.format(type(e).__name__, e)
+        record['seconds'] = time.perf_counter() - start
+        return record
+
+    def run(self, urls, outfile, *, skip=()):
+        """
+        :param urls: A list of article URLs.
+        :param outfile: A text file the records are written to.
+        :param skip: URLs already analyzed, which are left out.
+        :return: A dictionary of the number of URLs analyzed, skipped and failed, and the throughput.
+        """
+        todo = [url for url in urls if url not in skip]
+        report = {'analyzed': 0, 'skipped': len(urls) - len(todo), 'errors': 0, 'submissions': 0}
+        start = time.perf_counter()
+
+        # At most twice as many URLs as workers are queued at once, so that huge lists aren't all held as futures.
+        remaining = iter(todo)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            running = set()
+            while True:
+                for url in remaining:
+                    running.add(pool.submit(self.analyze, url))
+                    if len(running) >= 2 * self.workers:
+                        break
+                if not running:
+                    break
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record = future.result()
+                    outfile.write(json.dumps(record) + '\n')
+                    outfile.flush()
+                    report['analyzed'] += 1
+                    report['submissions'] += len(record['results'])
+                    if record['error'] is not None:
+                        report['errors'] += 1
+
+        report['seconds'] = time.perf_counter() - start
+        report['urls_per_second'] = report['analyzed'] / report['seconds'] if report['seconds'] else 0.0
+        return report
+
+
+def run_batch(urls, output, interface_factory, *, workers=4, max_number=5):
+    """
+    :param urls: A list of article URLs.
+    :param output: Path of the json lines output, which is appended to, leaving out URLs it already has records of.
+                   If None, records are written to standard output and nothing is resumed.
+    :param interface_factory: See BatchRunner.
+    :return: See BatchRunner.run.
+    """
+    runner = BatchRunner(interface_factory, workers=workers, max_number=max_number)
+    if output is None:
+        return runner.run(urls, sys.stdout)
+    skip = completed_urls(output)
+    with open(output, 'a', encoding='utf-8') as outfile:
+        return runner.run(urls, outfile, skip=skip)
+
+
+def replaying_interface_factory(abs_path, snapshots, **options):
+    """
+    :param abs_path: See Interface.
+    :param snapshots: Path of a SnapshotStore recorded by replay.py.
+    :param options: Other arguments of Interface.
+    :return: A function returning Interfaces whose Reddit and Wikipedia traffic is served from the snapshots.
+    """
+    from utilities.flask_interface import Interface
+    from utilities.replay import SnapshotStore, replay
+
+    store = SnapshotStore(snapshots)
+
+    def factory():
+        interface = Interface(abs_path, **options)
+        replay(interface, store, strict=False)
+        return interface
+    return factory
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Analyzes the discussions of many articles, writing one json line '
+                                                 'per URL.')
+    parser.add_argument('urls', nargs='?', default='-', help='A file of URLs, one per line, or - for standard input.')
+    parser.add_argument('--output', help='Path of the json lines output. Records already in it are not analyzed '
+                                         'again. By default, records are written to standard output.')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--max-number', type=int, default=5,
+                        help='The maximum number of submissions of each article to analyze.')
+    parser.add_argument('--replay', help='Path of a snapshot file recorded by replay.py, to analyze without a network.')
+    parser.add_argument('--sentiment-backend', default='tflearn', choices=('tflearn', 'numpy'))
+    parser.add_argument('--reddit-rate', type=float, default=1.0, help='Reddit requests per second, on average.')
+    parser.add_argument('--reddit-burst', type=int, default=10, help='The most Reddit requests made in one burst.')
+    parser.add_argument('--reddit-budget', help='Path of the SQLite file of the Reddit request budget shared with the '
+                                                'web app, as REDDIT_BUDGET_PATH. Batch requests leave half of it to '
+                                                'interactive searches.')
+    args = parser.parse_args()
+
+    if args.urls == '-':
+        urls = read_urls(sys.stdin)
+    else:
+        with open(args.urls) as infile:
+            urls = read_urls(infile)
+
+    # Each worker's Interface has its own entity recognition processes, which share the CPUs between them.
+    abs_path = os.path.dirname(os.path.abspath(__file__)) + '/'
+    options = {'sentiment_backend': args.sentiment_backend,
+               'ner_workers': max(1, (os.cpu_count() or 1) // args.workers)}
+    if args.replay:
+        factory = replaying_interface_factory(abs_path, args.replay, **options)
+    else:
+        from utilities.flask_interface import Interface
+        from utilities.reddit_scheduler import BATCH, RedditScheduler
+
+        # The workers share one scheduler, and so one budget and the results of identical requests made at once.
+        scheduler = RedditScheduler(args.reddit_budget, rate=args.reddit_rate, capacity=args.reddit_burst, timeout=None)
+        factory = lambda: Interface(abs_path, scheduler=scheduler, reddit_priority=BATCH, **options)
+
+    report = run_batch(urls, args.output, factory, workers=args.workers, max_number=args.max_number)
+    sys.stderr.write("Analyzed {analyzed} URLs ({skipped} already done, {errors} failed) and {submissions} "
+                     "discussions in {seconds:.1f}s, {urls_per_second:.2f} URLs/sec\n".format(**report))
+    sys.exit(1 if report['errors'] else 0)
@@ -0,0 +1,333 @@
+# Benchmarks of the analysis pipeline's hot paths over a synthetic, deterministic corpus of Reddit comments, with no
+# network access. Results are written as json, so that runs on different commits can be compared.
+
+from collections import OrderedDict
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Names used in the synthetic comments, with the dictionary entries they are resolved from.
+FIGURES = {'Barack Obama': 'Democratic Party', 'Donald Trump': 'Republican Party',
+           'Hillary Clinton': 'Democratic Party', 'Mitch McConnell': 'Republican Party',
+           'Nancy Pelosi': 'Democratic Party', 'Paul Ryan': 'Republican Party',
+           'Bernie Sanders': 'Independent politician', 'Ted Cruz': 'Republican Party'}
+
+TEMPLATES = ["I honestly think {0} handled this far better than {1} ever could have, and the polling seems to agree.",
+             "Say what you want about {0}, but this bill is a disaster and {1} should be held responsible for it.",
+             "{0} was right about this from the start. It's embarrassing how long it took everyone else to notice.",
+             "Nobody in the party trusts {1} anymore, which is why {0} is going to win the nomination next year.",
+             "The article is misleading. {0} never said that, and the quote they attribute to {1} is out of context."]
+
+
+def synthetic_comments(count, seed=0):
+    """
+    :param count: The number of comments.
+    :param seed: Seed of the choice of names and templates.
+    :return: A list of comments mentioning the FIGURES, each over the minimum length of analyzed comments.
+    """
+    rng = random.Random(seed)
+    names = sorted(FIGURES)
+    return [rng.choice(TEMPLATES).format(*rng.sample(names, 2)) for _ in range(count)]
+
+
+def synthetic_forest(count, *, branching=4, seed=0):
+    """
+    :param count: The number of comments in the tree.
+    :param branching: The maximum number of replies to each comment.
+    :param seed: Seed of the comments and the tree's shape.
+    :return: A comment tree in the form stored by replay.forest_to_list.
+    """
+    rng = random.Random(seed)
+    bodies = synthetic_comments(count, seed)
+    top_level = []
+    parents = []
+    for i, body in enumerate(bodies):
+        comment = {'id': 'c{}'.format(i), 'body': body if rng.random() < 0.7 else body[:40],
+                   'score': rng.randint(-50, 500), 'permalink': '/r/politics/comments/s/_/c{}/'.format(i),
+                   'author': rng.choice(['user', 'user', 'user', 'AutoModerator', None]), 'replies': []}
+        open_parents = [parent for parent in parents if len(parent['replies']) < branching]
+        if not open_parents or rng.random() < 0.2:
+            comment['parent_id'] = 't3_s'
+            top_level.append(comment)
+        else:
+            parent = rng.choice(open_parents)
+            comment['parent_id'] = 't1_' + parent['id']
+            parent['replies'].append(comment)
+        parents.append(comment)
+    return top_level
+
+
+def summarize(latencies, items_per_call=1):
+    """
+    :param latencies: The seconds taken by each call.
+    :param items_per_call: The number of items processed by each call, such as the size of a batch.
+    :return: A dictionary of the throughput and latency percentiles, in milliseconds, of the calls.
+    """
+    ordered = sorted(latencies)
+    total = sum(ordered)
+
+    def percentile(p):
+        return 1000 * ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    items = len(ordered) * items_per_call
+    return {'calls': len(ordered),
+            'items': items,
+            'seconds': total,
+            'items_per_second': items / total if total else 0.0,
+            'mean_ms': 1000 * total / len(ordered),
+            'p50_ms': percentile(50),
+            'p90_ms': percentile(90),
+            'p99_ms': percentile(99),
+            'max_ms': 1000 * ordered[-1]}
+
+
+def measure(function, inputs, *, items_per_call=1, warm_up=1):
+    """
+    :param function: The function benchmarked, called with each input.
+    :param inputs: A list of inputs. The first warm_up are also used to warm up, without being timed.
+    :param items_per_call: See summarize.
+    :return: The summary of the timed calls.
+    """
+    for argument in inputs[:warm_up]:
+        function(argument)
+    latencies = []
+    for argument in inputs:
+        started = time.perf_counter()
+        function(argument)
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies, items_per_call)
+
+
+class Fixtures(object):
+    """
+    The components benchmarked, each built on first use. Entities are resolved from a dictionary seeded with the
+    FIGURES, and any other lookup finds nothing, so no benchmark touches the network.
+    """
+
+    def __init__(self, *, abs_path, comments=500, seed=0, forest_size=5000, calls=None):
+        """
+        :param abs_path: Path of the utilities directory, ending in a slash.
+        :param comments: The size of the synthetic corpus.
+        :param seed: Seed of the corpus.
+        :param forest_size: The number of comments in each synthetic comment tree.
+        :param calls: The number of timed calls of each benchmark, by default its own.
+        """
+        self.abs_path = abs_path
+        self.comments = synthetic_comments(comments, seed)
+        self.seed = seed
+        self.forest_size = forest_size
+        self.calls = calls
+        self.directory = tempfile.mkdtemp(prefix='benchmark-')
+        self._linker = None
+        self._classifier = None
+
+    def sample(self, inputs):
+        """
+        :param inputs: The inputs of a benchmark's calls.
+        :return: The first calls of them, or all of them by default.
+        """
+        return inputs if self.calls is None else inputs[:self.calls]
+
+    def close(self):
+        """
+        :action: Closes the entity linker and removes the temporary files.
+        :return: None
+        """
+        if self._linker is not None:
+            self._linker.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    @property
+    def linker(self):
+        if self._linker is None:
+            import utilities.entity_toolkit as et
+            import utilities.replay as rp
+
+            store = rp.SnapshotStore(os.path.join(self.directory, 'empty.jsonl'))
+            self._linker = et.EntityLinker(path=os.path.join(self.directory, 'dict.json'),
+                                           backend=rp.ReplayBackend(store, strict=False))
+            self._linker.ent_dict.update({name.lower(): (name, party) for name, party in FIGURES.items()})
+        return self._linker
+
+    @property
+    def classifier(self):
+        if self._classifier is None:
+            import utilities.sentiment_toolkit as st
+            self._classifier = st.SentimentClassifier(load_path=self.abs_path + 'saved_data/trained_models/model.tfl')
+        return self._classifier
+
+    def interface(self, submissions=3, comments_per_submission=200):
+        """
+        :return: An Interface analyzing a replayed article with the given number of synthetic discussions.
+        """
+        import utilities.flask_interface as fi
+        import utilities.replay as rp
+
+        store = rp.SnapshotStore(os.path.join(self.directory, 'article-{}.jsonl'.format(submissions)))
+        listing = [{'id': 's{}'.format(i), 'title': 'Discussion {}'.format(i), 'subreddit': 'politics', 'score': 100,
+                    'permalink': '/r/politics/comments/s{}/'.format(i), 'num_comments': comments_per_submission,
+                    'url': 'https://example.com/article'} for i in range(submissions)]
+        store.record('reddit', 'discussions_of_url', ['https://example.com/article'], listing)
+        for i, submission in enumerate(listing):
+            store.record('reddit', 'fetch_comments', [submission['id']],
+                         synthetic_forest(comments_per_submission, seed=self.seed + i))
+
+        interface = fi.Interface(self.abs_path, spill_cache=False, state_size=0)
+        interface.rt = rp.ReplayExplorer(store)
+        interface.ent_linker = self.linker
+        interface.sentiment = self.classifier
+        return interface
+
+
+def bench_identify_entities(fixtures):
+    return measure(fixtures.linker.identify_entities, fixtures.sample(fixtures.comments))
+
+
+def bench_entity_to_political_party(fixtures):
+    entities = [(name, 'PERSON') for name in sorted(FIGURES)] * 100
+    return measure(fixtures.linker.entity_to_political_party, fixtures.sample(entities))
+
+
+def bench_predict(fixtures):
+    return measure(fixtures.classifier.predict, fixtures.sample(fixtures.comments))
+
+
+def bench_predict_batch(fixtures):
+    size = min(100, len(fixtures.comments))
+    batches = [fixtures.comments[i:i+size] for i in range(0, len(fixtures.comments) - size + 1, size)]
+    return measure(fixtures.classifier.predict_batch, fixtures.sample(batches), items_per_call=size)
+
+
+def bench_all_comments_to_list(fixtures):
+    import utilities.replay as rp
+
+    explorer = rp.ReplayExplorer(None)
+    forests = [rp.ReplayForest(synthetic_forest(fixtures.forest_size, seed=fixtures.seed + i)) for i in range(20)]
+    return measure(explorer.all_comments_to_list, fixtures.sample(forests))
+
+
+def bench_comment_frame(fixtures):
+    import utilities.comment_frame as cf
+    import utilities.replay as rp
+
+    forests = fixtures.sample([rp.ReplayForest(synthetic_forest(fixtures.forest_size, seed=fixtures.seed + i)).list()
+                               for i in range(20)])
+    rng = random.Random(fixtures.seed)
+    leans = [[rng.choice((-1, 0, 0, 1)) for _ in forest] for forest in forests]
+
+    def score(i):
+        frame = cf.CommentFrame.from_comments(forests[i])
+        frame.sentiment[:] = 1.0
+        frame.lean[:] = leans[i]
+        return cf.aggregate(frame.contributions()[frame.relevant()])
+    return measure(score, list(range(len(forests))), items_per_call=fixtures.forest_size)
+
+
+def bench_flask_packaging(fixtures):
+    interface = fixtures.interface(comments_per_submission=min(200, fixtures.forest_size))
+    # The linker and classifier are built without a results cache, so every run does the full analysis.
+    return measure(lambda url: interface.flask_packaging(url=url), fixtures.sample(['https://example.com/article'] * 5),
+                   items_per_call=3)
+
+
+BENCHMARKS = OrderedDict([('identify_entities', bench_identify_entities),
+                          ('entity_to_political_party', bench_entity_to_political_party),
+                          ('predict', bench_predict),
+                          ('predict_batch', bench_predict_batch),
+                          ('all_comments_to_list', bench_all_comments_to_list),
+                          ('comment_frame', bench_comment_frame),
+                          ('flask_packaging', bench_flask_packaging)])
+
+
+def run(names=None, *, abs_path, comments=500, seed=0, forest_size=5000, calls=None):
+    """
+    :param names: The names of the BENCHMARKS to run, by default all of them.
+    :param abs_path: See Fixtures.
+    :param comments: See Fixtures.
+    :param seed: See Fixtures.
+    :param forest_size: See Fixtures.
+    :param calls: See Fixtures.
+    :return: A json-serializable report of the environment and the summary of each benchmark. Benchmarks whose
+             components can't be loaded, such as a missing model, are reported as skipped with the reason.
+    """
+    fixtures = Fixtures(abs_path=abs_path, comments=comments, seed=seed, forest_size=forest_size, calls=calls)
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=abs_path or '.',
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    report = {'commit': commit,
+              'python': platform.python_version(),
+              'machine': platform.machine(),
+              'timestamp': time.time(),
+              'comments': comments,
+              'seed': seed,
+              'forest_size': forest_size,
+              'calls': calls,
+              'results': OrderedDict()}
+    try:
+        for name in names or BENCHMARKS:
+            try:
+                report['results'][name] = BENCHMARKS[name](fixtures)
+            except Exception as e:
+                report['results'][name] = {'skipped': '{}: {}'.format(type(e).__name__, e)}
+    finally:
+        fixtures.close()
+    return report
+
+
+def compare(baseline, current, *, tolerance=0.2):
+    """
+    :param baseline: A report returned by run.
+    :param current: A later report.
+    :param tolerance: The fraction by which throughput may fall before it counts as a regression.
+    :return: A list of (name, baseline items per second, current items per second) for each regressed benchmark.
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name, {})
+        if 'items_per_second' in result and 'items_per_second' in before:
+            if result['items_per_second'] < before['items_per_second'] * (1 - tolerance):
+                regressions.append((name, before['items_per_second'], result['items_per_second']))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the analysis pipeline over a synthetic corpus.')
+    parser.add_argument('benchmarks', nargs='*',
+                        help='The benchmarks to run, by default all of: ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--output', help='Path to write the json report to, rather than standard output.')
+    parser.add_argument('--baseline', help='Path of an earlier report. Exits with status 1 if throughput regressed.')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--comments', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--forest-size', type=int, default=5000)
+    parser.add_argument('--calls', type=int, help='Timed calls of each benchmark, rather than its own number.')
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error('unknown benchmarks: ' + ', '.join(unknown))
+
+    report = run(args.benchmarks, abs_path=os.path.dirname(os.path.abspath(__file__)) + '/',
+                 comments=args.comments, seed=args.seed, forest_size=args.forest_size, calls=args.calls)
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(report, outfile, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as infile:
+            regressions = compare(json.load(infile), report, tolerance=args.tolerance)
+        for name, before, after in regressions:
+            sys.stderr.write("REGRESSION: {} fell from {:.1f} to {:.1f} items/sec\n".format(name, before, after))
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,322 @@
+# Caches for analysis results: per-text model results shared between toolkits, and whole results per article URL.
+
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+# Query parameters added by sharing and tracking which don't change the article a URL points to.
+TRACKING_PARAMETERS = {'fbclid', 'gclid', 'igshid', 'mc_cid', 'mc_eid', 'ref', 'smid', 'cmpid'}
+
+
+def normalize_text(text):
+    """
+    :param text: A string, such as the body of a comment.
+    :return: The text with runs of whitespace collapsed, so that trivially different copies share a cache entry.
+    """
+    return ' '.join(text.split())
+
+
+def normalize_url(url):
+    """
+    :param url: A string url pointing to a news article
+    :return: The url with the scheme and host lowercased, any leading www., fragment, trailing slash and tracking
+             parameters removed, and the remaining query parameters sorted.
+    """
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if key.lower() not in TRACKING_PARAMETERS and not key.lower().startswith('utm_'))
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((parts.scheme.lower() or 'http', host, path, urlencode(query), ''))
+
+
+class ResultCache(object):
+    """
+    A bounded, in-memory LRU mapping of hashed inputs to model results. Entries evicted from memory are spilled to an
+    optional SQLite file, from which they are promoted back on the next lookup.
+    """
+
+    def __init__(self, *, max_size=10000, spill_path=None):
+        self.max_size = max_size
+        self.spill_path = spill_path
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+
+        if spill_path is not None:
+            directory = os.path.dirname(spill_path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            self._db = sqlite3.connect(spill_path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB)')
+            self._db.commit()
+
+    @staticmethod
+    def make_key(namespace, version, text):
+        """
+        :param namespace: The kind of result being cached, such as 'sentiment' or 'entities'.
+        :param version: A string identifying the model that produced the result, so retrained models miss.
+        :param text: The input text.
+        :return: A hex digest identifying this input to this model.
+        """
+        digest = hashlib.sha1('{}\0{}\0'.format(namespace, version).encode('utf-8'))
+        digest.update(normalize_text(text).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key, default=None):
+        """
+        :param key: A key produced by make_key.
+        :param default: Returned if the key is in neither memory nor the spill file.
+        :return: The cached value, or default.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    value = pickle.loads(row[0])
+                    self._store(key, value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """
+        :action: Stores value under key, evicting (and spilling) the least recently used entries beyond max_size.
+        :return: None
+        """
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        evicted = []
+        while len(self._entries) > self.max_size:
+            evicted.append(self._entries.popitem(last=False))
+        if evicted and self._db is not None:
+            self._write(evicted)
+
+    def _write(self, items):
+        self._db.executemany('INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)',
+                             [(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)) for key, value in items])
+        self._db.commit()
+
+    def flush(self):
+        """
+        :action: Writes every in-memory entry to the spill file, if there is one, so it survives a restart.
+        :return: None
+        """
+        with self._lock:
+            if self._db is not None and self._entries:
+                self._write(self._entries.items())
+
+    def stats(self):
+        """
+        :return: A dictionary of the hit and miss counters and the number of entries held in memory.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'disk_hits': self.disk_hits,
+                    'size': len(self._entries),
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def clear(self):
+        """
+        :action: Drops every entry, in memory and on disk, and resets the counters.
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.disk_hits = 0
+            if self._db is not None:
+                self._db.execute('DELETE FROM results')
+                self._db.commit()
+
+    def close(self):
+        """
+        :action: Flushes to and closes the spill file.
+        :return: None
+        """
+        self.flush()
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class MemoryBackend(object):
+    """
+    Stores (stored_at, value) entries for UrlResultCache in a bounded in-process LRU.
+    """
+
+    def __init__(self, *, max_size=500):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, stored_at, value):
+        with self._lock:
+            self._entries[key] = (stored_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class SQLiteBackend(object):
+    """
+    Stores (stored_at, value) entries for UrlResultCache in an SQLite file, so that they are shared by every worker
+    process of a deployment.
+    """
+
+    def __init__(self, path, *, max_size=5000):
+        self.path = path
+        self.max_size = max_size
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._local = threading.local()
+        with self._connection() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS url_results (key TEXT PRIMARY KEY, stored_at REAL, value BLOB)')
+            db.execute('CREATE INDEX IF NOT EXISTS url_results_age ON url_results (stored_at)')
+
+    def _connection(self):
+        # Connections aren't shared between threads, so each thread opens its own.
+        if getattr(self._local, 'db', None) is None:
+            self._local.db = sqlite3.connect(self.path, timeout=30)
+        return self._local.db
+
+    def get(self, key):
+        row = self._connection().execute('SELECT stored_at, value FROM url_results WHERE key = ?',
+                                         (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0], pickle.loads(row[1])
+
+    def set(self, key, stored_at, value):
+        with self._connection() as db:
+            db.execute('INSERT OR REPLACE INTO url_results (key, stored_at, value) VALUES (?, ?, ?)',
+                       (key, stored_at, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+            # The oldest entries beyond max_size are dropped.
+            db.execute('DELETE FROM url_results WHERE key IN (SELECT key FROM url_results '
+                       'ORDER BY stored_at DESC LIMIT -1 OFFSET ?)', (self.max_size,))
+
+
+class UrlResultCache(object):
+    """
+    Caches the analysis of each article URL. Entries younger than ttl are served as they are. Older entries are
+    still served immediately, while a background thread recomputes them, unless they are older than max_age, in
+    which case they are recomputed before returning.
+    """
+
+    def __init__(self, compute, *, backend=None, ttl=300, max_age=None):
+        """
+        :param compute: A function of (url, max_number) returning the results to cache.
+        :param backend: Where entries are stored, by default a MemoryBackend.
+        :param ttl: Seconds for which an entry is fresh.
+        :param max_age: Seconds after which an entry is too stale to serve at all. If None, stale entries are always
+                        served while they are refreshed.
+        """
+        self.compute = compute
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.max_age = max_age
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(url, max_number):
+        return '{}|{}'.format(normalize_url(url), max_number)
+
+    def get(self, url, max_number=5):
+        """
+        :param url: A string url pointing to a news article
+        :param max_number: The maximum number of submissions analyzed, which is part of the cache key.
+        :return: The results of compute for this url, possibly served from the cache.
+        """
+        value = self.lookup(url, max_number)
+        if value is None:
+            value = self._refresh(self.make_key(url, max_number), url, max_number)
+        return value
+
+    def lookup(self, url, max_number=5):
+        """
+        Like get, but returns None rather than computing the results when there's no usable entry, for callers which
+        compute the results themselves and store them with put.
+        """
+        key = self.make_key(url, max_number)
+        entry = self.backend.get(key)
+        if entry is not None:
+            stored_at, value = entry
+            age = time.time() - stored_at
+            if age <= self.ttl:
+                self.hits += 1
+                return value
+            if self.max_age is None or age <= self.max_age:
+                self.stale_hits += 1
+                self._refresh_in_background(key, url, max_number)
+                return value
+
+        self.misses += 1
+        return None
+
+    def put(self, url, max_number, value):
+        """
+        :action: Stores results computed elsewhere for the url.
+        :return: None
+        """
+        self.backend.set(self.make_key(url, max_number), time.time(), value)
+
+    def _refresh(self, key, url, max_number):
+        value = self.compute(url, max_number)
+        self.backend.set(key, time.time(), value)
+        return value
+
+    def _refresh_in_background(self, key, url, max_number):
+        # Only one refresh of each entry runs at a time.
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._refresh(key, url, max_number)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        thread = threading.Thread(target=refresh, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,135 @@
+# A columnar representation of a submission's comments, over which filtering, the propagation of a comment's political
+# lean to its replies, and the aggregation of comment scores are done as NumPy array operations.
+
+import numpy as np
+
+
+def inherit_lean(lean, parents):
+    """
+    Gives each comment without a political lean of its own the lean of its nearest ancestor which has one, as a reply
+    which names no one is most likely about whoever its parent was about. Each step of the loop doubles the distance
+    looked up the tree, so a thread of depth d takes log(d) steps.
+    :param lean: An array of each comment's own lean, 1, -1 or 0.
+    :param parents: An array of the index of each comment's parent, or -1 for comments whose parent isn't present.
+    :return: An array of the lean each comment is weighed by.
+    """
+    lean = np.asarray(lean, dtype=np.float64)
+    parents = np.asarray(parents, dtype=np.int64)
+    indices = np.arange(len(lean))
+    source = np.where((lean != 0) | (parents < 0), indices, parents)
+    while True:
+        next_source = source[source]
+        if np.array_equal(next_source, source):
+            break
+        source = next_source
+    return lean[source]
+
+
+def aggregate(contributions):
+    """
+    :param contributions: An array of each comment's sentiment * score * lean.
+    :return: The (republican, democratic) totals, each the sum of the absolute value of the contributions leaning that
+             way.
+    """
+    contributions = np.asarray(contributions, dtype=np.float64)
+    return float(contributions[contributions > 0].sum()), float(-contributions[contributions < 0].sum())
+
+
+class CommentFrame(object):
+    """
+    Comments as a struct of arrays, with one row per comment in breadth first order. Ids are the base 36 comment ids
+    as integers, parents are row indices, and the bodies are kept in one string indexed by an offset table. The
+    sentiment and lean columns are filled in by the analysis, see SubmissionRefresh.complete, and the submission's
+    totals are aggregated from them.
+    """
+
+    def __init__(self, ids, parents, scores, bodies):
+        """
+        :param ids: The integer id of each comment.
+        :param parents: The row of each comment's parent, or -1.
+        :param scores: The score of each comment.
+        :param bodies: The text of each comment.
+        """
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.parents = np.asarray(parents, dtype=np.int64)
+        self.scores = np.asarray(scores, dtype=np.int64)
+        self.lengths = np.fromiter((len(body) for body in bodies), dtype=np.int64, count=len(bodies))
+        self.offsets = np.zeros(len(bodies) + 1, dtype=np.int64)
+        np.cumsum(self.lengths, out=self.offsets[1:])
+        self.text = ''.join(bodies)
+
+        # Filled in by the analysis.
+        self.sentiment = np.zeros(len(self.ids), dtype=np.float64)
+        self.lean = np.zeros(len(self.ids), dtype=np.float64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_comments(cls, comments):
+        """
+        :param comments: A list of praw Comments, or objects with the same id, parent_id, score and body.
+        :return: A frame of the comments. A comment's parent is only linked if it is also in the list.
+        """
+        rows = {}
+        ids, parent_ids, scores, bodies = [], [], [], []
+        for comment in comments:
+            rows[comment.id] = len(ids)
+            ids.append(int(comment.id, 36))
+            parent_ids.append(getattr(comment, 'parent_id', None) or '')
+            scores.append(comment.score)
+            bodies.append(comment.body)
+
+        # Parent ids are fullnames, such as t1_abc for a comment or t3_xyz for the submission.
+        parents = [rows.get(parent_id[3:], -1) if parent_id.startswith('t1_') else -1 for parent_id in parent_ids]
+        return cls(ids, parents, scores, bodies)
+
+    @classmethod
+    def without_replies(cls, ids, scores, bodies):
+        """
+        :param ids: The base 36 string id of each comment.
+        :param scores: The score of each comment.
+        :param bodies: The text of each comment.
+        :return: A frame of the comments in which none replies to another.
+        """
+        return cls([int(comment_id, 36) for comment_id in ids], [-1] * len(ids), scores, bodies)
+
+    def body(self, row):
+        return self.text[self.offsets[row]:self.offsets[row + 1]]
+
+    def bodies(self, rows=None):
+        """
+        :param rows: The rows of the bodies returned, by default all of them.
+        :return: A list of the bodies of the rows.
+        """
+        rows = range(len(self)) if rows is None else rows
+        return [self.body(row) for row in rows]
+
+    def relevant(self, *, relevance_threshold=10, min_length=100, limit=None):
+        """
+        :param relevance_threshold: See RedditExplorer.extract_comments.
+        :param min_length: See RedditExplorer.extract_comments.
+        :param limit: The most rows returned.
+        :return: An array of the first rows, up to limit, which are worth analyzing.
+        """
+        rows = np.flatnonzero((np.abs(self.scores) > relevance_threshold) & (self.lengths > min_length))
+        return rows if limit is None else rows[:limit]
+
+    def weighed_lean(self):
+        """
+        :return: The lean each comment is weighed by, which is its own or else that of its nearest ancestor.
+        """
+        return inherit_lean(self.lean, self.parents)
+
+    def contributions(self, weights=None):
+        """
+        :param weights: The lean each comment is weighed by, by default weighed_lean().
+        :return: An array of the sentiment * score * lean of each comment.
+        """
+        return self.sentiment * self.scores * (self.weighed_lean() if weights is None else weights)
+
+    def aggregate(self):
+        """
+        :return: See aggregate.
+        """
+        return aggregate(self.contributions())
@@ -0,0 +1,110 @@
+# A comment tokenized once and shared by the entity and sentiment toolkits, rather than tokenized by each of them.
+
+import nltk.data
+import nltk.tokenize
+import re
+
+# The tokenization of the sentiment model's input, which is RegexpTokenizer(r'\w+').
+WORD_PATTERN = re.compile(r'\w+', re.UNICODE | re.MULTILINE | re.DOTALL)
+
+_sentence_tokenizer = None
+
+
+def sentence_tokenizer():
+    """
+    :return: The punkt sentence tokenizer, loaded on first use.
+    """
+    global _sentence_tokenizer
+    if _sentence_tokenizer is None:
+        _sentence_tokenizer = nltk.data.load('tokenizers/punkt/english.pickle')
+    return _sentence_tokenizer
+
+
+class Document(object):
+    """
+    The text of a comment, with each of its tokenizations computed the first time it's asked for and kept: the spans
+    and text of its sentences and their word tokens for entity recognition, and the lowercased words and vocabulary
+    ids for the sentiment model.
+    """
+
+    def __init__(self, text):
+        """
+        :param text: A string comment.
+        """
+        self.text = text
+        self._sentence_spans = None
+        self._sentence_tokens = None
+        self._words = None
+        self._vectors = {}
+
+    def __getstate__(self):
+        # Documents are handed to the entity recognition workers, which don't need the sentiment model's ids.
+        return self.text, self._sentence_spans, self._sentence_tokens
+
+    def __setstate__(self, state):
+        self.text, self._sentence_spans, self._sentence_tokens = state
+        self._words = None
+        self._vectors = {}
+
+    def __repr__(self):
+        return 'Document({!r})'.format(self.text)
+
+    @property
+    def sentence_spans(self):
+        """
+        :return: A list of the (start, end) offsets of each sentence in the text.
+        """
+        if self._sentence_spans is None:
+            self._sentence_spans = list(sentence_tokenizer().span_tokenize(self.text))
+        return self._sentence_spans
+
+    @property
+    def sentences(self):
+        return [self.text[start:end] for start, end in self.sentence_spans]
+
+    @property
+    def sentence_tokens(self):
+        """
+        :return: A list of the Penn Treebank word tokens of each sentence, as used by the nltk tagger.
+        """
+        if self._sentence_tokens is None:
+            self._sentence_tokens = [nltk.tokenize.word_tokenize(sentence, preserve_line=True)
+                                     for sentence in self.sentences]
+        return self._sentence_tokens
+
+    @property
+    def words(self):
+        """
+        :return: A list of the lowercased words of the text, as tokenized for the sentiment model.
+        """
+        if self._words is None:
+            self._words = [word.lower() for word in WORD_PATTERN.findall(self.text)]
+        return self._words
+
+    def vector(self, vocabulary, max_id=None):
+        """
+        :param vocabulary: The Vocabulary of the sentiment model.
+        :param max_id: See Vocabulary.encode.
+        :return: The ids of the words, as returned by Vocabulary.encode, kept for each vocabulary version and limit.
+        """
+        key = (vocabulary.version, vocabulary.max_id, max_id)
+        vector = self._vectors.get(key)
+        if vector is None:
+            vector = self._vectors[key] = vocabulary.encode(self.words, max_id, lowercase=False)
+        return vector
+
+
+def as_document(comment):
+    """
+    :param comment: A string comment or a Document.
+    :return: The comment as a Document.
+    """
+    return comment if isinstance(comment, Document) else Document(comment)
+
+
+def text_of(comment):
+    """
+    :param comment: A string comment or a Document.
+    :return: The text of the comment.
+    """
+    return comment.text if isinstance(comment, Document) else comment
@@ -0,0 +1,172 @@
+# Persistent storage for the dictionary of entities which have already been resolved to a political party.
+
+from collections import OrderedDict
+
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+
+class EntityStore(object):
+    """
+    A dictionary-like mapping of lowercased entity names to (page title, party) tuples, backed by an indexed SQLite
+    table. Nothing is read up front; each lookup is a primary key query, and the max_loaded most recently used entries
+    are remembered. Writes are buffered and committed in batches, each batch in a single transaction, so an
+    interrupted process can't corrupt the store.
+    """
+
+    def __init__(self, path, *, flush_every=50, max_loaded=10000):
+        """
+        :param path: Path of the SQLite file, which may be shared by several processes.
+        :param flush_every: The number of buffered entries which are committed together.
+        :param max_loaded: The number of entries remembered in memory.
+        """
+        self.path = path
+        self.flush_every = flush_every
+        self.max_loaded = max_loaded
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # The web app, job and batch workers and entity recognition processes may all write to the store. With WAL,
+        # readers don't block the writer, and writers wait their turn rather than failing with "database is locked".
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS entities '
+                         '(name TEXT PRIMARY KEY, title TEXT, party TEXT, resolved_at REAL)')
+        self._db.commit()
+        self._lock = threading.RLock()
+        self._loaded = OrderedDict()
+        self._pending = {}
+        atexit.register(self.close)
+
+    def __contains__(self, name):
+        return self._fetch(name) is not None
+
+    def __getitem__(self, name):
+        row = self._fetch(name)
+        if row is None:
+            raise KeyError(name)
+        return row[:2]
+
+    def get(self, name, default=None):
+        row = self._fetch(name)
+        return default if row is None else row[:2]
+
+    def __setitem__(self, name, value):
+        self.put(name, value)
+
+    def __len__(self):
+        self.flush()
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM entities').fetchone()[0]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return [name for name, _ in self.items()]
+
+    def items(self):
+        """
+        :return: A list of every (name, (title, party)) pair in the store.
+        """
+        self.flush()
+        with self._lock:
+            return [(name, (title, party)) for name, title, party in
+                    self._db.execute('SELECT name, title, party FROM entities ORDER BY name')]
+
+    def resolved_at(self, name):
+        """
+        :param name: A lowercased entity name.
+        :return: The unix time at which the entity was stored, or None if it isn't in the store.
+        """
+        row = self._fetch(name)
+        return None if row is None else row[2]
+
+    def put(self, name, value, resolved_at=None):
+        """
+        :action: Buffers an entry, committing the buffer once it holds flush_every entries.
+        :param name: A lowercased entity name.
+        :param value: A tuple of the entity's page title and party.
+        :param resolved_at: The unix time the entry was resolved, by default now.
+        :return: None
+        """
+        title, party = value
+        row = (title, party, time.time() if resolved_at is None else resolved_at)
+        with self._lock:
+            self._remember(name, row)
+            self._pending[name] = row
+            if len(self._pending) >= self.flush_every:
+                self.flush()
+
+    def update(self, entries):
+        """
+        :action: Buffers every (title, party) entry of a dictionary keyed on entity name, then commits them.
+        :return: None
+        """
+        with self._lock:
+            for name, value in dict(entries).items():
+                self.put(name, value)
+            self.flush()
+
+    def delete(self, name):
+        """
+        :action: Removes an entity from the store, if present.
+        :return: None
+        """
+        with self._lock:
+            self.flush()
+            self._loaded.pop(name, None)
+            with self._db:
+                self._db.execute('DELETE FROM entities WHERE name = ?', (name,))
+
+    def flush(self):
+        """
+        :action: Commits every buffered entry in a single transaction.
+        :return: None
+        """
+        with self._lock:
+            if not self._pending or self._db is None:
+                return
+            with self._db:
+                self._db.executemany('INSERT OR REPLACE INTO entities (name, title, party, resolved_at) '
+                                     'VALUES (?, ?, ?, ?)',
+                                     [(name,) + row for name, row in self._pending.items()])
+            self._pending.clear()
+
+    def close(self):
+        """
+        :action: Commits any buffered entries and closes the database.
+        :return: None
+        """
+        with self._lock:
+            if self._db is None:
+                return
+            self.flush()
+            self._db.close()
+            self._db = None
+
+    def _fetch(self, name):
+        with self._lock:
+            # Buffered entries are found even once they've been forgotten, as they aren't in the table yet.
+            row = self._pending.get(name)
+            if row is not None:
+                return row
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                return self._loaded[name]
+            row = self._db.execute('SELECT title, party, resolved_at FROM entities WHERE name = ?',
+                                   (name,)).fetchone()
+            if row is not None:
+                self._remember(name, row)
+            return row
+
+    def _remember(self, name, row):
+        self._loaded[name] = row
+        self._loaded.move_to_end(name)
+        if len(self._loaded) > self.max_loaded:
+            self._loaded.popitem(last=False)
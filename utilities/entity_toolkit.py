@@ -1,96 +1,345 @@
 # Collection of the frequently called functions we'll be using for entity linking
 
-from wikidata.client import Client
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from nltk.corpus import stopwords
+from nltk.tag.perceptron import PerceptronTagger
+from utilities.document import as_document, text_of
+from utilities.entity_store import EntityStore
+from utilities.gazetteer import Gazetteer
+from utilities.metrics import metrics
+from utilities.party_index import PartyIndex
+from utilities.wikidata_api import WikidataResolver
 
 import nltk.tokenize
 import os
-import pywikibot
+import threading
+import time
 import wikipedia
 import ujson
 
 # Load/generate requisite nltk files
-tokenizer = nltk.data.load('tokenizers/punkt/english.pickle')
 stop_words = set(stopwords.words('english'))
 
+# The tagger and chunker used by extract_entities, loaded on first use in each process. The chunker is the one
+# nltk.ne_chunk uses when not in binary mode.
+_ner_models = None
+_NE_CHUNKER = 'chunkers/maxent_ne_chunker/english_ace_multiclass.pickle'
+
+# Marks entities missing from the dictionary, as None is a valid dictionary result.
+_MISSING = object()
+
+# Identifies the entity recognition pipeline in cache keys, so that results from other nltk models aren't reused.
+NER_VERSION = 'nltk-ne_chunk-' + nltk.__version__
+
+# Modes of identify_entities: only the gazetteer of names already in the dictionary, the gazetteer followed by the
+# nltk pipeline for the sentences in which it found nothing, or only the nltk pipeline.
+GAZETTEER, HYBRID, NER = 'gazetteer', 'hybrid', 'ner'
+
+def ner_models():
+    """
+    :return: The nltk part of speech tagger and named entity chunker, loaded once per process.
+    """
+    global _ner_models
+    if _ner_models is None:
+        _ner_models = (PerceptronTagger(), nltk.data.load(_NE_CHUNKER))
+    return _ner_models
+
+
+def extract_entities(comment):
+    """
+    :param comment: A string comment or a Document, whose word tokens are reused if already computed.
+    :return: A list of tuples of each entity's name and type, found by running the nltk chunker over the comment.
+    """
+    tagger, chunker = ner_models()
+    entities = []
+    for tokens in as_document(comment).sentence_tokens:
+        pending = None
+        tagged_words = tagger.tag(tokens)
+        for i, chunk in enumerate(chunker.parse(tagged_words)):
+            if hasattr(chunk, 'label'):
+                """
+                Occasionally, names such as Angela Merkel are interpreted by the parser as two named entities,
+                Angela and Merkel. To resolve this issue, we hold the most recent entity before adding it to the 
+                returned list and check to see if the following entity is the next word, in which case we join the
+                two. 
+                """
+                if pending and pending[2] == i-1:
+                    pending[0] += ' ' + ' '.join([c[0] for c in chunk])
+                else:
+                    if pending:
+                        entities.append(tuple(pending[:2]))
+                    pending = [' '.join(c[0] for c in chunk), chunk.label(), i]
+        if pending:
+            entities.append(tuple(pending[:2]))
+    return entities
+
+
+class WikipediaBackend(object):
+    """
+    The network calls made while resolving entities, kept together so that a local stand-in can be passed to
+    EntityLinker in their place.
+    """
+
+    def __init__(self, resolver=None):
+        """
+        :param resolver: The WikidataResolver parties are looked up with, by default one on the public API.
+        """
+        self.resolver = resolver if resolver is not None else WikidataResolver()
+
+    @staticmethod
+    def search(query):
+        """
+        :param query: A string search query.
+        :return: A list of the titles of matching Wikipedia pages.
+        """
+        return wikipedia.search(query)
+
+    def page_title_to_political_party(self, title):
+        """
+        :param title: A string page title.
+        :return: A string representing the political party or affiliation of the entity described in the wikipage, if
+                available. Otherwise, None.
+        """
+        return self.resolver.party_of_title(title)
+
+    def parties_of_titles(self, titles):
+        """
+        :param titles: A list of string page titles.
+        :return: A dictionary mapping each title to its result of page_title_to_political_party, found in a couple of
+                 batched requests rather than several per title.
+        """
+        return self.resolver.parties_of_titles(titles)
+
+
 class EntityLinker(object):
-    def __init__(self, *, path='saved_data/entity_files/dict.json'):
+    def __init__(self, *, path='saved_data/entity_files/dict.json', store_path=None, cache=None, backend=None,
+                 negative_ttl=7*24*60*60, party_index_path=None):
+        """
+        :param path: Path of the json dictionary of resolved entities, used for importing and exporting them.
+        :param store_path: Path of the SQLite store the dictionary is kept in, by default alongside the json file.
+        :param party_index_path: Path of a PartyIndex built from a Wikidata dump, by default parties.idx alongside the
+                                 json file. People in the index are resolved from it rather than looked up online. It
+                                 is not used if the file doesn't exist.
+        :param cache: An optional ResultCache for the entities found in each comment.
+        :param backend: The source of Wikipedia searches and party lookups, by default WikipediaBackend.
+        :param negative_ttl: Seconds after which an entity found to have no political party is looked up again. If
+                             None, such entities are remembered forever.
+        """
         self.path = path
+        self.cache = cache
+        self.backend = backend if backend is not None else WikipediaBackend()
+        self.negative_ttl = negative_ttl
+
+        # Lookups currently in progress, keyed on lowercased entity name, so that concurrent requests share one.
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+
+        # Worker processes for identify_entities_batch, started on first use.
+        self._pool = None
+        self._pool_workers = None
+
+        # Matcher over the political figures in the dictionary, built the first time it's needed.
+        self._gazetteer = None
+        self._gazetteer_lock = threading.Lock()
 
-        # If file exists
-        if os.path.isfile(path):
-            # Load json file into dictionary
+        if party_index_path is None:
+            party_index_path = os.path.join(os.path.dirname(path), 'parties.idx')
+        self.party_index = PartyIndex(party_index_path) if os.path.isfile(party_index_path) else None
+
+        if store_path is None:
+            store_path = os.path.splitext(path)[0] + '.db'
+        new_store = not os.path.isfile(store_path)
+        self.ent_dict = EntityStore(store_path)
+
+        # A new store is seeded from the json dictionary, if there is one.
+        if new_store and os.path.isfile(path):
             self.load_dictionary()
-        else:
-            self.ent_dict = {}
-            # Save dictionary to json file
-            self.save_dictionary()
 
     def load_dictionary(self):
         """
-        :action: Saves dictionary to json file
+        :action: Imports the json file into the entity store
         :return: None
         """
-        self.ent_dict = dict(ujson.load(open(self.path)))
+        with open(self.path) as infile:
+            self.ent_dict.update(ujson.load(infile))
 
     def save_dictionary(self):
         """
-        :action: Loads json file into dictionary
+        :action: Exports the entity store to the json file, replacing it atomically
         :return: None
         """
-        with open(self.path, 'w') as outfile:
-            ujson.dump(self.ent_dict, outfile)
+        with metrics.span('entities.save_dictionary'):
+            self.ent_dict.flush()
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w') as outfile:
+                ujson.dump(dict(self.ent_dict.items()), outfile)
+            os.replace(temp_path, self.path)
 
-    @staticmethod
-    def identify_entities(comment):
-        entities = []
-        for sentence in nltk.sent_tokenize(comment):
-            pending = None
-            tagged_words = nltk.pos_tag(nltk.word_tokenize(sentence))
-            for i, chunk in enumerate(nltk.ne_chunk(tagged_words)):
-                if hasattr(chunk, 'label'):
-                    """
-                    Occasionally, names such as Angela Merkel are interpreted by the parser as two named entities,
-                    Angela and Merkel. To resolve this issue, we hold the most recent entity before adding it to the 
-                    returned list and check to see if the following entity is the next word, in which case we join the
-                    two. 
-                    """
-                    if pending and pending[2] == i-1:
-                        pending[0] += ' ' + ' '.join([c[0] for c in chunk])
-                    else:
-                        if pending:
-                            entities.append(tuple(pending[:2]))
-                        pending = [' '.join(c[0] for c in chunk), chunk.label(), i]
-            if pending:
-                entities.append(tuple(pending[:2]))
-        return entities
+    def identify_entities(self, comment, mode=NER):
+        """
+        :param comment: A string comment, or a Document shared with the sentiment classifier.
+        :param mode: GAZETTEER, HYBRID or NER, see the definitions of these modes above.
+        :return: A list of tuples of each entity's name and type, such as ('Barack Obama', 'PERSON'). Results of the
+                 nltk pipeline are taken from the cache if one was given and the same text has been seen before.
+        """
+        if mode == GAZETTEER:
+            return self.known_entities().entities(text_of(comment))
+        if mode == HYBRID:
+            return self._identify_entities_hybrid([comment], workers=1)[0]
+
+        if self.cache is None:
+            return self.extract_entities(comment)
+
+        key = self.cache.make_key('entities', NER_VERSION, text_of(comment))
+        entities = self.cache.get(key)
+        if entities is None:
+            entities = self.extract_entities(comment)
+            self.cache.put(key, entities)
+        return list(entities)
 
     @staticmethod
-    def page_title_to_political_party(title):
+    def extract_entities(comment):
         """
-        :param title: A string page title.
-        :return: A string representing the political party or affiliation of the entity described in the wikipage, if
-                available. Otherwise, None.
+        :param comment: A string comment or a Document.
+        :return: A list of tuples of each entity's name and type, found by running the nltk chunker over the comment.
         """
-        site = pywikibot.Site("en", "wikipedia")
-        page = pywikibot.Page(site, title)
-        page = pywikibot.ItemPage.fromPage(page).get()
+        return extract_entities(comment)
 
-        try:
-            party_page = page['claims']['P102'][0].getTarget().get()
-        except (KeyError, pywikibot.NoPage):
-            # No political party listed for this figure, so return None.
-            return None
+    def identify_entities_batch(self, comments, workers=None, mode=NER):
+        """
+        Identifies the entities of many comments, such as every comment of a submission. Comments not already in the
+        cache are spread over a pool of worker processes, each of which loads the nltk models once.
+        :param comments: A list of string comments or Documents.
+        :param workers: The number of worker processes, by default one per CPU. With one worker, or only a single
+                        comment to process, the work is done in this process instead.
+        :param mode: See identify_entities.
+        :return: A list with the entities of each comment, as returned by identify_entities, in the same order.
+        """
+        if mode == GAZETTEER:
+            gazetteer = self.known_entities()
+            return [gazetteer.entities(text_of(comment)) for comment in comments]
+        if mode == HYBRID:
+            return self._identify_entities_hybrid(comments, workers)
 
-        # The English labels are usually a list, but sometimes appear as a string.
-        english_labels = party_page['labels']['en']
-        if isinstance(english_labels, list):
-            return english_labels[0]
-        elif isinstance(english_labels, str):
-            return english_labels
+        results = [None] * len(comments)
+        if self.cache is not None:
+            keys = [self.cache.make_key('entities', NER_VERSION, text_of(comment)) for comment in comments]
+            results = [self.cache.get(key) for key in keys]
+
+        missing = [i for i, entities in enumerate(results) if entities is None]
+        if not missing:
+            return [list(entities) for entities in results]
+
+        workers = workers or os.cpu_count() or 1
+        texts = [comments[i] for i in missing]
+        if workers == 1 or len(texts) == 1:
+            computed = [extract_entities(text) for text in texts]
         else:
-            return None
+            """
+            Comments are handed out in chunks of a few at a time. For the ~100 medium-length comments of a submission,
+            four chunks per worker keeps the pickling overhead low while still evening out the workers' load when 
+            some comments are far longer than others.
+            """
+            chunksize = max(1, -(-len(texts) // (workers * 4)))
+            computed = list(self._ner_pool(workers).map(extract_entities, texts, chunksize=chunksize))
 
+        for i, entities in zip(missing, computed):
+            results[i] = entities
+            if self.cache is not None:
+                self.cache.put(keys[i], entities)
+        return [list(entities) for entities in results]
+
+    def _identify_entities_hybrid(self, comments, workers):
+        """
+        Scans each comment once with the gazetteer, and runs the sentences without any known names through the nltk
+        pipeline. Comments with no known names at all are passed to it whole.
+        """
+        gazetteer = self.known_entities()
+        parts = []
+        residue = []
+        for comment in comments:
+            document = as_document(comment)
+            text = document.text
+            matches = gazetteer.find(text)
+            if not matches:
+                parts.append([len(residue)])
+                residue.append(document)
+                continue
+
+            comment_parts = []
+            for start, end in document.sentence_spans:
+                found = [(text[a:b], 'PERSON') for a, b in matches if start <= a < end]
+                if found:
+                    comment_parts.append(found)
+                else:
+                    comment_parts.append(len(residue))
+                    residue.append(text[start:end])
+            parts.append(comment_parts)
+
+        residue_entities = self.identify_entities_batch(residue, workers) if residue else []
+        return [[entity for part in comment_parts
+                 for entity in (residue_entities[part] if isinstance(part, int) else part)]
+                for comment_parts in parts]
+
+    def known_entities(self):
+        """
+        :return: The Gazetteer of every name in the dictionary with a political party, built on first use and kept up
+                 to date as new political figures are found.
+        """
+        with self._gazetteer_lock:
+            if self._gazetteer is None:
+                self._gazetteer = Gazetteer(name for name, (title, party) in self.ent_dict.items()
+                                            if 'None' not in party)
+            return self._gazetteer
+
+    def warm_up(self, workers=None):
+        """
+        :action: Loads the nltk models in this process, and starts the entity recognition workers, each of which
+                 loads its own as it starts, before the first request needs them.
+        :param workers: See identify_entities_batch.
+        :return: None
+        """
+        text = "Barack Obama is warming up the models before the first request."
+        extract_entities(text)
+        workers = workers or os.cpu_count() or 1
+        if workers > 1:
+            # The pool starts its workers for these tasks. The models are loaded by the pool's initializer, so every
+            # worker has loaded them before running any task, whichever workers run these.
+            pool = self._ner_pool(workers)
+            for future in [pool.submit(extract_entities, text) for _ in range(workers)]:
+                future.result()
+
+    def _ner_pool(self, workers):
+        """
+        :return: A process pool of the given size, kept between calls, whose workers each load the models once as they
+                 start.
+        """
+        if self._pool is None or self._pool_workers != workers:
+            if self._pool is not None:
+                self._pool.shutdown()
+            self._pool = ProcessPoolExecutor(max_workers=workers, initializer=ner_models)
+            self._pool_workers = workers
+        return self._pool
+
+    def close(self):
+        """
+        :action: Shuts down the entity recognition workers and commits the entity store.
+        :return: None
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self.party_index is not None:
+            self.party_index.close()
+        self.ent_dict.close()
+
+    def page_title_to_political_party(self, title):
+        """
+        :param title: A string page title.
+        :return: A string representing the political party or affiliation of the entity described in the wikipage, if
+                available. Otherwise, None.
+        """
+        return self.backend.page_title_to_political_party(title)
 
     def entity_to_political_party(self, entity, building_dict=True, lookup_enabled=True, dict_allowed=True):
         """
@@ -112,17 +361,20 @@ class EntityLinker(object):
         entity_name, ent_type = entity
 
         # If already in dictionary, return dict entry instead of looking on Wikipedia
-        if dict_allowed and entity_name.lower() in self.ent_dict:
-            try:
-                if "None" in self.ent_dict[entity_name.lower()][1]:
-                    return None
-                else:
-                    return tuple(self.ent_dict[entity_name.lower()])
-            except TypeError:
-                return None
-        elif lookup_enabled:
-            pages = wikipedia.search(entity_name)
+        known = self._dictionary_entry(entity_name.lower()) if dict_allowed else _MISSING
+        if known is not _MISSING and known is not None:
+            return known
+
+        # The offline index is consulted whether or not lookups are enabled, as it never touches the network, and
+        # may know people whose earlier lookups found nothing.
+        if ent_type == 'PERSON':
+            indexed = self._index_entry(entity_name)
+            if indexed is not None:
+                return indexed
+        if known is not _MISSING:
+            return known
 
+        if lookup_enabled:
             """
             In the present incarnation of this project, we are focused on the political parties of
             only individuals, so other type of entities can be removed. Of course, the mention of
@@ -130,34 +382,152 @@ class EntityLinker(object):
             examined at a later point. 
             """
             if ent_type == 'PERSON':
+                return self._look_up_once(entity_name, building_dict)
+        return None
 
-                """
-                It is very rare for the subject of a political discussion to not be in the first five results
-                for their name on Wikipedia, in fact in the testing done several months ago that was never the 
-                case. To save on execution time, we thus limit our exploration to the first five results with
-                some semblance to the original query.
-                """
-                # Occasionally, stop-words such as 'the' are in entities, so these are removed.
-                entity_name_components = [part for part in entity_name.split(' ')]
-
-                page_titles = []
-                for title in pages[:20]:
-                    if len(page_titles) == 5:
-                        break
-                    if any(part_of_name in title for part_of_name in entity_name_components):
-                        page_titles.append(title)
-
-                for title in page_titles:
-                    found_party = self.page_title_to_political_party(title)
-                    if found_party:
-                        if building_dict:
-                            self.ent_dict[entity_name.lower()] = (title, found_party)
-                            self.save_dictionary()
-                        return title, found_party
-                else:
-                    if building_dict:
-                        self.ent_dict[entity_name.lower()] = ('No political figure', 'None found')
-                        self.save_dictionary()
+    def resolve_entities(self, entities, *, workers=8, building_dict=True, lookup_enabled=True, errors=None):
+        """
+        Resolves many entities at once, such as every entity found in a submission. Entities already in the
+        dictionary are answered directly, and the rest are looked up concurrently on a bounded thread pool.
+        :param entities: An iterable of (name, type) entity tuples, which may contain duplicates.
+        :param workers: The maximum number of concurrent lookups.
+        :param building_dict: See entity_to_political_party.
+        :param lookup_enabled: See entity_to_political_party.
+        :param errors: If a list, the (entity, exception) pair of each failed lookup is appended to it and the entity
+                       resolves to None. Otherwise, the first failure is raised.
+        :return: A dictionary mapping each distinct entity to the result of entity_to_political_party.
+        """
+        resolved = {}
+        pending = []
+        for entity in set(entities):
+            known = self._dictionary_entry(entity[0].lower())
+            if (known is _MISSING or known is None) and entity[1] == 'PERSON':
+                known = self._index_entry(entity[0]) or known
+            if known is not _MISSING:
+                resolved[entity] = known
+            elif lookup_enabled and entity[1] == 'PERSON':
+                pending.append(entity)
+            else:
+                resolved[entity] = None
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(workers, len(pending))) as pool:
+                futures = [(entity, pool.submit(self._look_up_once, entity[0], building_dict)) for entity in pending]
+                for entity, future in futures:
+                    try:
+                        resolved[entity] = future.result()
+                    except Exception as e:
+                        if errors is None:
+                            raise
+                        errors.append((entity, e))
+                        resolved[entity] = None
+        return resolved
+
+    def _dictionary_entry(self, name):
+        """
+        :param name: A lowercased entity name.
+        :return: The dictionary's result for the entity, or _MISSING if it must be looked up. Entities without a
+                 political party are treated as missing once they are older than negative_ttl.
+        """
+        entry = self.ent_dict.get(name)
+        if entry is None:
+            metrics.inc('entity_dict_misses')
+            return _MISSING
+        try:
+            if "None" in entry[1]:
+                resolved_at = self.ent_dict.resolved_at(name)
+                if self.negative_ttl is not None and resolved_at is not None and \
+                        time.time() - resolved_at > self.negative_ttl:
+                    metrics.inc('entity_dict_misses')
+                    return _MISSING
+                metrics.inc('entity_dict_hits')
+                return None
+            else:
+                metrics.inc('entity_dict_hits')
+                return tuple(entry)
+        except TypeError:
+            return None
+
+    def _index_entry(self, name):
+        """
+        :param name: The name of a person.
+        :return: The person's page title and party from the offline index, or None if there is no index or the name
+                 isn't in it.
+        """
+        if self.party_index is None:
+            return None
+        found = self.party_index.lookup(name)
+        metrics.inc('party_index_hits' if found is not None else 'party_index_misses')
+        return found
+
+    def _look_up_once(self, entity_name, building_dict):
+        """
+        Looks up a person, unless a lookup of the same name is already in progress, in which case its result is
+        shared rather than repeated.
+        """
+        name = entity_name.lower()
+        with self._in_flight_lock:
+            future = self._in_flight.get(name)
+            owner = future is None
+            if owner:
+                future = self._in_flight[name] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            with metrics.span('entities.lookup'):
+                result = self._look_up_person(entity_name, building_dict)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[name]
+        return result
+
+    def _look_up_person(self, entity_name, building_dict):
+        """
+        :param entity_name: The name of a person.
+        :param building_dict: See entity_to_political_party.
+        :return: A tuple of the person's page title and party, or None, found through the backend.
+        """
+        pages = self.backend.search(entity_name)
+
+        """
+        It is very rare for the subject of a political discussion to not be in the first five results
+        for their name on Wikipedia, in fact in the testing done several months ago that was never the 
+        case. To save on execution time, we thus limit our exploration to the first five results with
+        some semblance to the original query.
+        """
+        # Occasionally, stop-words such as 'the' are in entities, so these are removed.
+        entity_name_components = [part for part in entity_name.split(' ')]
+
+        page_titles = []
+        for title in pages[:20]:
+            if len(page_titles) == 5:
+                break
+            if any(part_of_name in title for part_of_name in entity_name_components):
+                page_titles.append(title)
+
+        # Backends able to look up many titles at once are asked about every candidate in one call.
+        if page_titles and hasattr(self.backend, 'parties_of_titles'):
+            parties = self.backend.parties_of_titles(page_titles)
+        else:
+            parties = None
+
+        for title in page_titles:
+            found_party = parties[title] if parties is not None else self.page_title_to_political_party(title)
+            if found_party:
+                if building_dict:
+                    self.ent_dict[entity_name.lower()] = (title, found_party)
+                    if self._gazetteer is not None:
+                        self._gazetteer.add(entity_name)
+                return title, found_party
+        else:
+            if building_dict:
+                self.ent_dict[entity_name.lower()] = ('No political figure', 'None found')
         return None
 
     @staticmethod
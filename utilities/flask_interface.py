@@ -1,29 +1,221 @@
-from collections import Counter
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from json.decoder import JSONDecodeError
-from nltk.corpus import stopwords
 from sys import stderr
 from utilities.api_keys import *
+from utilities.cache_toolkit import ResultCache
+from utilities.metrics import metrics
+from utilities.submission_state import SubmissionRefresh, SubmissionState
 from urllib.error import URLError
-from utilities.reddit_toolkit import RedditExplorer
-from utilities.sentiment_toolkit import SentimentClassifier
 
-import utilities.entity_toolkit as et
+import importlib
+import os
+import threading
+import time
 
 # Interface between flask and the core of this project.
 
 class Interface(object):
-    def __init__(self, abs_path=""):
-        self.rt = RedditExplorer(client_id=CLIENT_ID, client_secret=CLIENT_SECRET)
-        self.ent_linker = et.EntityLinker(path=abs_path+'saved_data/entity_files/dict.json')
-        self.sentiment = SentimentClassifier(load_path=abs_path + 'saved_data/trained_models/model.tfl')
-        self.stop_words = set(stopwords.words("english"))
+    def __init__(self, abs_path="", *, cache_size=20000, spill_cache=True, entity_mode='ner',
+                 sentiment_backend='tflearn', more_budget=0, state_size=1000, inherit_lean=True, scheduler=None,
+                 reddit_priority='interactive', ner_workers=None, warm_up=False):
+        """
+        The Reddit client, entity linker and sentiment classifier are each imported and built the first time they are
+        used, so constructing an Interface is cheap. Call warm_up to load everything up front instead.
+        :param abs_path: Path of the utilities directory, ending in a slash.
+        :param cache_size: The number of per-comment model results kept in memory.
+        :param spill_cache: If true, results evicted from memory are kept under saved_data/cache/.
+        :param entity_mode: The mode of EntityLinker.identify_entities used when analyzing comments.
+        :param sentiment_backend: The backend of SentimentClassifier, 'tflearn' or 'numpy'.
+        :param more_budget: The number of "load more comments" links expanded in each submission's comment tree.
+        :param state_size: The number of submissions whose comment analyses are kept under saved_data/cache/, so that
+                           analyzing one again only scores its new and changed comments. If 0, every analysis starts
+                           from scratch.
+        :param inherit_lean: If true, analyzed replies which mention no political figure are weighed by the lean of
+                             their nearest analyzed ancestor which does.
+        :param scheduler: A RedditScheduler the Reddit requests are made through, sharing its rate limit budget with
+                          every other Interface and process using it. By default, requests are made directly.
+        :param reddit_priority: The priority of the Reddit requests in the scheduler, 'interactive' or 'batch'.
+        :param ner_workers: The number of entity recognition processes, by default one per CPU. Lower it when several
+                            Interfaces run at once, as each has its own pool.
+        :param warm_up: If true, warm_up is called before returning.
+        """
+        self.abs_path = abs_path
+        self.entity_mode = entity_mode
+        self.sentiment_backend = sentiment_backend
+        self.more_budget = more_budget
+        self.inherit_lean = inherit_lean
+        self.scheduler = scheduler
+        self.reddit_priority = reddit_priority
+        self.ner_workers = ner_workers
+
+        # The same comments are analyzed repeatedly, both within one request and across searches for popular
+        # threads, so the sentiment and entity results are cached and shared between the two toolkits.
+        spill_path = abs_path + 'saved_data/cache/results.db' if spill_cache else None
+        self.cache = ResultCache(max_size=cache_size, spill_path=spill_path)
+        self.state = SubmissionState(abs_path + 'saved_data/cache/submissions.db',
+                                     max_submissions=state_size) if state_size else None
+
+        # Seconds spent importing and initializing each component, in the order they were loaded.
+        self.startup_profile = OrderedDict()
+        self._components = {}
+        self._lock = threading.RLock()
+
+        if warm_up:
+            self.warm_up()
+
+    @property
+    def rt(self):
+        return self._component('reddit', 'utilities.reddit_toolkit', self._reddit_explorer)
+
+    def _reddit_explorer(self, module):
+        explorer = module.RedditExplorer(client_id=CLIENT_ID, client_secret=CLIENT_SECRET)
+        if self.scheduler is not None:
+            explorer = self.scheduler.explorer(explorer, priority=self.reddit_priority)
+        return explorer
+
+    @rt.setter
+    def rt(self, explorer):
+        self._components['reddit'] = explorer
+
+    @property
+    def ent_linker(self):
+        return self._component('entities', 'utilities.entity_toolkit',
+                               lambda module: module.EntityLinker(
+                                   path=self.abs_path + 'saved_data/entity_files/dict.json', cache=self.cache))
+
+    @ent_linker.setter
+    def ent_linker(self, linker):
+        self._components['entities'] = linker
+
+    @property
+    def sentiment(self):
+        return self._component('sentiment', 'utilities.sentiment_toolkit',
+                               lambda module: module.SentimentClassifier(
+                                   load_path=self.abs_path + 'saved_data/trained_models/model.tfl', cache=self.cache,
+                                   backend=self.sentiment_backend))
+
+    @sentiment.setter
+    def sentiment(self, classifier):
+        self._components['sentiment'] = classifier
+
+    @property
+    def stop_words(self):
+        return self._component('stop_words', 'nltk.corpus', lambda module: set(module.stopwords.words("english")))
+
+    def _component(self, name, module_name, build):
+        """
+        :param name: The name the component is profiled under.
+        :param module_name: The module the component is built from, imported on first use.
+        :param build: A function of the imported module returning the component.
+        :return: The component, built on the first call.
+        """
+        component = self._components.get(name)
+        if component is not None:
+            return component
+
+        with self._lock:
+            if name not in self._components:
+                start = time.perf_counter()
+                module = importlib.import_module(module_name)
+                imported = time.perf_counter()
+                self._components[name] = build(module)
+                self.startup_profile[name] = {'import': imported - start, 'init': time.perf_counter() - imported}
+            return self._components[name]
+
+    def warm_up(self):
+        """
+        :action: Loads every component, and runs one comment through the entity and sentiment models so that their
+                 remaining lazily loaded parts are ready before the first request.
+        :return: The startup profile.
+        """
+        for component in ('rt', 'ent_linker', 'sentiment', 'stop_words'):
+            getattr(self, component)
+
+        start = time.perf_counter()
+        # The entity recognition workers used by requests are started, and load their models, now.
+        self.ent_linker.warm_up(self.ner_workers)
+        if self.entity_mode != 'ner':
+            self.ent_linker.known_entities()
+        self.sentiment.predict_batch(["Warming up the models before the first request."])
+        self.startup_profile['first_inference'] = {'import': 0.0, 'init': time.perf_counter() - start}
+        return self.startup_profile
 
-    def flask_packaging(self, *, url, max_number=5, num_top_com=3):
+    def startup_report(self):
+        """
+        :return: A string table of the time spent importing and initializing each component loaded so far.
+        """
+        lines = ['{:<16}{:>10}{:>10}{:>10}'.format('component', 'import', 'init', 'total')]
+        for name, timing in self.startup_profile.items():
+            lines.append('{:<16}{:>9.3f}s{:>9.3f}s{:>9.3f}s'.format(name, timing['import'], timing['init'],
+                                                                   timing['import'] + timing['init']))
+        total_import = sum(timing['import'] for timing in self.startup_profile.values())
+        total_init = sum(timing['init'] for timing in self.startup_profile.values())
+        lines.append('{:<16}{:>9.3f}s{:>9.3f}s{:>9.3f}s'.format('all', total_import, total_init,
+                                                               total_import + total_init))
+        return '\n'.join(lines)
+
+    def flask_packaging(self, *, url, max_number=5, num_top_com=3, pipelined=True):
         """
         Barring changes later in the project, this will be the sole method accessed by the Flask app.
         :param url: Article URL
+        :param max_number: The maximum number of submissions of the article to analyze.
+        :param num_top_com: The number of top comments showcased for each submission.
+        :param pipelined: See iter_packaging.
         :return: A list of dictionaries for the contents of each article.
         """
+        return list(self.iter_packaging(url=url, max_number=max_number, num_top_com=num_top_com,
+                                        pipelined=pipelined))
+
+    def iter_packaging(self, *, url, max_number=5, num_top_com=3, pipelined=True):
+        """
+        Generates the same dictionaries as flask_packaging, in the same order, each as soon as its submission has
+        been analyzed.
+        :param url: Article URL
+        :param max_number: The maximum number of submissions of the article to analyze.
+        :param num_top_com: The number of top comments showcased for each submission.
+        :param pipelined: If true, the comment trees are fetched in order on a background thread, so that each
+                          submission is analyzed while the trees of those after it are still downloading. Otherwise,
+                          each submission is fetched and analyzed in turn.
+        :return: A generator of dictionaries for the contents of each article.
+        """
+        # Process the number of discussions described above
+        with metrics.span('reddit.search'):
+            submissions = self.rt.discussions_of_url(url)[:max_number]
+
+        if not pipelined or len(submissions) < 2:
+            for submission in submissions:
+                yield self.package_submission(submission, self._fetch_comments(submission), num_top_com)
+            return
+
+        # Network fetches are the first stage, on their own thread. The Reddit session isn't thread safe, so its
+        # requests are made one at a time, in submission order. The entity recognition, linking and sentiment stages
+        # run here as each comment tree arrives.
+        fetchers = ThreadPoolExecutor(max_workers=1)
+        fetched = [fetchers.submit(self._fetch_comments, submission) for submission in submissions]
+        try:
+            for submission, comments in zip(submissions, fetched):
+                with metrics.span('reddit.fetch_wait'):
+                    comments = comments.result()
+                yield self.package_submission(submission, comments, num_top_com)
+        finally:
+            # A streaming client which disconnects closes the generator. The fetches not yet started are cancelled,
+            # and the one in progress is left to finish without being waited on.
+            for future in fetched:
+                future.cancel()
+            fetchers.shutdown(wait=False)
+
+    def _fetch_comments(self, submission):
+        with metrics.span('reddit.fetch'):
+            return self.rt.fetch_comments(submission)
+
+    def package_submission(self, submission, comments, num_top_com=3):
+        """
+        :param submission: A :class:`~.Submission` object
+        :param comments: The submission's comment forest, as returned by RedditExplorer.fetch_comments
+        :param num_top_com: The number of top comments showcased.
+        :return: A dictionary of the details and analysis of the submission, as described in flask_packaging.
+        """
 
         def markdown_to_html(markdown):
             """
@@ -35,97 +227,134 @@ class Interface(object):
             """
             pass
 
-        def heuristic_for_comment(comment_text, comment_score, found_entities, parent_party=0):
+        def lean_of_comment(found_entities, affiliations_of):
             """
-            :param comment_text: The text of a comment being analyzed
-            :param comment_score: The integer score of the comment
+            The heuristic value of a comment is its sentiment * score * lean, which is summed by the submission's
+            state. Comments with no lean of their own may take their parent's, see inherit_lean.
             :param found_entities: Political entities identified in the comment
-            :param parent_party: TODO: Implement parent party.
-                                 In later incarnations of this program, this is set to take in the party
-                                 of the parent comment (if this is a child comment) so that if there is no
-                                 strong party mention within this comment, we can assume it is referring to the
-                                 parent comment.
-            :return:
+            :param affiliations_of: A dictionary of the resolved affiliation of each entity in the submission
+            :return: The value of the most common party of the comment's entities, or 0 if none has a party.
             """
-            try:
-                affiliations = [self.ent_linker.entity_to_political_party(entity_name=entity)
-                                for entity in found_entities]
-                affiliations = [x for x in affiliations if x is not None]
-            except (ConnectionError, URLError, JSONDecodeError) as e:
-                # TODO: Diagnose these minor, occasional, and straggling errors.
-                stderr.write("ERROR: Comment heuristic: {}\n".format(e))
-                return 0
+            affiliations = [affiliations_of[entity] for entity in found_entities]
+            affiliations = [x for x in affiliations if x is not None]
 
             if affiliations:
                 party_count = Counter([affiliation[1] for affiliation in affiliations])
                 most_common_party = party_count.most_common(1)[0][0]
-                political_lean = self.ent_linker.political_party_to_value(most_common_party)
-            else:
-                return 0
+                return self.ent_linker.political_party_to_value(most_common_party)
+            return 0
 
-            sentiment_score = self.sentiment.predict(comment_text)
-            final_value = sentiment_score*comment_score*political_lean
-            return final_value
+        # Both modules import nltk or NumPy, which are only needed once there is something to analyze.
+        from utilities.comment_frame import CommentFrame
+        from utilities.document import Document
+
+        sub = self.rt.parse_submission_info(submission)
+        sub['top_comments'] = []
+        # The showcased top comments and the analyzed comments are collected in one walk of the comment tree.
+        with metrics.span('comments.extract'):
+            top_comments, key_comments = self.rt.extract_comments(comments, num_top_comments=num_top_com,
+                                                                  max_num_comments=100, more_budget=self.more_budget)
+        all_comments = [(comment.id, comment.body, comment.score) for comment in key_comments]
+        frame = CommentFrame.from_comments(key_comments)
+        metrics.inc('comments_analyzed', len(all_comments))
+
+        # In some subreddits, comment scores are hidden for the first several hours. We can't analyze
+        # these, so they aren't returned in all comments.
+        if len(all_comments) > 0:
+            # Only the comments which are new or were edited since the submission was last analyzed are scored.
+            refresh = self._refresh(submission, all_comments)
+            pending = refresh.pending_bodies
+            metrics.inc('comments_scored', len(pending))
+
+            # Each comment is tokenized once, for both the entity and the sentiment models.
+            documents = [Document(text) for text in pending + [comment.body for comment in top_comments]]
+
+            # The entities of the analyzed and showcased comments are identified together by the NER workers.
+            with metrics.span('entities.identify'):
+                entities = self.ent_linker.identify_entities_batch(documents, workers=self.ner_workers,
+                                                                   mode=self.entity_mode)
+            comment_entities = entities[:len(pending)]
+            top_entities = entities[len(pending):]
+
+            # Every entity mentioned in the submission is resolved up front, with lookups of those not already
+            # in the dictionary made concurrently.
+            lookup_errors = []
+            with metrics.span('entities.resolve'):
+                affiliations_of = self.ent_linker.resolve_entities(
+                    [entity for entities in comment_entities + top_entities for entity in entities],
+                    errors=lookup_errors)
+            metrics.inc('lookup_errors', len(lookup_errors))
+            for entity, e in lookup_errors:
+                if not isinstance(e, (ConnectionError, URLError, JSONDecodeError)):
+                    raise e
+                # TODO: Diagnose these minor, occasional, and straggling errors.
+                stderr.write("ERROR: Comment heuristic: {}\n".format(e))
+
+            # Every comment of the submission, showcased or analyzed, goes through the model in a single
+            # batched call rather than one forward pass per comment.
+            with metrics.span('sentiment.predict'):
+                sentiments = self.sentiment.predict_batch(documents)
+            top_sentiments = sentiments[len(pending):]
+            for i, comment in enumerate(top_comments):
+                comm = {
+                        'words': comment.body.split(' '),
+                        'score': comment.score,
+                        'url': comment.permalink,
+                        'sentiment': top_sentiments[i]
+                        }
+
+                entities = top_entities[i]
+
+                # We'll ignore thing that are upper-case too, partially because they're more likely to be
+                # false-positives, but also because people who type in caps aren't contributing to the conversation.
+                affiliations = [(entity, affiliations_of[(entity, ent_type)])
+                                for entity, ent_type in entities
+                                if affiliations_of[(entity, ent_type)]
+                                and entity != entity.upper()]
+
+                for entity, affiliation in affiliations:
+                    if "Republican Party" == affiliation[1]:
+                        for word in affiliation[0].lower().split(' '):
+                            sub['r_words'].add(word.lower())
+                        for word in entity.lower().split(' '):
+                            sub['r_words'].add(word.lower())
+                    if "Democratic Party" == affiliation[1]:
+                        for word in affiliation[0].lower().split(' '):
+                            sub['l_words'].add(word.lower())
+                        for word in entity.lower().split(' '):
+                            sub['l_words'].add(word.lower())
+                sub['top_comments'].append(comm)
+
+            # We limit the number of response comments for the sake of reducing computational complexity. The
+            # contributions of the comments scored now are added to those of the comments scored before. Comments
+            # with entities whose lookup failed are counted without them, and scored again in the next refresh.
+            failed = {entity for entity, _ in lookup_errors}
+            sub['r_percentage'], sub['l_percentage'] = refresh.complete(
+                [(sentiments[i], comment_entities[i], lean_of_comment(comment_entities[i], affiliations_of))
+                 for i in range(len(pending))],
+                frame, inherit_lean=self.inherit_lean,
+                unsettled=[i for i in range(len(pending)) if any(entity in failed for entity in comment_entities[i])])
+
+            total = (sub['r_percentage']+sub['l_percentage'])
+            if total != 0:
+                sub['r_percentage'] = sub['r_percentage']/total*100
+                sub['l_percentage'] = sub['l_percentage']/total*100
+
+        return sub
+
+    def _refresh(self, submission, comments):
+        """
+        :param submission: A :class:`~.Submission` object
+        :param comments: A list of (comment id, body, score) of the comments analyzed.
+        :return: A SubmissionRefresh of the comments against the submission's stored state, if there is one.
+        """
+        if self.state is None:
+            return SubmissionRefresh(comments)
+        version = '{}/{}'.format(self.sentiment.model_version, self.entity_mode)
+        return self.state.refresh(submission.id, version, comments)
 
-        # Process the number of discussions described above
-        discussions = []
-        submissions = self.rt.discussions_of_url(url)
-        for submission in submissions[:max_number]:
-            sub = self.rt.parse_submission_info(submission)
-            sub['top_comments'] = []
-            all_comments = self.rt.all_comments_to_list(submission.comments, max_num_comments=100)
-
-            # In some subreddits, comment scores are hidden for the first several hours. We can't analyze
-            # these, so they aren't returned in all comments.
-            if len(all_comments) > 0:
-                comment_entities = self.ent_linker.identify_entities(all_comments)
-
-                # Generate word-specific details for our showcased top comments.
-                for i, comment in enumerate(self.rt.top_comments(submission.comments, num_top_com)):
-                    comm = {
-                            'words': comment.body.split(' '),
-                            'score': comment.score,
-                            'url': comment.permalink,
-                            'sentiment': self.sentiment.predict(comment.body)
-                            }
-
-                    entities = comment_entities[i]
-
-                    # We'll ignore thing that are upper-case too, partially because they're more likely to be
-                    # false-positives, but also because people who type in caps aren't contributing to the conversation.
-                    affiliations = [(entity, self.ent_linker.entity_to_political_party(entity_name=entity, ent_type=ent_type))
-                                    for entity, ent_type in entities
-                                    if self.ent_linker.entity_to_political_party(entity_name=entity, ent_type=type)
-                                    and entity != entity.upper()]
-
-                    for entity, affiliation in affiliations:
-                        if "Republican Party" == affiliation[1]:
-                            for word in affiliation[0].lower().split(' '):
-                                sub['r_words'].add(word.lower())
-                            for word in entity.lower().split(' '):
-                                sub['r_words'].add(word.lower())
-                        if "Democratic Party" == affiliation[1]:
-                            for word in affiliation[0].lower().split(' '):
-                                sub['l_words'].add(word.lower())
-                            for word in entity.lower().split(' '):
-                                sub['l_words'].add(word.lower())
-                    sub['top_comments'].append(comm)
-
-                # We limit the number of response comments for the sake of reducing computational complexity.
-                for i, comm_tup in enumerate(all_comments):
-                    comment, score = comm_tup
-                    mod = heuristic_for_comment(comment, score, comment_entities[i])
-                    if mod > 0:
-                        sub['r_percentage'] += mod
-                    else:
-                        sub['l_percentage'] += abs(mod)
-
-                total = (sub['r_percentage']+sub['l_percentage'])
-                if total != 0:
-                    sub['r_percentage'] = sub['r_percentage']/total*100
-                    sub['l_percentage'] = sub['l_percentage']/total*100
-
-            discussions.append(sub)
-
-        return discussions
 
+if __name__ == '__main__':
+    # If run individually, we load every component and report how long each took.
+    interface = Interface(os.path.dirname(os.path.abspath(__file__)) + '/', warm_up=True)
+    print(interface.startup_report())
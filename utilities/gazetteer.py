@@ -0,0 +1,170 @@
+# Multi-pattern matching of already known entity names, used to skip the nltk pipeline for familiar names.
+
+from collections import deque
+
+import threading
+
+
+class _Automaton(object):
+    """
+    An Aho-Corasick automaton over a fixed set of lowercased names. It is never changed once built, so any number of
+    threads can scan with it at once.
+    """
+
+    def __init__(self, names):
+        """
+        :param names: An iterable of normalized, lowercased names.
+        """
+        self.names = tuple(names)
+        # Per state: transitions by character, the failure link, and the lengths of every name ending at the state
+        # once failure links are followed.
+        goto, fail, own = [{}], [0], [()]
+        for name in self.names:
+            state = 0
+            for char in name:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto.append({})
+                    fail.append(0)
+                    own.append(())
+                    goto[state][char] = next_state
+                state = next_state
+            own[state] = (len(name),)
+
+        # The failure links are computed breadth first, merging the name lengths of each state's fallback in.
+        lengths = list(own)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                lengths[next_state] = own[next_state] + lengths[fail[next_state]]
+                queue.append(next_state)
+        self.goto, self.fail, self.lengths = goto, fail, lengths
+
+    def __len__(self):
+        return len(self.names)
+
+    def scan(self, lowered):
+        """
+        :param lowered: A lowercased string.
+        :return: A list of the (start, end) offsets of every occurrence of a name, whole word or not.
+        """
+        goto, fail, lengths = self.goto, self.fail, self.lengths
+        matches = []
+        state = 0
+        for end, char in enumerate(lowered, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length in lengths[state]:
+                matches.append((end - length, end))
+        return matches
+
+
+class Gazetteer(object):
+    """
+    Aho-Corasick automata over lowercased entity names, which find every known name in a text in a linear scan.
+    Names can be added at any time. Rather than relinking the whole automaton for each name, new names are kept in a
+    second, small automaton, which is rebuilt by the next search after names are added. Once it holds more than a
+    merge_ratio-th of the names, both are rebuilt as one, so the cost of linking is proportional to the names added.
+    Searches scan a snapshot of the two automata, which is swapped whole, and so never see a half-built one.
+    """
+
+    def __init__(self, names=(), *, merge_ratio=8, min_recent=256):
+        """
+        :param names: The names known from the start.
+        :param merge_ratio: See above.
+        :param min_recent: The number of names the small automaton may hold regardless of merge_ratio.
+        """
+        self.merge_ratio = merge_ratio
+        self.min_recent = min_recent
+        self._names = set()
+        for name in names:
+            name = self._normalize(name)
+            if name:
+                self._names.add(name)
+        self._snapshot = (_Automaton(self._names), _Automaton(()))
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name.lower() in self._names
+
+    @staticmethod
+    def _normalize(name):
+        return ' '.join(name.lower().split())
+
+    def add(self, name):
+        """
+        :action: Adds a name, which every search started after this returns will find. Names are stored lowercased,
+                 and matched wherever they are capitalized, see find.
+        :param name: A string entity name, such as 'Barack Obama'.
+        :return: None
+        """
+        name = self._normalize(name)
+        if not name:
+            return
+        with self._lock:
+            if name in self._names:
+                return
+            self._names.add(name)
+            self._pending.append(name)
+
+    def _refresh(self):
+        """
+        :action: Builds the automata of the pending names into a new snapshot. Called with the lock held.
+        :return: None
+        """
+        main, recent = self._snapshot
+        recent_names = recent.names + tuple(self._pending)
+        if len(recent_names) > max(self.min_recent, len(main) // self.merge_ratio):
+            self._snapshot = (_Automaton(main.names + recent_names), _Automaton(()))
+        else:
+            self._snapshot = (main, _Automaton(recent_names))
+        self._pending = []
+
+    def find(self, text):
+        """
+        :param text: A string, such as the body of a comment.
+        :return: A list of (start, end) offsets of the known names in the text, which are whole words and do not
+                 overlap. Where names overlap, the leftmost and then longest is kept. As with the capitalization-driven
+                 NER, a name is only matched where each of its words starts with a capital letter, so that names such
+                 as "May" or "Bush" aren't found in ordinary words.
+        """
+        if self._pending:
+            with self._lock:
+                if self._pending:
+                    self._refresh()
+        main, recent = self._snapshot
+
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # A handful of characters change length when lowercased, which would shift every offset after them.
+            lowered = ''.join(char if len(char.lower()) != 1 else char.lower() for char in text)
+
+        matches = [(start, end) for start, end in main.scan(lowered) + recent.scan(lowered)
+                   if (start == 0 or not lowered[start-1].isalnum()) and
+                   (end == len(lowered) or not lowered[end].isalnum()) and
+                   all(word[0].isupper() for word in text[start:end].split() if word[0].isalpha())]
+        matches.sort(key=lambda match: (match[0], -match[1]))
+        spans = []
+        for start, end in matches:
+            if not spans or start >= spans[-1][1]:
+                spans.append((start, end))
+        return spans
+
+    def entities(self, text, label='PERSON'):
+        """
+        :param text: A string, such as the body of a comment.
+        :param label: The entity type given to each match.
+        :return: A list of (name, type) tuples for the known names in the text, as they are written in it.
+        """
+        return [(text[start:end], label) for start, end in self.find(text)]
@@ -0,0 +1,199 @@
+# Background analysis of article urls, so that slow analyses don't hold up the web server's request threads.
+
+from collections import OrderedDict
+from sys import stderr
+
+import queue
+import threading
+import time
+import uuid
+
+
+def serializable(value):
+    """
+    :param value: A result of Interface.flask_packaging, or part of one.
+    :return: The value with sets replaced by sorted lists, so that it can be written as json.
+    """
+    if isinstance(value, dict):
+        return {key: serializable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [serializable(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return value
+
+
+class Job(object):
+    """
+    The state of one analysis request. Status moves from 'queued' to 'running' to either 'done' or 'failed'.
+    """
+
+    def __init__(self, url, max_number=5):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.max_number = max_number
+        self.status = 'queued'
+        self.results = []
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def to_dict(self, include_results=False):
+        """
+        :param include_results: If true, the results analyzed so far are included.
+        :return: A json-serializable dictionary of the job's state. Progress is the number of submissions analyzed.
+        """
+        job = {'id': self.id,
+               'url': self.url,
+               'max_number': self.max_number,
+               'status': self.status,
+               'progress': len(self.results),
+               'error': self.error,
+               'created_at': self.created_at,
+               'started_at': self.started_at,
+               'finished_at': self.finished_at}
+        if include_results:
+            job['results'] = serializable(self.results)
+        return job
+
+
+class MemoryJobBackend(object):
+    """
+    Holds queued jobs and the state of every job in this process, keeping at most max_finished finished jobs.
+    """
+
+    def __init__(self, *, max_finished=1000):
+        self.max_finished = max_finished
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+        self._queue.put(job.id)
+
+    def take(self, timeout=None):
+        """
+        :param timeout: Seconds to wait for a job.
+        :return: The next queued job, or None if none arrived in time.
+        """
+        try:
+            job_id = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def save(self, job):
+        """
+        :action: Records a change to a job, dropping the oldest finished jobs beyond max_finished.
+        :return: None
+        """
+        with self._lock:
+            self._jobs[job.id] = job
+            if job.finished:
+                finished = [job_id for job_id, j in self._jobs.items() if j.finished]
+                for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+                    del self._jobs[job_id]
+
+    def pending(self):
+        return self._queue.qsize()
+
+
+class JobQueue(object):
+    """
+    A pool of worker threads, each holding its own Interface, which run queued jobs through iter_packaging.
+    """
+
+    def __init__(self, interface_factory, *, workers=2, backend=None, on_complete=None):
+        """
+        :param interface_factory: A function returning a new Interface, called once by each worker.
+        :param workers: The number of worker threads.
+        :param backend: Where jobs are queued and kept, by default a MemoryJobBackend.
+        :param on_complete: An optional function called with each job that finishes successfully.
+        """
+        self.interface_factory = interface_factory
+        self.workers = workers
+        self.backend = backend if backend is not None else MemoryJobBackend()
+        self.on_complete = on_complete
+        self._threads = []
+        self._stopping = threading.Event()
+
+    def start(self):
+        """
+        :action: Starts the worker threads, if they aren't already running.
+        :return: None
+        """
+        if self._threads:
+            return
+        self._stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name='analysis-worker-{}'.format(i), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """
+        :action: Stops the workers once they finish their current jobs.
+        :return: None
+        """
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, url, max_number=5):
+        """
+        :param url: Article URL
+        :param max_number: The maximum number of submissions of the article to analyze.
+        :return: The id of the queued job.
+        """
+        job = Job(url, max_number)
+        self.backend.put(job)
+        return job.id
+
+    def status(self, job_id, include_results=False):
+        """
+        :param job_id: The id returned by submit.
+        :param include_results: See Job.to_dict.
+        :return: The job's state as returned by Job.to_dict, or None for an unknown job.
+        """
+        job = self.backend.get(job_id)
+        return None if job is None else job.to_dict(include_results)
+
+    def _work(self):
+        interface = None
+        while not self._stopping.is_set():
+            job = self.backend.take(timeout=0.5)
+            if job is None:
+                continue
+
+            job.status = 'running'
+            job.started_at = time.time()
+            self.backend.save(job)
+            try:
+                # The worker's Interface is only built once it has something to do.
+                if interface is None:
+                    interface = self.interface_factory()
+                for result in interface.iter_packaging(url=job.url, max_number=job.max_number):
+                    job.results.append(result)
+                    self.backend.save(job)
+                job.status = 'done'
+            except Exception as e:
+                stderr.write("ERROR: Analysis job {}: {}\n".format(job.id, e))
+                job.status = 'failed'
+                job.error = str(e)
+            job.finished_at = time.time()
+            self.backend.save(job)
+
+            if job.status == 'done' and self.on_complete is not None:
+                self.on_complete(job)
@@ -0,0 +1,157 @@
+# Timings of each stage of an analysis, and counters of what it did, exposed in the Prometheus text format.
+
+from collections import OrderedDict
+
+import threading
+import time
+
+# Upper bounds, in seconds, of the histogram buckets of stage timings.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+class Metrics(object):
+    """
+    A registry of stage timings and counters. While disabled, spans and counters do nothing beyond checking the flag,
+    except that spans are still added to any trace open in the current thread.
+    """
+
+    def __init__(self, *, enabled=False, prefix='rps', buckets=DEFAULT_BUCKETS):
+        """
+        :param enabled: Whether timings and counts are recorded.
+        :param prefix: The prefix of every exported metric name.
+        :param buckets: See DEFAULT_BUCKETS.
+        """
+        self.enabled = enabled
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._counters = OrderedDict()
+        self._stages = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def span(self, stage):
+        """
+        :param stage: The name of a stage of the analysis, such as 'entities.identify'.
+        :return: A context manager which times its body as one run of the stage.
+        """
+        if self.enabled or getattr(self._local, 'traces', None):
+            return _Span(self, stage)
+        return _NULL_SPAN
+
+    def observe(self, stage, seconds):
+        """
+        :action: Records a run of a stage, and adds its time to the traces open in this thread.
+        :return: None
+        """
+        for trace in getattr(self._local, 'traces', ()):
+            trace[stage] = trace.get(stage, 0.0) + seconds
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = {'count': 0, 'sum': 0.0, 'buckets': [0] * len(self.buckets)}
+            histogram['count'] += 1
+            histogram['sum'] += seconds
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram['buckets'][i] += 1
+
+    def inc(self, name, value=1):
+        """
+        :param name: The name of a counter, such as 'entity_dict_hits'.
+        :param value: The amount added to it.
+        :return: None
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def trace(self, timings=None):
+        """
+        :param timings: The dictionary the trace adds to, by default a new ordered dictionary.
+        :return: A context manager yielding the dictionary, to which the seconds spent in each stage run by this thread
+                 inside the context are added, whether or not the registry is enabled.
+        """
+        return _Trace(self._local, OrderedDict() if timings is None else timings)
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def reset(self):
+        """
+        :action: Drops every recorded timing and count.
+        :return: None
+        """
+        with self._lock:
+            self._counters.clear()
+            self._stages.clear()
+
+    def render(self):
+        """
+        :return: The counters and stage timing histograms in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for name, value in self._counters.items():
+                metric = '{}_{}_total'.format(self.prefix, name)
+                lines.append('# TYPE {} counter'.format(metric))
+                lines.append('{} {}'.format(metric, value))
+
+            if self._stages:
+                metric = '{}_stage_seconds'.format(self.prefix)
+                lines.append('# TYPE {} histogram'.format(metric))
+                for stage, histogram in self._stages.items():
+                    for bound, count in zip(self.buckets, histogram['buckets']):
+                        lines.append('{}_bucket{{stage="{}",le="{}"}} {}'.format(metric, stage, bound, count))
+                    lines.append('{}_bucket{{stage="{}",le="+Inf"}} {}'.format(metric, stage, histogram['count']))
+                    lines.append('{}_sum{{stage="{}"}} {}'.format(metric, stage, histogram['sum']))
+                    lines.append('{}_count{{stage="{}"}} {}'.format(metric, stage, histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+
+class _Trace(object):
+    def __init__(self, local, timings):
+        self.local = local
+        self.timings = timings
+
+    def __enter__(self):
+        if getattr(self.local, 'traces', None) is None:
+            self.local.traces = []
+        self.local.traces.append(self.timings)
+        return self.timings
+
+    def __exit__(self, *exc):
+        self.local.traces = [trace for trace in self.local.traces if trace is not self.timings]
+        return False
+
+
+# The registry used by the toolkits. It is disabled until an application enables it.
+metrics = Metrics()
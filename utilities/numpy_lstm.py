@@ -0,0 +1,110 @@
+# Inference for the trained sentiment model in NumPy alone, so that serving doesn't need TensorFlow or tflearn.
+
+import numpy as np
+import sys
+
+# Names of the model's variables in the tflearn checkpoint, and the keys they're exported under.
+CHECKPOINT_VARIABLES = {'embedding': 'Embedding/W',
+                        'lstm_kernel': 'LSTM/LSTM/BasicLSTMCell/Linear/Matrix',
+                        'lstm_bias': 'LSTM/LSTM/BasicLSTMCell/Linear/Bias',
+                        'dense_kernel': 'FullyConnected/W',
+                        'dense_bias': 'FullyConnected/b'}
+
+
+def export_weights(checkpoint_path, npz_path):
+    """
+    :param checkpoint_path: Path of a model saved by SentimentClassifier, such as 'saved_data/trained_models/model.tfl'.
+    :param npz_path: Path to write the weights to.
+    :action: Copies the weights used for inference out of the checkpoint into a compressed .npz file.
+    :return: None
+    """
+    import tensorflow as tf
+
+    reader = tf.train.NewCheckpointReader(checkpoint_path)
+    weights = {key: reader.get_tensor(name).astype(np.float32) for key, name in CHECKPOINT_VARIABLES.items()}
+    np.savez_compressed(npz_path, **weights)
+
+
+def pad_sequences(sequences, maxlen=100, value=0):
+    """
+    :param sequences: A list of lists of word ids.
+    :param maxlen: The length of every row of the result.
+    :param value: The id used as padding.
+    :return: An int32 matrix of the sequences, truncated or padded at the end to maxlen, as tflearn's pad_sequences.
+    """
+    matrix = np.full((len(sequences), maxlen), value, dtype=np.int32)
+    for row, sequence in enumerate(sequences):
+        sequence = sequence[:maxlen]
+        matrix[row, :len(sequence)] = sequence
+    return matrix
+
+
+def _sigmoid(x):
+    return 1. / (1. + np.exp(-x))
+
+
+class NumpyLSTM(object):
+    """
+    The forward pass of the sentiment model: an embedding, a single LSTM layer of which the last output is kept, and a
+    dense softmax layer. The LSTM follows tflearn's BasicLSTMCell, with gates ordered input, candidate, forget, output
+    and a forget bias of 1.
+    """
+
+    def __init__(self, weights, *, forget_bias=1.0):
+        """
+        :param weights: A mapping of the keys of CHECKPOINT_VARIABLES to arrays.
+        :param forget_bias: Added to the forget gate, as by tflearn.
+        """
+        self.embedding = np.asarray(weights['embedding'], dtype=np.float32)
+        self.dense_kernel = np.asarray(weights['dense_kernel'], dtype=np.float32)
+        self.dense_bias = np.asarray(weights['dense_bias'], dtype=np.float32)
+        self.forget_bias = forget_bias
+
+        # The kernel is applied to the input and previous output concatenated; it's split so the input half can be
+        # applied to every time step at once.
+        kernel = np.asarray(weights['lstm_kernel'], dtype=np.float32)
+        input_dim = self.embedding.shape[1]
+        self.input_kernel = kernel[:input_dim]
+        self.recurrent_kernel = kernel[input_dim:]
+        self.lstm_bias = np.asarray(weights['lstm_bias'], dtype=np.float32)
+        self.units = self.recurrent_kernel.shape[0]
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: Path of a file written by export_weights.
+        :return: A NumpyLSTM with those weights.
+        """
+        with np.load(path) as weights:
+            return cls({key: weights[key] for key in CHECKPOINT_VARIABLES})
+
+    def predict(self, matrix):
+        """
+        :param matrix: An integer matrix of word ids, one row per text, as made by pad_sequences.
+        :return: A float32 matrix with the negative and positive probability of each row.
+        """
+        matrix = np.asarray(matrix, dtype=np.int64)
+        batch, steps = matrix.shape
+        inputs = self.embedding[matrix] @ self.input_kernel + self.lstm_bias
+
+        units = self.units
+        h = np.zeros((batch, units), dtype=np.float32)
+        c = np.zeros((batch, units), dtype=np.float32)
+        for step in range(steps):
+            z = inputs[:, step] + h @ self.recurrent_kernel
+            i, j, f, o = z[:, :units], z[:, units:2*units], z[:, 2*units:3*units], z[:, 3*units:]
+            c = c * _sigmoid(f + self.forget_bias) + _sigmoid(i) * np.tanh(j)
+            h = np.tanh(c) * _sigmoid(o)
+
+        logits = h @ self.dense_kernel + self.dense_bias
+        logits -= logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+if __name__ == '__main__':
+    # If run individually, we export the weights of the given checkpoint beside it.
+    checkpoint_path = sys.argv[1] if len(sys.argv) > 1 else 'saved_data/trained_models/model.tfl'
+    npz_path = sys.argv[2] if len(sys.argv) > 2 else checkpoint_path + '.npz'
+    export_weights(checkpoint_path, npz_path)
+    print("Exported the weights of {} to {}".format(checkpoint_path, npz_path))
@@ -0,0 +1,218 @@
+# An offline index of the political parties of people, built from a Wikidata JSON dump, which EntityLinker consults
+# before making any network request.
+
+from contextlib import ExitStack
+
+import bz2
+import gzip
+import heapq
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+
+# The index starts with a header of the magic bytes, the format version and the number of records, followed by the
+# offset of each record within the data, then the data itself: one "name\ttitle\tparty\n" line per record, sorted by
+# name.
+MAGIC = b'RPSPARTY'
+VERSION = 1
+HEADER = struct.Struct('<8sIQ')
+OFFSET = struct.Struct('<Q')
+
+HUMAN = 'Q5'
+INSTANCE_OF, PARTY_PROPERTY = 'P31', 'P102'
+
+
+def normalize_name(name):
+    """
+    :param name: A person's name or alias.
+    :return: The name lowercased, with runs of whitespace collapsed to single spaces.
+    """
+    return ' '.join(name.lower().split())
+
+
+def open_dump(path):
+    """
+    :param path: Path of a Wikidata JSON dump, optionally compressed with gzip or bzip2.
+    :return: A text file object of the dump.
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def iter_entities(path):
+    """
+    :param path: See open_dump.
+    :return: A generator of the dump's entities, parsed one line at a time. Dumps are a json array with one entity
+             on each line.
+    """
+    with open_dump(path) as infile:
+        for line in infile:
+            line = line.strip().rstrip(',')
+            if line and line not in ('[', ']'):
+                yield json.loads(line)
+
+
+def _claim_ids(entity, prop):
+    ids = []
+    for claim in entity.get('claims', {}).get(prop, []):
+        value = claim.get('mainsnak', {}).get('datavalue', {}).get('value')
+        if isinstance(value, dict) and 'id' in value:
+            ids.append(value['id'])
+    return ids
+
+
+def _english_label(entity):
+    return entity.get('labels', {}).get('en', {}).get('value')
+
+
+def _write_run(records, directory, runs):
+    records.sort()
+    path = os.path.join(directory, 'run-{}.tsv'.format(len(runs)))
+    with open(path, 'w', encoding='utf-8') as outfile:
+        outfile.writelines(records)
+    runs.append(path)
+    records.clear()
+
+
+def build_index(dump_path, index_path, *, run_size=200000, report=None):
+    """
+    Builds an index in two passes over the dump, holding at most run_size records in memory. The first pass finds
+    every human with a political party and writes their names and aliases to sorted runs on disk. The second finds
+    the English labels of their parties. The runs are then merged into the index.
+    :param dump_path: See open_dump.
+    :param index_path: Path to write the index to, which is replaced atomically.
+    :param run_size: The number of records sorted in memory at once.
+    :param report: An optional function called with a line of progress.
+    :return: The number of names in the index.
+    """
+    directory = tempfile.mkdtemp(prefix='party-index-', dir=os.path.dirname(os.path.abspath(index_path)))
+    try:
+        # Pass one. Each record is "name\tpriority\ttitle\tparty id\n"; names which are a person's label have priority
+        # over aliases shared with other people.
+        runs, records, parties, people = [], [], set(), 0
+        for entity in iter_entities(dump_path):
+            if HUMAN not in _claim_ids(entity, INSTANCE_OF):
+                continue
+            party_ids = _claim_ids(entity, PARTY_PROPERTY)
+            label = _english_label(entity)
+            if not party_ids or not label:
+                continue
+            people += 1
+            parties.add(party_ids[0])
+            title = entity.get('sitelinks', {}).get('enwiki', {}).get('title', label)
+            names = [(label, 0)] + [(alias['value'], 1) for alias in entity.get('aliases', {}).get('en', [])]
+            for name, priority in names:
+                name = normalize_name(name)
+                if name:
+                    records.append('{}\t{}\t{}\t{}\n'.format(name, priority, ' '.join(title.split()), party_ids[0]))
+            if len(records) >= run_size:
+                _write_run(records, directory, runs)
+        if records:
+            _write_run(records, directory, runs)
+        if report:
+            report("Found {} people in {} parties".format(people, len(parties)))
+
+        # Pass two.
+        party_labels = {}
+        for entity in iter_entities(dump_path):
+            if entity.get('id') in parties:
+                party_labels[entity['id']] = _english_label(entity)
+
+        # The merged runs are written as the data, with their offsets in a separate file, and then both are joined
+        # behind the header.
+        count = 0
+        data_path, offsets_path = os.path.join(directory, 'data'), os.path.join(directory, 'offsets')
+        with ExitStack() as stack:
+            sources = [stack.enter_context(open(run, encoding='utf-8')) for run in runs]
+            data = stack.enter_context(open(data_path, 'wb'))
+            offsets = stack.enter_context(open(offsets_path, 'wb'))
+            previous = None
+            for line in heapq.merge(*sources):
+                name, _, title, party_id = line.rstrip('\n').split('\t')
+                party = party_labels.get(party_id)
+                if name == previous or not party:
+                    continue
+                previous = name
+                offsets.write(OFFSET.pack(data.tell()))
+                data.write('{}\t{}\t{}\n'.format(name, title, party).encode('utf-8'))
+                count += 1
+
+        temp_path = index_path + '.tmp'
+        with open(temp_path, 'wb') as outfile:
+            outfile.write(HEADER.pack(MAGIC, VERSION, count))
+            for path in (offsets_path, data_path):
+                with open(path, 'rb') as infile:
+                    shutil.copyfileobj(infile, outfile)
+        os.replace(temp_path, index_path)
+        return count
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class PartyIndex(object):
+    """
+    A read-only, memory-mapped index written by build_index. Lookups are a binary search over the sorted names, so
+    only the pages touched by the search are read from disk.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Path of the index.
+        :raises ValueError: If the file is not an index of this version.
+        """
+        self.path = path
+        with open(path, 'rb') as infile:
+            self._map = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError("{} is not a version {} party index".format(path, VERSION))
+        self._data_start = HEADER.size + self.count * OFFSET.size
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, name):
+        return self.lookup(name) is not None
+
+    def _record(self, i):
+        start = self._data_start + OFFSET.unpack_from(self._map, HEADER.size + i * OFFSET.size)[0]
+        return start, self._map.find(b'\t', start)
+
+    def lookup(self, name):
+        """
+        :param name: The name of a person, in any case.
+        :return: A tuple of the person's page title and party, or None if the name isn't in the index.
+        """
+        key = normalize_name(name).encode('utf-8')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            start, tab = self._record(middle)
+            if self._map[start:tab] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.count:
+            return None
+        start, tab = self._record(low)
+        if self._map[start:tab] != key:
+            return None
+        title, party = self._map[tab + 1:self._map.find(b'\n', tab)].decode('utf-8').split('\t')
+        return title, party
+
+    def close(self):
+        self._map.close()
+
+
+if __name__ == '__main__':
+    # If run individually, we build the index from a dump: python party_index.py latest-all.json.bz2 parties.idx
+    names = build_index(sys.argv[1], sys.argv[2], report=print)
+    print("Wrote {} names to {}".format(names, sys.argv[2]))
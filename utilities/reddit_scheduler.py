@@ -0,0 +1,224 @@
+# Scheduling of Reddit requests: a rate limit budget shared by every process using the same file, priority for
+# interactive searches over batch work, and coalescing of identical requests made at the same time.
+
+from concurrent.futures import Future
+from utilities.cache_toolkit import normalize_url
+from utilities.metrics import metrics
+from utilities.reddit_toolkit import RedditExplorer
+
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+# Priorities of requests. Batch requests leave part of the budget to interactive ones.
+INTERACTIVE, BATCH = 'interactive', 'batch'
+
+
+class BudgetTimeout(TimeoutError):
+    """
+    Raised when a request waits longer than its timeout for the rate limit budget.
+    """
+
+
+class TokenBucket(object):
+    """
+    A token bucket kept in an SQLite file, so that every process using the file draws on one budget. Each request
+    takes a token, and tokens are refilled at rate per second up to capacity. Batch requests may only take a token
+    while more than batch_reserve of the capacity would be left, so that interactive requests aren't starved.
+    """
+
+    def __init__(self, path=None, *, rate=1.0, capacity=10, batch_reserve=0.5, name='reddit', clock=time.time,
+                 sleep=time.sleep):
+        """
+        :param path: Path of the SQLite file shared by the processes, or None for a budget private to this process.
+        :param rate: Tokens added per second.
+        :param capacity: The most tokens held, which is the largest burst of requests allowed.
+        :param batch_reserve: The fraction of the capacity batch requests may not use.
+        :param name: The name of the budget within the file.
+        :param clock: The wall clock, shared between processes.
+        :param sleep: The function waiting for tokens.
+        """
+        self.path = path
+        self.rate = rate
+        self.capacity = capacity
+        self.batch_reserve = batch_reserve
+        self.name = name
+        self.clock = clock
+        self.sleep = sleep
+
+        if path is not None:
+            directory = os.path.dirname(path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+        self._db = sqlite3.connect(path or ':memory:', check_same_thread=False, timeout=30, isolation_level=None)
+        self._db.execute('CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated_at REAL)')
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def try_acquire(self, cost=1, *, priority=INTERACTIVE):
+        """
+        :param cost: The number of tokens taken.
+        :param priority: INTERACTIVE or BATCH.
+        :return: 0 if the tokens were taken, otherwise the seconds until enough are expected to be available.
+        """
+        floor = self.capacity * self.batch_reserve if priority == BATCH else 0.0
+        with self._lock:
+            # BEGIN IMMEDIATE takes the file's write lock, so no other process reads the bucket until this commits.
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                now = self.clock()
+                row = self._db.execute('SELECT tokens, updated_at FROM buckets WHERE name = ?', (self.name,)).fetchone()
+                if row is None:
+                    tokens = float(self.capacity)
+                else:
+                    tokens = min(float(self.capacity), row[0] + max(0.0, now - row[1]) * self.rate)
+                wait = 0.0
+                # Refills are sums of floats, so a token which is due is counted even if it's short by a rounding error.
+                if tokens - cost >= floor - 1e-9:
+                    tokens -= cost
+                else:
+                    wait = (floor + cost - tokens) / self.rate
+                self._db.execute('INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)',
+                                 (self.name, tokens, now))
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+        return wait
+
+    def acquire(self, cost=1, *, priority=INTERACTIVE, timeout=None):
+        """
+        :action: Waits until the tokens can be taken, then takes them.
+        :param timeout: The most seconds to wait, by default forever.
+        :return: The seconds waited.
+        :raises BudgetTimeout: If the tokens couldn't be taken in time.
+        """
+        start = self.clock()
+        while True:
+            wait = self.try_acquire(cost, priority=priority)
+            waited = self.clock() - start
+            if not wait:
+                return waited
+            if timeout is not None and waited + wait > timeout:
+                raise BudgetTimeout("No Reddit request budget for {:.1f}s".format(waited + wait))
+            # Other processes may take the tokens first, so the wait is checked again rather than assumed.
+            self.sleep(min(wait, 1.0))
+
+    def close(self):
+        """
+        :action: Closes the database.
+        :return: None
+        """
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class SingleFlight(object):
+    """
+    Shares the result of a call among every thread asking for the same key while it's in progress.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        """
+        :param key: A hashable key identifying the call.
+        :param function: A function of no arguments, called unless a call with the same key is already in progress.
+        :return: The function's result, or that of the call in progress. Its exception, if it raised one.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            owner = future is None
+            if owner:
+                future = self._calls[key] = Future()
+        if not owner:
+            metrics.inc('reddit_requests_coalesced')
+            return future.result()
+
+        try:
+            result = function()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return result
+
+
+class RedditScheduler(object):
+    """
+    The TokenBucket and SingleFlight in front of every RedditExplorer of a process. Explorers are wrapped with
+    explorer(), and should all share one scheduler.
+    """
+
+    def __init__(self, path=None, *, rate=1.0, capacity=10, batch_reserve=0.5, timeout=60, bucket=None):
+        """
+        :param path: See TokenBucket.
+        :param rate: See TokenBucket.
+        :param capacity: See TokenBucket.
+        :param batch_reserve: See TokenBucket.
+        :param timeout: The most seconds a request waits for the budget.
+        :param bucket: A TokenBucket to use instead of creating one.
+        """
+        self.bucket = bucket if bucket is not None else TokenBucket(path, rate=rate, capacity=capacity,
+                                                                    batch_reserve=batch_reserve)
+        self.timeout = timeout
+        self.flights = SingleFlight()
+
+    def call(self, key, function, *, priority=INTERACTIVE):
+        """
+        :param key: Identifies the request, so that identical requests made at once are made only once.
+        :param function: A function of no arguments making one Reddit request.
+        :param priority: INTERACTIVE or BATCH.
+        :return: The function's result.
+        """
+        def scheduled():
+            with metrics.span('reddit.budget_wait'):
+                self.bucket.acquire(priority=priority, timeout=self.timeout)
+            metrics.inc('reddit_requests')
+            return function()
+        return self.flights.do(key, scheduled)
+
+    def explorer(self, explorer, *, priority=INTERACTIVE):
+        """
+        :param explorer: A RedditExplorer.
+        :param priority: The priority of the explorer's requests.
+        :return: A ScheduledExplorer making the explorer's requests through this scheduler.
+        """
+        return ScheduledExplorer(explorer, self, priority=priority)
+
+
+class ScheduledExplorer(RedditExplorer):
+    """
+    Makes the network calls of another RedditExplorer through a RedditScheduler. Searches are coalesced by normalized
+    url, comment trees by submission, and expansions of "load more comments" links by link.
+    """
+
+    def __init__(self, explorer, scheduler, *, priority=INTERACTIVE):
+        self.explorer = explorer
+        self.scheduler = scheduler
+        self.priority = priority
+        self.reddit = getattr(explorer, 'reddit', None)
+        # The requests made here and through the explorer share its praw session, so they share its lock too.
+        self._lock = explorer._lock
+
+    def discussions_of_url(self, url):
+        return self.scheduler.call(('discussions_of_url', normalize_url(url)),
+                                   lambda: self.explorer.discussions_of_url(url), priority=self.priority)
+
+    def fetch_comments(self, submission):
+        return self.scheduler.call(('fetch_comments', submission.id),
+                                   lambda: self.explorer.fetch_comments(submission), priority=self.priority)
+
+    def expand_more(self, more_comments):
+        return self.scheduler.call(('expand_more', id(more_comments)),
+                                   lambda: self.explorer.expand_more(more_comments), priority=self.priority)
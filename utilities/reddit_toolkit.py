@@ -1,9 +1,16 @@
+from collections import deque
+
 import praw
+import threading
 
 class RedditExplorer(object):
-
     def __init__(self, *, client_id, client_secret):
         self.reddit = praw.Reddit(user_agent="user", client_id=client_id, client_secret=client_secret)
+        # praw isn't thread safe, as a session's requestor and rate limit state are shared by its requests, so every
+        # request made through the session is serialized. Each explorer has its own session, so separate explorers,
+        # such as those of the batch and job queue workers, make their requests concurrently. Subclasses without a
+        # session of their own set _lock themselves.
+        self._lock = threading.RLock()
 
     # Reddit data
     def discussions_of_url(self, url):
@@ -11,9 +18,33 @@ class RedditExplorer(object):
         :param url: A string url pointing to a news article
         :return: A listing generator which returns submissions.
         """
-        submissions = self.reddit.subreddit('all').search('url:' + url)
-        return list(submissions)
+        with self._lock:
+            submissions = self.reddit.subreddit('all').search('url:' + url)
+            return list(submissions)
+
+
+    def fetch_comments(self, submission):
+        """
+        Downloads the comment tree of a submission, sorted by top comments. This is the network-bound part of
+        analyzing a submission, kept apart so that it can be fetched on another thread while other submissions are
+        analyzed. Requests are serialized, see _lock.
+        :param submission: A :class:`~.Submission` object
+        :return: The submission's :class:`~.CommentForest`
+        """
+        with self._lock:
+            submission.comment_sort = 'top'
+            # The tree is loaded by the first access of the attribute.
+            return submission.comments
 
+    def expand_more(self, more_comments):
+        """
+        Loads the comments behind a "load more comments" link, which costs a request. Requests are serialized, see
+        _lock.
+        :param more_comments: A :class:`~.MoreComments` object
+        :return: A list of the comments it stood for, which may include further MoreComments.
+        """
+        with self._lock:
+            return more_comments.comments()
 
     def parse_submission_info(self, submission):
         """
@@ -24,7 +55,7 @@ class RedditExplorer(object):
         sub = {}
         submission.comment_sort = 'top'
         sub['title'] = submission.title
-        sub['subreddit'] = submission.subreddit
+        sub['subreddit'] = str(submission.subreddit)
         sub['score'] = submission.score
         sub['url'] = 'https://reddit.com' + submission.permalink
         sub['comment_count'] = submission.num_comments
@@ -36,14 +67,92 @@ class RedditExplorer(object):
         sub['l_words'] = {'democrats', 'democrat', 'dems'}
         return sub
 
-    def top_comments(self, comments, num_top_comments=3):
+    def extract_comments(self, submission_comments, *, num_top_comments=3, relevance_threshold=10, min_length=100,
+                         max_num_comments=100, more_budget=0):
+        """
+        Walks the comment tree once, breadth first, collecting both the showcased top comments and the comments to
+        analyze, and stops as soon as it has enough of each. The comments to analyze are filtered in batches, with
+        CommentFrame.relevant.
+
+        :param submission_comments: A submission.comments object, a list of all top-level submissions
+        :param num_top_comments: The number of top-level comments to showcase.
+        :param relevance_threshold: The minimum absolute value of the score of an analyzed comment
+        :param min_length: The minimum length of an analyzed comment, as sentiment analysis is less precise on shorter
+                           statements.
+        :param max_num_comments: The maximum number of comments to analyze.
+        :param more_budget: The number of "load more comments" links which may be expanded, each of which costs a
+                            request to Reddit. Unexpanded links are skipped.
+        :return: A list of the first num_top_comments top-level comments, and a list of up to max_num_comments
+                 comments meeting the threshold demands, in breadth first order.
+        :rtype: (list[Comment], list[Comment])
+        """
+        # NumPy is imported on first use, as with the other columnar code.
+        from utilities.comment_frame import CommentFrame
+
         top_comments = []
-        for comment in comments:
-            if comment.author is not None and comment.author.name != 'AutoModerator':
-                top_comments.append(comment)
-            if len(top_comments) > num_top_comments:
-                break
-        return top_comments
+        key_comments = []
+        queue = deque(submission_comments)
+        top_level = len(queue)
+        seen = set()
+
+        # Top comments are only looked for until the top level is exhausted, as a thread may have fewer than wanted.
+        while queue and ((top_level > 0 and len(top_comments) < num_top_comments)
+                         or len(key_comments) < max_num_comments):
+            # The comments are walked in batches of as many as are still wanted, and each batch is filtered as a
+            # frame, so the walk still stops soon after enough comments are found.
+            batch = []
+            while queue and len(batch) < max(1, max_num_comments - len(key_comments)):
+                comment = queue.popleft()
+                top_level -= 1
+                if isinstance(comment, praw.models.reddit.more.MoreComments):
+                    if more_budget > 0 and batch:
+                        # The batch is filtered first, as the link is only worth expanding if comments are still
+                        # wanted after it.
+                        queue.appendleft(comment)
+                        top_level += 1
+                        break
+                    # Expanded comments are queued behind the top level, so they can only be analyzed comments.
+                    if more_budget > 0 and len(key_comments) < max_num_comments:
+                        more_budget -= 1
+                        queue.extend(self.expand_more(comment))
+                    continue
+                if comment.id in seen:
+                    continue
+                seen.add(comment.id)
+                queue.extend(comment.replies)
+
+                author = self._author_name(comment)
+                if author is None or author == 'AutoModerator':
+                    continue
+                if top_level >= 0 and len(top_comments) < num_top_comments:
+                    top_comments.append(comment)
+                batch.append(comment)
+
+            if batch and len(key_comments) < max_num_comments:
+                rows = CommentFrame.from_comments(batch).relevant(relevance_threshold=relevance_threshold,
+                                                                  min_length=min_length,
+                                                                  limit=max_num_comments - len(key_comments))
+                key_comments.extend(batch[row] for row in rows.tolist())
+
+        return top_comments, key_comments
+
+    @staticmethod
+    def _author_name(comment):
+        """
+        :param comment: A :class:`~.Comment` object
+        :return: The name of the comment's author, or None if the account was deleted. The name is read from the data
+                 the comment was loaded with, as accessing the attributes of a Redditor may fetch its profile.
+        """
+        author = vars(comment).get('author')
+        return None if author is None else str(author)
+
+    def top_comments(self, comments, num_top_comments=3):
+        """
+        :param comments: A submission.comments object
+        :param num_top_comments: The number of comments returned.
+        :return: The first num_top_comments top-level comments, excluding those of AutoModerator and deleted accounts.
+        """
+        return self.extract_comments(comments, num_top_comments=num_top_comments, max_num_comments=0)[0]
 
     def all_comments_to_list(self, submission_comments, *, relevance_threshold=10, min_length=100,
                              max_num_comments=100):
@@ -55,15 +164,8 @@ class RedditExplorer(object):
         :param min_length: The minimum length of a comment, as sentiment analysis is less precise on shorter statements.
         :return: A list of all comments and their scores meeting the threshold remands.
         :rtype: list[(str, int)]
-
-        # TODO: This does not retrieve all comments on very large threads. Does this matter?
-
         """
-        all_comments = submission_comments.list()
-        key_comments = [(comment.body, comment.score) for comment in all_comments if
-                        not isinstance(comment, praw.models.reddit.more.MoreComments)
-                        and comment.author is not None
-                        and comment.author.name != 'AutoModerator'
-                        and abs(comment.score) > relevance_threshold
-                        and len(comment.body) > min_length][:max_num_comments]
-        return key_comments
+        _, key_comments = self.extract_comments(submission_comments, num_top_comments=0,
+                                                relevance_threshold=relevance_threshold, min_length=min_length,
+                                                max_num_comments=max_num_comments)
+        return [(comment.body, comment.score) for comment in key_comments]
@@ -0,0 +1,303 @@
+# Recording of the Reddit and Wikipedia traffic of an analysis, and its replay without a network, so that the pipeline
+# can be benchmarked and regression tested reproducibly.
+
+from praw.models.reddit.more import MoreComments
+from utilities.reddit_toolkit import RedditExplorer
+
+import json
+import os
+import sys
+import threading
+import time
+
+
+class SnapshotMissing(LookupError):
+    """
+    Raised when a replayed call was not recorded.
+    """
+
+
+class SnapshotStore(object):
+    """
+    Recorded responses, kept in a JSONL file with one call per line. Recording appends to the file; the responses are
+    otherwise held in memory.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Path of the snapshot file, which is created if it doesn't exist.
+        """
+        self.path = path
+        self._responses = {}
+        self._lock = threading.Lock()
+        if os.path.isfile(path):
+            with open(path, encoding='utf-8') as infile:
+                for line in infile:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._responses[self.make_key(record['service'], record['call'], record['args'])] = \
+                            record['response']
+
+    def __len__(self):
+        return len(self._responses)
+
+    @staticmethod
+    def make_key(service, call, args):
+        return json.dumps([service, call, args], sort_keys=True)
+
+    def record(self, service, call, args, response):
+        """
+        :param service: 'reddit' or 'wikipedia'.
+        :param call: The name of the method called.
+        :param args: A json-serializable list of its arguments.
+        :param response: The json-serializable response.
+        :return: None
+        """
+        line = json.dumps({'service': service, 'call': call, 'args': args, 'response': response}, sort_keys=True)
+        with self._lock:
+            self._responses[self.make_key(service, call, args)] = response
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(self.path, 'a', encoding='utf-8') as outfile:
+                outfile.write(line + '\n')
+
+    def lookup(self, service, call, args):
+        """
+        :return: The response recorded for the call.
+        :raises SnapshotMissing: If the call was not recorded.
+        """
+        key = self.make_key(service, call, args)
+        with self._lock:
+            if key not in self._responses:
+                raise SnapshotMissing("No recorded response for {} {}{}".format(service, call, tuple(args)))
+            return self._responses[key]
+
+
+# Reddit objects are stored as dictionaries of the attributes the pipeline reads, and replayed as plain objects.
+
+SUBMISSION_FIELDS = ('id', 'title', 'subreddit', 'score', 'permalink', 'num_comments', 'url')
+COMMENT_FIELDS = ('id', 'body', 'score', 'permalink', 'parent_id')
+
+
+def submission_to_dict(submission):
+    return {field: str(getattr(submission, field)) if field == 'subreddit' else getattr(submission, field)
+            for field in SUBMISSION_FIELDS}
+
+
+def forest_to_list(comments):
+    """
+    :param comments: A CommentForest, or a list of comments.
+    :return: A json-serializable list of the comments and their replies. Unexpanded MoreComments are kept as
+             placeholders, which replay as expanding to nothing.
+    """
+    serialized = []
+    for comment in comments:
+        if isinstance(comment, MoreComments):
+            serialized.append({'more': getattr(comment, 'count', 0)})
+            continue
+        entry = {field: getattr(comment, field) for field in COMMENT_FIELDS}
+        author = vars(comment).get('author')
+        entry['author'] = None if author is None else str(author)
+        entry['replies'] = forest_to_list(comment.replies)
+        serialized.append(entry)
+    return serialized
+
+
+class ReplaySubmission(object):
+    def __init__(self, fields):
+        self.__dict__.update(fields)
+
+
+class ReplayComment(object):
+    def __init__(self, fields):
+        self.__dict__.update({key: value for key, value in fields.items() if key != 'replies'})
+        self.replies = ReplayForest(fields['replies'])
+
+
+class ReplayMoreComments(MoreComments):
+    def __init__(self, fields):
+        self.count = fields['more']
+
+    def comments(self, update=True):
+        return []
+
+
+class ReplayForest(list):
+    """
+    A recorded comment forest, which can be used in place of a CommentForest.
+    """
+
+    def __init__(self, entries):
+        super().__init__(ReplayMoreComments(entry) if 'more' in entry else ReplayComment(entry) for entry in entries)
+
+    def list(self):
+        """
+        :return: Every comment in the forest, breadth first, as CommentForest.list.
+        """
+        comments = []
+        queue = list(self)
+        while queue:
+            comment = queue.pop(0)
+            comments.append(comment)
+            if not isinstance(comment, MoreComments):
+                queue.extend(comment.replies)
+        return comments
+
+
+class RecordingExplorer(RedditExplorer):
+    """
+    Makes the network calls of another RedditExplorer, records their responses, and returns them as replay objects, so
+    that a recorded run behaves exactly as its replay will.
+    """
+
+    def __init__(self, explorer, store):
+        self.explorer = explorer
+        self.store = store
+        # The explorer serializes its own requests. The forests returned here are replay objects, which expand
+        # without any request.
+        self._lock = threading.RLock()
+        # The submissions found by discussions_of_url, by id, whose comments are fetched through the explorer.
+        self._submissions = {}
+
+    def discussions_of_url(self, url):
+        found = self.explorer.discussions_of_url(url)
+        self._submissions.update((submission.id, submission) for submission in found)
+        submissions = [submission_to_dict(submission) for submission in found]
+        self.store.record('reddit', 'discussions_of_url', [url], submissions)
+        return [ReplaySubmission(submission) for submission in submissions]
+
+    def fetch_comments(self, submission):
+        original = self._submissions.get(submission.id)
+        if original is None:
+            original = self.explorer.reddit.submission(id=submission.id)
+        comments = forest_to_list(self.explorer.fetch_comments(original))
+        self.store.record('reddit', 'fetch_comments', [submission.id], comments)
+        return ReplayForest(comments)
+
+
+class ReplayExplorer(RedditExplorer):
+    """
+    Serves the Reddit responses recorded in a SnapshotStore, after a simulated latency.
+    """
+
+    def __init__(self, store, *, latency=0.0):
+        """
+        :param store: A SnapshotStore.
+        :param latency: Seconds each call waits before returning.
+        """
+        self.store = store
+        self.latency = latency
+        self._lock = threading.RLock()
+
+    def discussions_of_url(self, url):
+        if self.latency:
+            time.sleep(self.latency)
+        return [ReplaySubmission(submission)
+                for submission in self.store.lookup('reddit', 'discussions_of_url', [url])]
+
+    def fetch_comments(self, submission):
+        if self.latency:
+            time.sleep(self.latency)
+        return ReplayForest(self.store.lookup('reddit', 'fetch_comments', [submission.id]))
+
+
+class RecordingBackend(object):
+    """
+    Makes the calls of an EntityLinker backend, such as WikipediaBackend, and records their responses.
+    """
+
+    def __init__(self, backend, store):
+        self.backend = backend
+        self.store = store
+
+    def search(self, query):
+        pages = list(self.backend.search(query))
+        self.store.record('wikipedia', 'search', [query], pages)
+        return pages
+
+    def page_title_to_political_party(self, title):
+        party = self.backend.page_title_to_political_party(title)
+        self.store.record('wikipedia', 'page_title_to_political_party', [title], party)
+        return party
+
+    def parties_of_titles(self, titles):
+        if not hasattr(self.backend, 'parties_of_titles'):
+            return {title: self.page_title_to_political_party(title) for title in titles}
+        parties = self.backend.parties_of_titles(titles)
+        self.store.record('wikipedia', 'parties_of_titles', [list(titles)], parties)
+        return parties
+
+
+class ReplayBackend(object):
+    """
+    Serves the Wikipedia responses recorded in a SnapshotStore, after a simulated latency, in place of an EntityLinker
+    backend.
+    """
+
+    def __init__(self, store, *, latency=0.0, strict=True):
+        """
+        :param store: A SnapshotStore.
+        :param latency: Seconds each call waits before returning.
+        :param strict: If true, calls which weren't recorded raise SnapshotMissing. Otherwise they find nothing.
+        """
+        self.store = store
+        self.latency = latency
+        self.strict = strict
+
+    def _lookup(self, call, args, default):
+        if self.latency:
+            time.sleep(self.latency)
+        try:
+            return self.store.lookup('wikipedia', call, args)
+        except SnapshotMissing:
+            if self.strict:
+                raise
+            return default
+
+    def search(self, query):
+        return self._lookup('search', [query], [])
+
+    def page_title_to_political_party(self, title):
+        return self._lookup('page_title_to_political_party', [title], None)
+
+    def parties_of_titles(self, titles):
+        # Recordings of backends without batched lookups hold each title's lookup instead.
+        try:
+            parties = self.store.lookup('wikipedia', 'parties_of_titles', [list(titles)])
+        except SnapshotMissing:
+            return {title: self.page_title_to_political_party(title) for title in titles}
+        if self.latency:
+            time.sleep(self.latency)
+        return parties
+
+
+def record(interface, store):
+    """
+    :action: Makes an Interface record its Reddit and Wikipedia traffic to the store.
+    :return: None
+    """
+    interface.rt = RecordingExplorer(interface.rt, store)
+    interface.ent_linker.backend = RecordingBackend(interface.ent_linker.backend, store)
+
+
+def replay(interface, store, *, latency=0.0, strict=True):
+    """
+    :action: Makes an Interface serve its Reddit and Wikipedia traffic from the store, without a network. As entities
+             already in the interface's dictionary are not looked up, replays should start from the dictionary the
+             recording started from.
+    :return: None
+    """
+    interface.rt = ReplayExplorer(store, latency=latency)
+    interface.ent_linker.backend = ReplayBackend(store, latency=latency, strict=strict)
+
+
+if __name__ == '__main__':
+    # If run individually, we record the analysis of an article: python replay.py <url> <snapshot.jsonl>
+    from utilities.flask_interface import Interface
+
+    interface = Interface(os.path.dirname(os.path.abspath(__file__)) + '/')
+    snapshots = SnapshotStore(sys.argv[2])
+    record(interface, snapshots)
+    results = interface.flask_packaging(url=sys.argv[1])
+    print("Recorded {} responses for {} discussions to {}".format(len(snapshots), len(results), sys.argv[2]))
@@ -1,101 +1,173 @@
-from nltk.corpus import stopwords
-from nltk.tokenize import RegexpTokenizer
-from keras.datasets import imdb
-from tflearn.data_utils import to_categorical, pad_sequences
+from utilities.document import as_document, text_of
+from utilities.metrics import metrics
+from utilities.numpy_lstm import NumpyLSTM, export_weights, pad_sequences
+from utilities.vocabulary import Vocabulary
 
-import tensorflow as tf
-import tflearn
 import os
+import utilities.training as training
 
-# Load requisite datasets.
-stop_words = set(stopwords.words('english'))
+# The inference backends a SentimentClassifier can use. TensorFlow and tflearn are only imported for tflearn.
+TFLEARN, NUMPY = 'tflearn', 'numpy'
 
 
 class SentimentClassifier(object):
-    def __init__(self, *, load_path=None, save_path='saved_data/trained_models/model.tfl'):
-        self.word_to_id = {k: v + 3 for k, v in imdb.get_word_index().items()}
-        self.word_to_id["<PAD>"] = 0
-        self.word_to_id["<START>"] = 1
-        self.word_to_id["<UNK>"] = 2
-        self.id_to_word = {v:k for k, v in self.word_to_id.items()}
+    def __init__(self, *, load_path=None, save_path='saved_data/trained_models/model.tfl', cache=None,
+                 vocabulary_path=None, backend=TFLEARN, weights_path=None, train_options=None):
+        """
+        :param load_path: Path of a saved model to load. If None, a new model is trained and saved to save_path.
+        :param save_path: Path to save a newly trained model to.
+        :param cache: An optional ResultCache, in which the probabilities for each text are kept.
+        :param vocabulary_path: Path of the vocabulary artifact, by default vocabulary.tsv beside the model. It is
+                                built from the Keras IMDB word index the model was trained with, and saved there, if
+                                it doesn't exist yet, so that later loads don't import Keras.
+        :param backend: TFLEARN to run the model in tflearn, or NUMPY to run its exported weights in NumPy.
+        :param weights_path: Path of the weights exported for the NUMPY backend, by default the model path with .npz
+                             appended. They are exported from the checkpoint if they don't exist yet.
+        :param train_options: Keyword arguments of _train_model when a new model is trained, such as training_data.
+                              Interrupted training resumes from its latest checkpoint.
+        """
+        if backend not in (TFLEARN, NUMPY):
+            raise ValueError("Unknown sentiment backend {}".format(backend))
+        self.backend = backend
+        self.cache = cache
+        model_path = save_path if load_path is None else load_path
+        if vocabulary_path is None:
+            vocabulary_path = os.path.join(os.path.dirname(model_path), 'vocabulary.tsv')
+        self.vocabulary = Vocabulary.load_or_build(vocabulary_path, max_id=10000)
+
+        if load_path is None:
+            assert('model.tfl' in save_path)
+            assert(os.path.isdir(save_path[:save_path.index('model.tfl')]))
+            self.model = self._build_network()
+            self._train_model(save_path, **(train_options or {}))
+        elif backend == TFLEARN:
+            self.model = self._build_network()
+            self.model.load(load_path)
 
-        self.tokenizer = RegexpTokenizer(r'\w+')
+        if backend == NUMPY:
+            if weights_path is None:
+                weights_path = model_path + '.npz'
+            if not os.path.isfile(weights_path):
+                export_weights(model_path, weights_path)
+            self.model = NumpyLSTM.load(weights_path)
+
+        # Cached results are only valid for the checkpoint and vocabulary which produced them.
+        if os.path.isfile(model_path + '.index'):
+            self.model_version = '{}@{}'.format(os.path.basename(model_path), os.path.getmtime(model_path + '.index'))
+        else:
+            self.model_version = os.path.basename(model_path)
+        self.model_version += '/vocabulary-v{}'.format(self.vocabulary.version)
+
+    @staticmethod
+    def _build_network():
+        """
+        :return: A tflearn DNN of the model's structure, with untrained weights.
+        """
+        import tflearn
 
-        # Create model structure
         net = tflearn.input_data([None, 100])
         net = tflearn.embedding(net, input_dim=10000, output_dim=128)
         net = tflearn.lstm(net, 128, dropout=0.8)
         net = tflearn.fully_connected(net, 2, activation='softmax')
         net = tflearn.regression(net, optimizer='adam', learning_rate=0.0001, loss='categorical_crossentropy')
-        self.model = tflearn.DNN(net, tensorboard_verbose=0)
+        return tflearn.DNN(net, tensorboard_verbose=0)
 
-        if load_path is None:
-            assert('model.tfl' in save_path)
-            assert(os.path.isdir(save_path[:save_path.index('model.tfl')]))
-            self._train_model(save_path)
-        else:
-            self.model.load(load_path)
-
-    def _train_model(self, save_path):
+    def _train_model(self, save_path, *, training_data=None, validation_data=None, **options):
         """
         :param save_path: Path to save the model to
+        :param training_data: Path prefix of a dataset built by training.build_dataset. If None, the IMDB dataset is
+                              built under saved_data/training/ and used, with its test set for validation.
+        :param validation_data: Path prefix of an optional dataset to evaluate after each epoch.
+        :param options: Keyword arguments of training.train, such as n_epoch and checkpoint_every.
         :return: None
         """
-        tf.reset_default_graph()
-        train, test = imdb.load_data(num_words=10000, index_from=3)
+        import tensorflow as tf
 
-        train_x, train_y = train
-        test_x, test_y = test
-
-        train_x = pad_sequences(train_x, maxlen=100, value=0.)
-        test_x = pad_sequences(test_x, maxlen=100, value=0.)
-
-        train_y = to_categorical(train_y, nb_classes=2)
-        test_y = to_categorical(test_y, nb_classes=2)
+        tf.reset_default_graph()
+        if training_data is None:
+            directory = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(save_path))), 'training')
+            train_set, validation_set = training.imdb_datasets(directory)
+        else:
+            train_set = training.TrainingData(training_data)
+            validation_set = None if validation_data is None else training.TrainingData(validation_data)
 
-        # Training
-        self.model.fit(train_x, train_y, n_epoch=10, validation_set=(test_x, test_y), show_metric=True, batch_size=32)
-        self.model.save(save_path)
+        training.train(self.model, save_path, train_set, validation_data=validation_set, **options)
 
     def predict(self, text, full_probs=False):
         """
-        :param text: Text to be classified.
+        :param text: Text to be classified, or a Document shared with the entity linker.
         :param full_probs: If true, returns a list containing the negative probability and positive probability, if
                            false returns -1 if probably negative, 0 if unsure, or 1 if probably positive.
         :return: List or value, see above
         """
-        words = self.tokenizer.tokenize(text)
-        vector = self.words_to_vector(words, max=10000)
-        vector = pad_sequences([vector], maxlen=100, value=0.)
-        probs = self.model.predict(vector)[0].tolist()
+        return self.predict_batch([text], full_probs=full_probs)[0]
+
+    def predict_batch(self, texts, full_probs=False, batch_size=256):
+        """
+        Classifies a list of texts, padding them into a single matrix and running one forward pass per chunk of
+        batch_size rows rather than one per text.
+        :param texts: List of texts or Documents to be classified. The words and ids of Documents are reused.
+        :param full_probs: See predict.
+        :param batch_size: The maximum number of rows passed to the model in a single call.
+        :return: A list with one result per text, in the same order, each as described in predict.
+        """
+        if not texts:
+            return []
+
+        probs = [None] * len(texts)
+        if self.cache is not None:
+            keys = [self.cache.make_key('sentiment', self.model_version, text_of(text)) for text in texts]
+            probs = [self.cache.get(key) for key in keys]
+
+        # Only the texts missing from the cache are run through the model.
+        missing = [i for i, p in enumerate(probs) if p is None]
+        if missing:
+            vectors = [as_document(texts[i]).vector(self.vocabulary, max_id=10000) for i in missing]
+            matrix = pad_sequences(vectors, maxlen=100, value=0.)
+
+            computed = []
+            with metrics.span('sentiment.inference'):
+                for start in range(0, len(matrix), batch_size):
+                    computed.extend(p.tolist() for p in self.model.predict(matrix[start:start+batch_size]))
+            metrics.inc('sentiment_texts_classified', len(missing))
+
+            for i, p in zip(missing, computed):
+                probs[i] = p
+                if self.cache is not None:
+                    self.cache.put(keys[i], p)
+        probs = [list(p) for p in probs]
 
         if full_probs:
-            # If full probs, we return a list containing two floats - the possibility the comment is positive
+            # If full probs, we return lists containing two floats - the possibility the comment is positive
             return probs
+        return [self.probs_to_value(p) for p in probs]
+
+    @staticmethod
+    def probs_to_value(probs):
+        """
+        :param probs: A list containing the negative probability and positive probability of a text.
+        :return: -1 if probably negative, 0 if unsure, or 1 if probably positive.
+        """
+        pos, neg = probs
+        if abs(pos-neg) < 0.1:
+            return 0
         else:
-            pos, neg = probs
-            if abs(pos-neg) < 0.1:
-                return 0
-            else:
-                return 2*probs.index(max(probs))-1
+            return 2*probs.index(max(probs))-1
 
     def vector_to_words(self, vector):
         """
         :param vector: Vector of numbers corresponding to words in the dictionary used in the given corpus
         :return: A string containing all the words corresponding to the numbers in the vector.
         """
-        return ' '.join(self.id_to_word[i] for i in vector)
+        return self.vocabulary.decode(vector)
 
-    def words_to_vector(self, words, max):
+    def words_to_vector(self, words, max=None):
         """
-        :param words: A string containing, presumably, multiple words.
-        :return: A list of integers starting with 0.
+        :param words: A list of string words.
+        :param max: Ids at or above this are treated as unknown words, by default the vocabulary's limit.
+        :return: A list of integers starting with 1, with stop words removed and unknown words as 2.
         """
-        words[0] = words[0].lower()
-        words = [word for word in words if word.lower() not in stop_words]
-        vector = [1] + [self.word_to_id[word] if word in self.word_to_id and self.word_to_id[word] <= max else 2
-                        for word in words]
-        return vector
+        return self.vocabulary.encode(words, max_id=max)
 
 
 if __name__ == '__main__':
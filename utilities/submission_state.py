@@ -0,0 +1,295 @@
+# Persistent per-submission analysis state, so that repeat analyses of a thread only score its new and changed comments.
+
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# The version of the tables' layout.
+SCHEMA_VERSION = 2
+
+
+def body_digest(body):
+    """
+    :param body: The text of a comment.
+    :return: A short digest of the text, which tells whether the comment has been edited since it was analyzed.
+    """
+    return hashlib.sha1(body.encode('utf-8')).hexdigest()[:16]
+
+
+class CommentState(object):
+    """
+    The analysis of one comment: the digest of the body analyzed, the score it was weighed by, its sentiment, the
+    entities found in it, the political lean of those entities (1, -1 or 0), the lean it was weighed by, which is
+    inherited from its parent if it has none of its own, and its contribution to the submission's aggregate, which is
+    sentiment * score * weight.
+    """
+
+    def __init__(self, digest, score, sentiment, entities, lean, weight=None):
+        self.digest = digest
+        self.score = score
+        self.sentiment = float(sentiment)
+        self.entities = [tuple(entity) for entity in entities]
+        self.lean = lean
+        self.weight = lean if weight is None else float(weight)
+        self.contribution = self.sentiment * score * self.weight
+
+    def __eq__(self, other):
+        return isinstance(other, CommentState) and vars(self) == vars(other)
+
+    def __repr__(self):
+        return 'CommentState({!r})'.format(vars(self))
+
+
+class SubmissionRefresh(object):
+    """
+    One analysis of a submission's comments against its previous state. Comments which are new or whose bodies were
+    edited are pending, and must be analyzed by the caller. The others keep their stored sentiment and lean, and are
+    only reweighed if their score or inherited lean changed. The aggregate is adjusted by the difference in the
+    contributions of the comments which changed, so that no comment is analyzed twice.
+    """
+
+    def __init__(self, comments, *, previous=None, totals=(0.0, 0.0), store=None, submission_id=None, version=None):
+        """
+        :param comments: A list of (comment id, body, score) of the comments analyzed now, with unique ids.
+        :param previous: A dictionary of the stored CommentState of each comment previously analyzed.
+        :param totals: The stored (republican, democratic) accumulators of the previous analysis.
+        :param store: The SubmissionState the refreshed state is saved to, if any.
+        """
+        self.comments = comments
+        self.previous = previous or {}
+        self.totals = totals
+        self.store = store
+        self.submission_id = submission_id
+        self.version = version
+        self.frame = None
+        self.changed = {}
+        current_ids = {comment_id for comment_id, _, _ in comments}
+        self.removed = [comment_id for comment_id in self.previous if comment_id not in current_ids]
+
+        self.digests = [body_digest(body) for _, body, _ in comments]
+        self.pending_rows = [row for row, ((comment_id, _, _), digest) in enumerate(zip(comments, self.digests))
+                             if comment_id not in self.previous or self.previous[comment_id].digest != digest]
+        self.pending = [comments[row] for row in self.pending_rows]
+
+    @property
+    def pending_bodies(self):
+        return [body for _, body, _ in self.pending]
+
+    def complete(self, analyses, frame=None, *, inherit_lean=True, unsettled=()):
+        """
+        :param analyses: A (sentiment, entities, lean) tuple for each pending comment, in order.
+        :param frame: A CommentFrame of the comments, in the same order, such as CommentFrame.from_comments returns.
+                      Its sentiment and lean columns are filled in. By default, a frame in which no comment replies to
+                      another.
+        :param inherit_lean: If true, comments without a lean of their own are weighed by their nearest ancestor's in
+                             the frame.
+        :param unsettled: The indices in analyses of the comments whose analysis is provisional, such as those whose
+                          entities couldn't be looked up. They count towards the accumulators returned, but aren't
+                          saved, so that they are pending again in the next refresh.
+        :action: Saves the refreshed state, if there is a store.
+        :return: The (republican, democratic) accumulators of every comment, as returned by comment_frame.aggregate.
+        """
+        # NumPy is imported on first use, so that constructing an Interface stays cheap.
+        from utilities.comment_frame import CommentFrame, aggregate
+        import numpy as np
+
+        if frame is None:
+            frame = CommentFrame.without_replies([comment_id for comment_id, _, _ in self.comments],
+                                                 [score for _, _, score in self.comments],
+                                                 [body for _, body, _ in self.comments])
+        self.frame = frame
+
+        # The stored analysis of each comment, as columns, with zeros for the comments not analyzed before.
+        previous = [self.previous.get(comment_id) for comment_id, _, _ in self.comments]
+        known = np.array([state is not None for state in previous], dtype=bool)
+
+        def column(name):
+            return np.array([getattr(state, name) if state is not None else 0.0 for state in previous],
+                            dtype=np.float64)
+
+        frame.sentiment[:] = column('sentiment')
+        frame.lean[:] = column('lean')
+        pending = np.zeros(len(frame), dtype=bool)
+        unsettled_rows = np.zeros(len(frame), dtype=bool)
+        if self.pending_rows:
+            pending[self.pending_rows] = True
+            unsettled_rows[[self.pending_rows[i] for i in unsettled]] = True
+            frame.sentiment[self.pending_rows] = [float(sentiment) for sentiment, _, _ in analyses]
+            frame.lean[self.pending_rows] = [lean for _, _, lean in analyses]
+
+        weights = frame.weighed_lean() if inherit_lean else frame.lean.copy()
+        contributions = frame.contributions(weights)
+        changed = ~known | pending | (frame.scores != column('score')) | (weights != column('weight'))
+
+        def settle(r_total, l_total, contributions):
+            # Subtracting contributions leaves rounding errors behind, which are dropped once nothing is left to count.
+            return (max(0.0, r_total) if (contributions > 0).any() else 0.0,
+                    max(0.0, l_total) if (contributions < 0).any() else 0.0)
+
+        # Only the contributions of changed comments are taken from and added to the previous totals. The stored
+        # totals keep the stored contributions of unsettled comments, which are replaced only in those returned.
+        saved = changed & ~unsettled_rows
+        stored = np.where(unsettled_rows, column('contribution'), contributions)
+        r_old, l_old = aggregate([self.previous[comment_id].contribution for comment_id in self.removed] +
+                                 column('contribution')[saved & known].tolist())
+        r_new, l_new = aggregate(contributions[saved])
+        stored_totals = settle(self.totals[0] - r_old + r_new, self.totals[1] - l_old + l_new, stored)
+
+        r_old, l_old = aggregate(stored[unsettled_rows])
+        r_new, l_new = aggregate(contributions[unsettled_rows])
+        self.totals = settle(stored_totals[0] - r_old + r_new, stored_totals[1] - l_old + l_new, contributions)
+
+        # Only the changed comments' states are built, for the store.
+        entities = dict(zip(self.pending_rows, (entities for _, entities, _ in analyses)))
+        for row in np.flatnonzero(saved).tolist():
+            comment_id, _, score = self.comments[row]
+            row_entities = entities[row] if row in entities else previous[row].entities
+            self.changed[comment_id] = CommentState(self.digests[row], score, frame.sentiment[row], row_entities,
+                                                    int(frame.lean[row]), weights[row])
+
+        if self.store is not None:
+            self.store.save(self.submission_id, self.version, changed=self.changed, removed=self.removed,
+                            totals=stored_totals)
+        return self.totals
+
+
+class SubmissionState(object):
+    """
+    The state of recently analyzed submissions, in an SQLite file shared by every Interface using it. Submissions
+    analyzed longer than max_age ago, or beyond the max_submissions most recently analyzed, are evicted with their
+    comments, which also bounds how long a comment's stored analysis can lag behind changes to the models or the
+    entity dictionary.
+    """
+
+    def __init__(self, path, *, max_submissions=1000, max_age=24*60*60, evict_every=50):
+        """
+        :param path: Path of the SQLite file.
+        :param max_submissions: The most submissions kept.
+        :param max_age: Seconds after its last analysis for which a submission is kept.
+        :param evict_every: The number of saves between evictions.
+        """
+        self.path = path
+        self.max_submissions = max_submissions
+        self.max_age = max_age
+        self.evict_every = evict_every
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute('PRAGMA foreign_keys = ON')
+        with self._db:
+            # The state is only a cache, so the tables of an older schema are dropped rather than migrated.
+            if self._db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                self._db.execute('DROP TABLE IF EXISTS comments')
+                self._db.execute('DROP TABLE IF EXISTS submissions')
+                self._db.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+            self._db.execute('CREATE TABLE IF NOT EXISTS submissions '
+                             '(id TEXT PRIMARY KEY, version TEXT, r_total REAL, l_total REAL, updated_at REAL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS submissions_updated_at ON submissions (updated_at)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS comments '
+                             '(submission_id TEXT REFERENCES submissions (id) ON DELETE CASCADE, comment_id TEXT, '
+                             'digest TEXT, score INTEGER, sentiment REAL, entities TEXT, lean REAL, weight REAL, '
+                             'PRIMARY KEY (submission_id, comment_id))')
+        self._lock = threading.Lock()
+        self._saves = 0
+        atexit.register(self.close)
+
+    def refresh(self, submission_id, version, comments):
+        """
+        :param submission_id: The id of the submission.
+        :param version: Identifies the models the comments are analyzed with. State saved under another version is
+                        discarded.
+        :param comments: See SubmissionRefresh.
+        :return: A SubmissionRefresh of the comments against the submission's stored state.
+        """
+        previous, totals = self.load(submission_id, version)
+        return SubmissionRefresh(comments, previous=previous, totals=totals, store=self, submission_id=submission_id,
+                                 version=version)
+
+    def load(self, submission_id, version):
+        """
+        :return: A dictionary of the CommentState of each comment of the submission, and its (republican, democratic)
+                 accumulators. Both are empty if the submission isn't stored under this version.
+        """
+        with self._lock:
+            row = self._db.execute('SELECT version, r_total, l_total FROM submissions WHERE id = ?',
+                                   (submission_id,)).fetchone()
+            if row is None or row[0] != version:
+                return {}, (0.0, 0.0)
+            comments = {comment_id: CommentState(digest, score, sentiment, json.loads(entities), lean, weight)
+                        for comment_id, digest, score, sentiment, entities, lean, weight in self._db.execute(
+                            'SELECT comment_id, digest, score, sentiment, entities, lean, weight FROM comments '
+                            'WHERE submission_id = ?', (submission_id,))}
+            return comments, (row[1], row[2])
+
+    def save(self, submission_id, version, *, changed, removed, totals):
+        """
+        :action: Writes the changed comments and accumulators of a submission, and deletes its removed comments, in a
+                 single transaction. Every comment is deleted if the submission was stored under another version.
+        :param changed: A dictionary of the new CommentState of each comment which is new or changed.
+        :param removed: The ids of comments no longer part of the submission's analysis.
+        :param totals: The submission's (republican, democratic) accumulators.
+        :return: None
+        """
+        with self._lock:
+            if self._db is None:
+                return
+            with self._db:
+                row = self._db.execute('SELECT version FROM submissions WHERE id = ?', (submission_id,)).fetchone()
+                if row is not None and row[0] != version:
+                    self._db.execute('DELETE FROM comments WHERE submission_id = ?', (submission_id,))
+                # Replacing the submission's row would delete its comments along with it, so it's updated in place.
+                values = (version, totals[0], totals[1], time.time(), submission_id)
+                if row is None:
+                    self._db.execute('INSERT INTO submissions (version, r_total, l_total, updated_at, id) '
+                                     'VALUES (?, ?, ?, ?, ?)', values)
+                else:
+                    self._db.execute('UPDATE submissions SET version = ?, r_total = ?, l_total = ?, updated_at = ? '
+                                     'WHERE id = ?', values)
+                self._db.executemany('DELETE FROM comments WHERE submission_id = ? AND comment_id = ?',
+                                     [(submission_id, comment_id) for comment_id in removed])
+                self._db.executemany('INSERT OR REPLACE INTO comments (submission_id, comment_id, digest, score, '
+                                     'sentiment, entities, lean, weight) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                     [(submission_id, comment_id, state.digest, state.score, state.sentiment,
+                                       json.dumps(state.entities), state.lean, state.weight)
+                                      for comment_id, state in changed.items()])
+            self._saves += 1
+            if self._saves % self.evict_every == 0:
+                self._evict()
+
+    def evict(self):
+        """
+        :action: Deletes the submissions, and their comments, which are too old or beyond max_submissions.
+        :return: None
+        """
+        with self._lock:
+            if self._db is not None:
+                self._evict()
+
+    def _evict(self):
+        with self._db:
+            if self.max_age is not None:
+                self._db.execute('DELETE FROM submissions WHERE updated_at < ?', (time.time() - self.max_age,))
+            self._db.execute('DELETE FROM submissions WHERE id NOT IN '
+                             '(SELECT id FROM submissions ORDER BY updated_at DESC LIMIT ?)', (self.max_submissions,))
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM submissions').fetchone()[0]
+
+    def close(self):
+        """
+        :action: Closes the database.
+        :return: None
+        """
+        with self._lock:
+            if self._db is None:
+                return
+            self._db.close()
+            self._db = None
@@ -0,0 +1,119 @@
+import utilities.batch as batch
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+
+from unittest import TestCase
+
+
+class FakeInterface(object):
+    """
+    Stands in for Interface, returning one result per submission without any network access or models.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def flask_packaging(self, *, url, max_number=5):
+        time.sleep(self.delay)
+        if 'broken' in url:
+            raise ConnectionError(url)
+        return [{'title': '{} {}'.format(url, i), 'r_words': {'gop', 'republican'}} for i in range(max_number)]
+
+
+class BatchAnalysis(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.output = os.path.join(directory.name, 'results.jsonl')
+
+    def records(self):
+        with open(self.output) as infile:
+            return {record['url']: record for record in map(json.loads, infile)}
+
+    def test_read_urls(self):
+        lines = io.StringIO('https://a.com/1\n\n# A comment\n  https://b.com/2  \nhttps://a.com/1\n')
+        self.assertEqual(batch.read_urls(lines), ['https://a.com/1', 'https://b.com/2'])
+
+    def test_records_and_report(self):
+        urls = ['https://a.com/{}'.format(i) for i in range(10)] + ['https://broken.com/']
+        report = batch.run_batch(urls, self.output, FakeInterface, workers=3, max_number=2)
+        self.assertEqual((report['analyzed'], report['skipped'], report['errors'], report['submissions']),
+                         (11, 0, 1, 20))
+
+        records = self.records()
+        self.assertEqual(sorted(records), sorted(urls))
+        self.assertEqual(records['https://a.com/3']['results'][1],
+                         {'title': 'https://a.com/3 1', 'r_words': ['gop', 'republican']})
+        self.assertEqual(records['https://broken.com/']['error'], 'ConnectionError: https://broken.com/')
+
+    def test_resume(self):
+        """
+        URLs already in the output aren't analyzed again, and a record cut short by a crash is dropped and redone.
+        """
+        urls = ['https://a.com/{}'.format(i) for i in range(5)]
+        batch.run_batch(urls[:3], self.output, FakeInterface, workers=2)
+        with open(self.output, 'a') as outfile:
+            outfile.write('{"url": "https://a.com/3", "resu')
+
+        analyzed = []
+
+        class RecordingInterface(FakeInterface):
+            def flask_packaging(self, *, url, max_number=5):
+                analyzed.append(url)
+                return super().flask_packaging(url=url, max_number=max_number)
+
+        report = batch.run_batch(urls, self.output, RecordingInterface, workers=2)
+        self.assertEqual((report['analyzed'], report['skipped']), (2, 3))
+        self.assertEqual(sorted(analyzed), urls[3:])
+        self.assertEqual(sorted(self.records()), urls)
+
+    def test_failures_retried(self):
+        """
+        URLs whose analysis failed are analyzed again on resuming, and their new record supersedes the failed one.
+        """
+        failing = {'https://a.com/1'}
+
+        class FlakyInterface(FakeInterface):
+            def flask_packaging(self, *, url, max_number=5):
+                if url in failing:
+                    raise ConnectionError(url)
+                return super().flask_packaging(url=url, max_number=max_number)
+
+        urls = ['https://a.com/{}'.format(i) for i in range(3)]
+        self.assertEqual(batch.run_batch(urls, self.output, FlakyInterface, workers=2)['errors'], 1)
+        self.assertEqual(batch.completed_urls(self.output), {'https://a.com/0', 'https://a.com/2'})
+
+        failing.clear()
+        report = batch.run_batch(urls, self.output, FlakyInterface, workers=2)
+        self.assertEqual((report['analyzed'], report['skipped'], report['errors']), (1, 2, 0))
+        self.assertIsNone(self.records()['https://a.com/1']['error'])
+
+    def test_concurrency(self):
+        """
+        Each worker builds one Interface, and analyses run concurrently.
+        """
+        interfaces = []
+        lock = threading.Lock()
+
+        def factory():
+            with lock:
+                interfaces.append(FakeInterface(delay=0.1))
+            return interfaces[-1]
+
+        start = time.perf_counter()
+        report = batch.run_batch(['https://a.com/{}'.format(i) for i in range(8)], self.output, factory, workers=4)
+        self.assertLess(time.perf_counter() - start, 0.6)
+        self.assertEqual(report['analyzed'], 8)
+        self.assertLessEqual(len(interfaces), 4)
+
+    def test_standard_output(self):
+        out = io.StringIO()
+        report = batch.BatchRunner(FakeInterface, workers=2, max_number=1).run(['https://a.com/1'], out)
+        self.assertEqual(report['analyzed'], 1)
+        self.assertEqual(json.loads(out.getvalue())['results'], [{'title': 'https://a.com/1 0',
+                                                                  'r_words': ['gop', 'republican']}])
@@ -0,0 +1,50 @@
+import utilities.benchmark as bm
+import os
+
+from unittest import TestCase
+
+
+class BenchmarkReports(TestCase):
+
+    def test_synthetic_corpus_is_deterministic(self):
+        self.assertEqual(bm.synthetic_comments(20, seed=3), bm.synthetic_comments(20, seed=3))
+        self.assertNotEqual(bm.synthetic_comments(20, seed=3), bm.synthetic_comments(20, seed=4))
+        self.assertTrue(all(len(comment) > 100 for comment in bm.synthetic_comments(50)))
+
+        def count(comments):
+            return sum(1 + count(comment['replies']) for comment in comments)
+        self.assertEqual(count(bm.synthetic_forest(300, seed=1)), 300)
+
+    def test_summary(self):
+        summary = bm.summarize([0.001 * i for i in range(1, 101)], items_per_call=10)
+        self.assertEqual(summary['items'], 1000)
+        self.assertAlmostEqual(summary['p50_ms'], 51.0)
+        self.assertAlmostEqual(summary['p99_ms'], 99.0)
+        self.assertAlmostEqual(summary['max_ms'], 100.0)
+        self.assertAlmostEqual(summary['items_per_second'], 1000 / 5.05)
+
+    def test_regressions(self):
+        """
+        Only benchmarks whose throughput fell by more than the tolerance are reported, and skipped ones are ignored.
+        """
+        baseline = {'results': {'a': {'items_per_second': 100.0}, 'b': {'items_per_second': 100.0},
+                                'c': {'skipped': 'No model'}}}
+        current = {'results': {'a': {'items_per_second': 85.0}, 'b': {'items_per_second': 50.0},
+                               'c': {'items_per_second': 1.0}}}
+        self.assertEqual(bm.compare(baseline, current, tolerance=0.2), [('b', 100.0, 50.0)])
+
+    def test_every_benchmark_runs(self):
+        """
+        Each benchmark runs on a tiny corpus, so that one broken by a change fails here rather than being reported
+        as skipped. Only those whose models or data aren't installed are skipped.
+        """
+        abs_path = os.path.dirname(os.path.abspath(bm.__file__)) + '/'
+        fixtures = bm.Fixtures(abs_path=abs_path, comments=4, forest_size=20, calls=1)
+        self.addCleanup(fixtures.close)
+        for name, benchmark in bm.BENCHMARKS.items():
+            with self.subTest(benchmark=name):
+                try:
+                    result = benchmark(fixtures)
+                except (ImportError, LookupError, OSError) as e:
+                    self.skipTest('{}: {}'.format(type(e).__name__, e))
+                self.assertIn('items_per_second', result)
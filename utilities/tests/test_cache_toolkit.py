@@ -0,0 +1,119 @@
+import utilities.cache_toolkit as ct
+import os
+import tempfile
+import time
+
+from unittest import TestCase
+
+
+class ResultCaching(TestCase):
+
+    def test_key_normalization(self):
+        """
+        Texts differing only in whitespace share a key, while different models or namespaces do not.
+        """
+        key = ct.ResultCache.make_key('sentiment', 'v1', 'Barack  Obama\nspoke today.')
+        self.assertEqual(key, ct.ResultCache.make_key('sentiment', 'v1', 'Barack Obama spoke today. '))
+        self.assertNotEqual(key, ct.ResultCache.make_key('sentiment', 'v2', 'Barack Obama spoke today.'))
+        self.assertNotEqual(key, ct.ResultCache.make_key('entities', 'v1', 'Barack Obama spoke today.'))
+
+    def test_hit_and_miss_counters(self):
+        cache = ct.ResultCache(max_size=10)
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', [0.1, 0.9])
+        self.assertEqual(cache.get('a'), [0.1, 0.9])
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_least_recently_used_evicted(self):
+        cache = ct.ResultCache(max_size=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_spill_to_disk(self):
+        """
+        Evicted entries are promoted back from the spill file, and flushed entries survive a new cache instance.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache', 'results.db')
+            cache = ct.ResultCache(max_size=1, spill_path=path)
+            cache.put('a', [('Barack Obama', 'PERSON')])
+            cache.put('b', [])
+            self.assertEqual(cache.get('a'), [('Barack Obama', 'PERSON')])
+            self.assertEqual(cache.stats()['disk_hits'], 1)
+            cache.close()
+
+            reopened = ct.ResultCache(max_size=1, spill_path=path)
+            self.assertEqual(reopened.get('b'), [])
+            self.assertEqual(reopened.get('a'), [('Barack Obama', 'PERSON')])
+            reopened.close()
+
+
+class UrlCaching(TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    def compute(self, url, max_number):
+        self.calls.append((url, max_number))
+        return [{'title': url, 'version': len(self.calls)}]
+
+    def test_url_normalization(self):
+        self.assertEqual(ct.normalize_url('HTTPS://www.Example.com/news/story/?utm_source=tw&b=2&a=1#comments'),
+                         'https://example.com/news/story?a=1&b=2')
+        self.assertEqual(ct.normalize_url('https://example.com/news/story?a=1&b=2&fbclid=x'),
+                         'https://example.com/news/story?a=1&b=2')
+        self.assertNotEqual(ct.normalize_url('https://example.com/news/story?id=1'),
+                            ct.normalize_url('https://example.com/news/story?id=2'))
+
+    def test_fresh_entries_served(self):
+        """
+        Equivalent urls share an entry, but a different number of submissions does not.
+        """
+        cache = ct.UrlResultCache(self.compute, ttl=60)
+        first = cache.get('https://example.com/story', max_number=5)
+        self.assertEqual(cache.get('https://www.example.com/story/#top', max_number=5), first)
+        self.assertEqual(len(self.calls), 1)
+        cache.get('https://example.com/story', max_number=3)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_stale_while_revalidate(self):
+        """
+        An expired entry is served as it is while being refreshed in the background.
+        """
+        backend = ct.MemoryBackend()
+        cache = ct.UrlResultCache(self.compute, backend=backend, ttl=60)
+        key = cache.make_key('https://example.com/story', 5)
+        backend.set(key, time.time() - 120, ['stale'])
+
+        self.assertEqual(cache.get('https://example.com/story'), ['stale'])
+        for _ in range(100):
+            if backend.get(key)[1] != ['stale']:
+                break
+            time.sleep(0.01)
+        self.assertEqual(cache.get('https://example.com/story')[0]['version'], 1)
+        self.assertEqual(cache.stale_hits, 1)
+
+    def test_too_stale_recomputed(self):
+        backend = ct.MemoryBackend()
+        cache = ct.UrlResultCache(self.compute, backend=backend, ttl=60, max_age=600)
+        backend.set(cache.make_key('https://example.com/story', 5), time.time() - 1200, ['stale'])
+        self.assertEqual(cache.get('https://example.com/story')[0]['version'], 1)
+
+    def test_backends(self):
+        with tempfile.TemporaryDirectory() as directory:
+            backends = [ct.MemoryBackend(max_size=2), ct.SQLiteBackend(os.path.join(directory, 'urls.db'), max_size=2)]
+            for backend in backends:
+                backend.set('a', 1.0, [{'r_words': {'gop'}}])
+                backend.set('b', 2.0, [])
+                backend.get('a')
+                backend.set('c', 3.0, [])
+                self.assertEqual(backend.get('c'), (3.0, []))
+                self.assertEqual(len([key for key in 'abc' if backend.get(key) is not None]), 2)
+            self.assertEqual(backends[0].get('a'), (1.0, [{'r_words': {'gop'}}]))
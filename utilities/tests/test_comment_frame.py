@@ -0,0 +1,75 @@
+import utilities.comment_frame as cf
+import numpy as np
+
+from unittest import TestCase
+
+
+class FakeComment(object):
+    def __init__(self, id, parent_id, score, body):
+        self.id = id
+        self.parent_id = parent_id
+        self.score = score
+        self.body = body
+
+
+LONG = ' This comment goes on for long enough to pass the minimum length of the comments which are analyzed.'
+
+# A thread in breadth first order: a and d are top level, b replies to a, c replies to b, and e replies to a comment
+# which isn't in the list.
+COMMENTS = [FakeComment('a', 't3_s', 50, 'Obama was great.' + LONG),
+            FakeComment('d', 't3_s', 5, 'Too low a score.' + LONG),
+            FakeComment('b', 't1_a', -30, 'I disagree.' + LONG),
+            FakeComment('c', 't1_b', 20, 'Short.'),
+            FakeComment('e', 't1_zz', 40, 'Trump is terrible.' + LONG)]
+
+
+class ColumnarComments(TestCase):
+
+    def setUp(self):
+        self.frame = cf.CommentFrame.from_comments(COMMENTS)
+
+    def test_columns(self):
+        self.assertEqual(len(self.frame), 5)
+        self.assertEqual(self.frame.ids.tolist(), [10, 13, 11, 12, 14])
+        self.assertEqual(self.frame.parents.tolist(), [-1, -1, 0, 2, -1])
+        self.assertEqual(self.frame.scores.tolist(), [50, 5, -30, 20, 40])
+        self.assertEqual(self.frame.lengths.tolist(), [len(comment.body) for comment in COMMENTS])
+        self.assertEqual(self.frame.bodies(), [comment.body for comment in COMMENTS])
+        self.assertEqual(self.frame.body(3), 'Short.')
+
+        frame = cf.CommentFrame.without_replies(['a', 'b'], [1, 2], ['first', 'second'])
+        self.assertEqual(frame.ids.tolist(), [10, 11])
+        self.assertEqual(frame.parents.tolist(), [-1, -1])
+        self.assertEqual(frame.bodies([1]), ['second'])
+
+    def test_relevant(self):
+        """
+        Rows are filtered on the absolute value of their score and their length, in order.
+        """
+        self.assertEqual(self.frame.relevant().tolist(), [0, 2, 4])
+        self.assertEqual(self.frame.relevant(limit=1).tolist(), [0])
+        self.assertEqual(self.frame.relevant(relevance_threshold=0, min_length=0).tolist(), [0, 1, 2, 3, 4])
+
+    def test_inherit_lean(self):
+        """
+        Comments without a lean take that of their nearest ancestor with one, however deep the thread.
+        """
+        self.assertEqual(cf.inherit_lean([-1, 0, 0, 1, 0], [-1, 0, 1, 2, 3]).tolist(), [-1, -1, -1, 1, 1])
+        self.assertEqual(cf.inherit_lean([0, 0, 1], [-1, 0, -1]).tolist(), [0, 0, 1])
+        depth = 1000
+        self.assertEqual(cf.inherit_lean([1] + [0] * (depth - 1), [-1] + list(range(depth - 1))).tolist(),
+                         [1] * depth)
+        self.assertEqual(cf.inherit_lean([], []).tolist(), [])
+
+    def test_aggregate(self):
+        """
+        Contributions are sentiment * score * lean, with replies weighed by their parent's lean, and are totalled
+        by the side they lean to.
+        """
+        self.frame.sentiment[:] = [1, 1, -1, 1, 1]
+        self.frame.lean[:] = [-1, 1, 0, 0, 1]
+        self.assertEqual(self.frame.weighed_lean().tolist(), [-1, 1, -1, -1, 1])
+        self.assertEqual(self.frame.contributions().tolist(), [-50, 5, -30, -20, 40])
+        self.assertEqual(self.frame.contributions(self.frame.lean).tolist(), [-50, 5, 0, 0, 40])
+        self.assertEqual(self.frame.aggregate(), (45.0, 100.0))
+        self.assertEqual(cf.aggregate(np.array([])), (0.0, 0.0))
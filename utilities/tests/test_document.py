@@ -0,0 +1,50 @@
+import utilities.document as dc
+import utilities.vocabulary as vc
+import pickle
+
+from unittest import TestCase
+
+TEXT = "Angela Merkel spoke today in Brussels. She didn't mention the budget at all!"
+
+
+class DocumentTokenization(TestCase):
+
+    def test_sentences(self):
+        document = dc.Document(TEXT)
+        self.assertEqual(document.sentences, ["Angela Merkel spoke today in Brussels.",
+                                              "She didn't mention the budget at all!"])
+        self.assertEqual([TEXT[start:end] for start, end in document.sentence_spans], document.sentences)
+        self.assertEqual(document.sentence_tokens[1],
+                         ['She', 'did', "n't", 'mention', 'the', 'budget', 'at', 'all', '!'])
+
+    def test_words(self):
+        """
+        The sentiment model's words are those of RegexpTokenizer(r'\\w+'), lowercased.
+        """
+        self.assertEqual(dc.Document(TEXT).words, ['angela', 'merkel', 'spoke', 'today', 'in', 'brussels',
+                                                   'she', 'didn', 't', 'mention', 'the', 'budget', 'at', 'all'])
+
+    def test_vector(self):
+        """
+        The vocabulary ids of a document match encoding its words directly, and are computed once per vocabulary.
+        """
+        vocabulary = vc.Vocabulary.build({'the': 1, 'mention': 17, 'brussels': 84}, ['the'], max_id=10000)
+        document = dc.Document(TEXT)
+        self.assertEqual(document.vector(vocabulary), vocabulary.encode(document.words))
+        self.assertIs(document.vector(vocabulary), document.vector(vocabulary))
+        self.assertEqual(document.vector(vocabulary, max_id=50), vocabulary.encode(document.words, max_id=50))
+
+    def test_pickling(self):
+        """
+        Documents sent to the entity recognition workers keep their text and sentence tokens.
+        """
+        document = dc.Document(TEXT)
+        document.sentence_tokens
+        copy = pickle.loads(pickle.dumps(document))
+        self.assertEqual(copy.text, TEXT)
+        self.assertEqual(copy.sentence_tokens, document.sentence_tokens)
+
+    def test_text_of(self):
+        self.assertEqual(dc.text_of(dc.Document(TEXT)), TEXT)
+        self.assertEqual(dc.text_of(TEXT), TEXT)
+        self.assertIsInstance(dc.as_document(TEXT), dc.Document)
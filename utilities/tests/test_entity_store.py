@@ -0,0 +1,71 @@
+import utilities.entity_store as es
+import os
+import tempfile
+
+from unittest import TestCase
+
+
+class EntityStorage(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'dict.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lookup_and_persistence(self):
+        """
+        Entries can be read back immediately, and from a new store once flushed.
+        """
+        store = es.EntityStore(self.path, flush_every=2)
+        store['obama'] = ('Barack Obama', 'Democratic Party')
+        self.assertIn('obama', store)
+        self.assertEqual(store['obama'], ('Barack Obama', 'Democratic Party'))
+        self.assertNotIn('gingrich', store)
+        self.assertIsNone(store.get('gingrich'))
+        store.close()
+
+        reopened = es.EntityStore(self.path)
+        self.assertEqual(reopened['obama'], ('Barack Obama', 'Democratic Party'))
+        reopened.close()
+
+    def test_batched_flushes(self):
+        """
+        Writes are buffered until flush_every entries are pending.
+        """
+        store = es.EntityStore(self.path, flush_every=3)
+        store['obama'] = ('Barack Obama', 'Democratic Party')
+        store['trump'] = ('Donald Trump', 'Republican Party')
+        other = es.EntityStore(self.path)
+        self.assertNotIn('obama', other)
+
+        store['merkel'] = ('Angela Merkel', 'Christian Democratic Union')
+        self.assertEqual(other['trump'], ('Donald Trump', 'Republican Party'))
+        self.assertEqual(len(store), 3)
+        store.close()
+        other.close()
+
+    def test_update_and_items(self):
+        store = es.EntityStore(self.path)
+        entries = {'obama': ['Barack Obama', 'Democratic Party'],
+                   'bill hader': ['No political figure', 'None found']}
+        store.update(entries)
+        self.assertEqual(dict(store.items()), {name: tuple(value) for name, value in entries.items()})
+        store.delete('obama')
+        self.assertEqual(store.keys(), ['bill hader'])
+        store.close()
+
+    def test_bounded_memory(self):
+        """
+        Only the most recently used entries are kept in memory, and the others are read back from the table.
+        """
+        store = es.EntityStore(self.path, flush_every=100, max_loaded=2)
+        for name in ('obama', 'trump', 'merkel'):
+            store[name] = (name.title(), 'Party')
+        self.assertEqual(len(store._loaded), 2)
+        self.assertEqual(store['obama'], ('Obama', 'Party'))
+        store.flush()
+        self.assertEqual(store['obama'], ('Obama', 'Party'))
+        self.assertEqual(list(store._loaded), ['merkel', 'obama'])
+        store.close()
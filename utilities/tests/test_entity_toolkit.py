@@ -1,5 +1,10 @@
+from utilities.tests.wikidata_dump import write_dump
 import utilities.entity_toolkit as et
+import utilities.party_index as pi
 import os
+import tempfile
+import threading
+import time
 
 from unittest import TestCase
 
@@ -52,6 +57,27 @@ class NamedEntityDetection(TestCase):
         for sentence in self.sent_none:
             self.assertFalse(ent.identify_entities(sentence))
 
+    def test_batch_entity_recognition(self):
+        """
+        Batches return the same entities as individual calls, in input order, whether or not worker processes are used.
+        """
+        comments = self.sent_ner + self.sent_none
+        expected = [ent.identify_entities(comment) for comment in comments]
+        self.assertEqual(ent.identify_entities_batch(comments, workers=1), expected)
+        self.assertEqual(ent.identify_entities_batch(comments, workers=2), expected)
+        self.assertEqual(ent.identify_entities_batch([]), [])
+
+    def test_warm_up(self):
+        """
+        Warming up starts the pool of workers which batches of that size use.
+        """
+        ent.warm_up(workers=2)
+        pool = ent._ner_pool(2)
+        self.assertEqual(ent._pool_workers, 2)
+        self.assertEqual(ent.identify_entities_batch(self.sent_ner[:2], workers=2),
+                         [ent.identify_entities(comment) for comment in self.sent_ner[:2]])
+        self.assertIs(ent._pool, pool)
+
 
 class PartialEntityCorrection(TestCase):
     """
@@ -88,4 +114,179 @@ class PartialEntityCorrection(TestCase):
                                'Nathan Fielder']
         apolitical_entities = [(name, 'PERSON') for name in apolitical_entities]
         for entity in apolitical_entities:
-            self.assertIsNone(ent.entity_to_political_party(entity, building_dict=False, dict_allowed=False))
\ No newline at end of file
+            self.assertIsNone(ent.entity_to_political_party(entity, building_dict=False, dict_allowed=False))
+
+
+class FakeWikipedia(object):
+    """
+    A local stand-in for the Wikipedia and Wikidata lookups, which counts the searches made.
+    """
+
+    pages = {'Obama': ['Barack Obama', 'Michelle Obama', 'Obama (surname)'],
+             'Trump': ['Donald Trump', 'Trump Tower'],
+             'Nathan Fielder': ['Nathan Fielder', 'Nathan for You']}
+
+    parties = {'Barack Obama': 'Democratic Party', 'Donald Trump': 'Republican Party'}
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.searches = []
+        self.lock = threading.Lock()
+
+    def search(self, query):
+        with self.lock:
+            self.searches.append(query)
+        time.sleep(self.delay)
+        return self.pages.get(query, [])
+
+    def page_title_to_political_party(self, title):
+        return self.parties.get(title)
+
+
+class ConcurrentEntityResolution(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'dict.json')
+
+    def linker(self, backend, **kwargs):
+        linker = et.EntityLinker(path=self.path, backend=backend, **kwargs)
+        self.addCleanup(linker.ent_dict.close)
+        return linker
+
+    def test_resolve_entities(self):
+        """
+        Resolves every distinct entity once, skipping lookups for entities which aren't people.
+        """
+        backend = FakeWikipedia()
+        linker = self.linker(backend)
+        entities = [('Obama', 'PERSON'), ('Trump', 'PERSON'), ('Obama', 'PERSON'), ('Nathan Fielder', 'PERSON'),
+                    ('Germany', 'GPE')]
+        resolved = linker.resolve_entities(entities, workers=4)
+        self.assertEqual(resolved, {('Obama', 'PERSON'): ('Barack Obama', 'Democratic Party'),
+                                    ('Trump', 'PERSON'): ('Donald Trump', 'Republican Party'),
+                                    ('Nathan Fielder', 'PERSON'): None,
+                                    ('Germany', 'GPE'): None})
+        self.assertEqual(sorted(backend.searches), ['Nathan Fielder', 'Obama', 'Trump'])
+
+        # Now that they're in the dictionary, no further searches are made.
+        linker.resolve_entities(entities)
+        self.assertEqual(len(backend.searches), 3)
+
+    def test_in_flight_lookups_shared(self):
+        """
+        Concurrent lookups of the same name, regardless of case, make a single search.
+        """
+        backend = FakeWikipedia(delay=0.2)
+        linker = self.linker(backend)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+                        linker.entity_to_political_party(('Obama', 'PERSON'))))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(backend.searches, ['Obama'])
+        self.assertEqual(results, [('Barack Obama', 'Democratic Party')] * 5)
+
+    def test_negative_results_expire(self):
+        """
+        Entities without a political party are remembered only until negative_ttl has passed.
+        """
+        backend = FakeWikipedia()
+        linker = self.linker(backend, negative_ttl=60)
+        self.assertIsNone(linker.entity_to_political_party(('Nathan Fielder', 'PERSON')))
+        self.assertIsNone(linker.entity_to_political_party(('Nathan Fielder', 'PERSON')))
+        self.assertEqual(len(backend.searches), 1)
+
+        linker.ent_dict.put('nathan fielder', ('No political figure', 'None found'), resolved_at=time.time() - 120)
+        self.assertIsNone(linker.entity_to_political_party(('Nathan Fielder', 'PERSON')))
+        self.assertEqual(len(backend.searches), 2)
+
+    def test_lookup_errors_collected(self):
+        class FailingWikipedia(FakeWikipedia):
+            def search(self, query):
+                raise ConnectionError(query)
+
+        linker = self.linker(FailingWikipedia())
+        errors = []
+        resolved = linker.resolve_entities([('Obama', 'PERSON')], errors=errors)
+        self.assertEqual(resolved, {('Obama', 'PERSON'): None})
+        self.assertEqual(len(errors), 1)
+        self.assertNotIn('obama', linker.ent_dict)
+
+    def test_batched_party_lookup(self):
+        """
+        Backends with batched party lookups are asked about every candidate page of a person in a single call.
+        """
+        class BatchedWikipedia(FakeWikipedia):
+            def __init__(self):
+                super().__init__()
+                self.batches = []
+
+            def parties_of_titles(self, titles):
+                self.batches.append(list(titles))
+                return {title: self.parties.get(title) for title in titles}
+
+        backend = BatchedWikipedia()
+        linker = self.linker(backend)
+        self.assertEqual(linker.entity_to_political_party(('Obama', 'PERSON')), ('Barack Obama', 'Democratic Party'))
+        self.assertEqual(backend.batches, [['Barack Obama', 'Michelle Obama', 'Obama (surname)']])
+
+    def test_party_index_tier(self):
+        """
+        People in an offline party index alongside the dictionary are resolved without any search, even with lookups
+        disabled, and people already found to have no party are checked against it.
+        """
+        dump_path = os.path.join(os.path.dirname(self.path), 'dump.json')
+        write_dump(dump_path)
+        pi.build_index(dump_path, os.path.join(os.path.dirname(self.path), 'parties.idx'))
+
+        backend = FakeWikipedia()
+        linker = self.linker(backend)
+        self.addCleanup(linker.party_index.close)
+        linker.ent_dict['the donald'] = ('No political figure', 'None found')
+        self.assertEqual(linker.entity_to_political_party(('Obama', 'PERSON'), lookup_enabled=False),
+                         ('Barack Obama', 'Democratic Party'))
+        resolved = linker.resolve_entities([('The Donald', 'PERSON'), ('Nathan Fielder', 'PERSON'),
+                                            ('Obama', 'GPE')])
+        self.assertEqual(resolved, {('The Donald', 'PERSON'): ('Donald Trump', 'Republican Party'),
+                                    ('Nathan Fielder', 'PERSON'): None,
+                                    ('Obama', 'GPE'): None})
+        self.assertEqual(backend.searches, ['Nathan Fielder'])
+
+
+class GazetteerModes(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.linker = et.EntityLinker(path=os.path.join(directory.name, 'dict.json'), backend=FakeWikipedia())
+        self.addCleanup(self.linker.ent_dict.close)
+        self.linker.ent_dict.update({'obama': ('Barack Obama', 'Democratic Party'),
+                                     'nathan fielder': ('No political figure', 'None found')})
+
+    def test_gazetteer_only(self):
+        """
+        Only political figures already in the dictionary are found.
+        """
+        comment = "Obama was on Nathan Fielder's show. Later, Trump spoke."
+        self.assertEqual(self.linker.identify_entities(comment, mode=et.GAZETTEER), [('Obama', 'PERSON')])
+
+    def test_gazetteer_updated_by_lookups(self):
+        self.assertEqual(self.linker.identify_entities("Trump spoke.", mode=et.GAZETTEER), [])
+        self.linker.entity_to_political_party(('Trump', 'PERSON'))
+        self.assertEqual(self.linker.identify_entities("Trump spoke.", mode=et.GAZETTEER), [('Trump', 'PERSON')])
+
+    def test_hybrid(self):
+        """
+        Sentences without known names are passed to the nltk pipeline.
+        """
+        comment = "Obama spoke today. Angela Merkel spoke at a NATO summit in Brussels."
+        self.assertEqual(self.linker.identify_entities(comment, mode=et.HYBRID),
+                         [('Obama', 'PERSON'), ('Angela Merkel', 'PERSON'), ('NATO', 'ORGANIZATION'),
+                          ('Brussels', 'GPE')])
+        self.assertEqual(self.linker.identify_entities_batch([comment, "Nothing here."], workers=1, mode=et.HYBRID),
+                         [self.linker.identify_entities(comment, mode=et.HYBRID), []])
@@ -0,0 +1,88 @@
+import utilities.gazetteer as gz
+import threading
+
+from unittest import TestCase
+
+
+class GazetteerMatching(TestCase):
+
+    names = ['Barack Obama', 'Obama', 'Donald Trump', 'Trump', 'Angela Merkel', 'Al Gore', 'Gore']
+
+    def setUp(self):
+        self.gazetteer = gz.Gazetteer(self.names)
+
+    def test_known_names_found(self):
+        """
+        Finds every known name, however it is capitalized, and prefers the longest of overlapping names.
+        """
+        comment = "Barack Obama met Donald TRUMP, and then OBAMA spoke with Merkel."
+        self.assertEqual(self.gazetteer.entities(comment),
+                         [('Barack Obama', 'PERSON'), ('Donald TRUMP', 'PERSON'), ('OBAMA', 'PERSON')])
+
+    def test_capitalized_only(self):
+        """
+        Names written in lowercase are ordinary words, and a name is only matched where all its words are capitalized.
+        """
+        self.assertEqual(self.gazetteer.find("He will trump them, and gore them."), [])
+        self.assertEqual(self.gazetteer.entities("Barack obama met donald Trump."), [('Trump', 'PERSON')])
+
+    def test_whole_words_only(self):
+        """
+        Names inside of longer words are not matched.
+        """
+        self.assertEqual(self.gazetteer.find("Trumpet players and gored bulls."), [])
+        self.assertEqual(self.gazetteer.entities("Vice president Al Gore."), [('Al Gore', 'PERSON')])
+        self.assertEqual(self.gazetteer.entities("Gore, not Al."), [('Gore', 'PERSON')])
+
+    def test_names_added_after_searching(self):
+        self.assertEqual(self.gazetteer.find("Newt Gingrich spoke."), [])
+        self.gazetteer.add('Newt Gingrich')
+        self.gazetteer.add('Gingrich')
+        self.assertEqual(self.gazetteer.entities("Newt Gingrich spoke, then Gingrich left."),
+                         [('Newt Gingrich', 'PERSON'), ('Gingrich', 'PERSON')])
+        self.assertIn('newt gingrich', self.gazetteer)
+        self.assertEqual(len(self.gazetteer), len(self.names) + 2)
+
+    def test_suffix_names(self):
+        """
+        Names ending partway through another name are found through the failure links.
+        """
+        gazetteer = gz.Gazetteer(['ab cd ef', 'cd', 'd e'])
+        self.assertEqual(gazetteer.find("Ab Cd E"), [(3, 5)])
+        self.assertEqual(gazetteer.find("X Ab Cd Eg Cd"), [(5, 7), (11, 13)])
+
+    def test_recent_names_merged(self):
+        """
+        Added names are linked into a small automaton, which is merged into the main one once it grows too large, and
+        every name is found throughout.
+        """
+        gazetteer = gz.Gazetteer(['name 0'], merge_ratio=2, min_recent=3)
+        for i in range(1, 20):
+            name = 'Name {}'.format(i)
+            gazetteer.add(name)
+            self.assertEqual(gazetteer.entities(name + ', Name 0.'), [(name, 'PERSON'), ('Name 0', 'PERSON')])
+            main, recent = gazetteer._snapshot
+            self.assertLessEqual(len(recent), max(3, len(main) // 2))
+        self.assertEqual(len(main) + len(recent), 20)
+        self.assertGreater(len(main), 1)
+
+    def test_concurrent_adds_and_searches(self):
+        gazetteer = gz.Gazetteer(['Obama'], min_recent=4)
+        errors = []
+
+        def search():
+            for _ in range(200):
+                if gazetteer.entities('Obama spoke.') != [('Obama', 'PERSON')]:
+                    errors.append('missed')
+
+        def add():
+            for i in range(200):
+                gazetteer.add('politician {}'.format(i))
+
+        threads = [threading.Thread(target=search) for _ in range(3)] + [threading.Thread(target=add)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(gazetteer.entities('Politician 199 spoke.'), [('Politician 199', 'PERSON')])
@@ -0,0 +1,76 @@
+import utilities.job_queue as jq
+import time
+
+from unittest import TestCase
+
+
+class FakeInterface(object):
+    """
+    Stands in for Interface, returning one result per submission without any network access or models.
+    """
+
+    created = 0
+
+    def __init__(self):
+        FakeInterface.created += 1
+
+    def iter_packaging(self, *, url, max_number=5):
+        if 'broken' in url:
+            raise ConnectionError(url)
+        for i in range(max_number):
+            yield {'title': '{} {}'.format(url, i), 'comment_count': i, 'r_words': {'gop'}}
+
+
+class AnalysisJobs(TestCase):
+
+    def setUp(self):
+        FakeInterface.created = 0
+        self.completed = []
+        self.jobs = jq.JobQueue(FakeInterface, workers=2, on_complete=self.completed.append)
+        self.jobs.start()
+        self.addCleanup(self.jobs.stop)
+
+    def wait(self, job_id):
+        for _ in range(200):
+            status = self.jobs.status(job_id)
+            if status['status'] in ('done', 'failed'):
+                return status
+            time.sleep(0.01)
+        self.fail('Job {} did not finish'.format(job_id))
+
+    def test_jobs_completed(self):
+        """
+        Jobs run in the background, and their results are kept in order and made serializable.
+        """
+        job_ids = [self.jobs.submit('https://example.com/{}'.format(i), max_number=3) for i in range(4)]
+        for job_id in job_ids:
+            self.assertEqual(self.wait(job_id)['progress'], 3)
+
+        status = self.jobs.status(job_ids[0], include_results=True)
+        self.assertEqual([r['title'] for r in status['results']],
+                         ['https://example.com/0 0', 'https://example.com/0 1', 'https://example.com/0 2'])
+        self.assertEqual(status['results'][0]['r_words'], ['gop'])
+        self.assertEqual(len(self.completed), 4)
+        self.assertLessEqual(FakeInterface.created, 2)
+
+    def test_failed_job(self):
+        status = self.wait(self.jobs.submit('https://broken.example.com'))
+        self.assertEqual(status['status'], 'failed')
+        self.assertIn('broken', status['error'])
+        self.assertEqual(self.completed, [])
+
+    def test_unknown_job(self):
+        self.assertIsNone(self.jobs.status('missing'))
+
+
+class JobRetention(TestCase):
+
+    def test_finished_jobs_evicted(self):
+        backend = jq.MemoryJobBackend(max_finished=2)
+        jobs = [jq.Job('https://example.com/{}'.format(i)) for i in range(3)]
+        for job in jobs:
+            backend.put(job)
+            job.status = 'done'
+            backend.save(job)
+        self.assertIsNone(backend.get(jobs[0].id))
+        self.assertIs(backend.get(jobs[2].id), jobs[2])
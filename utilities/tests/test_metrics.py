@@ -0,0 +1,45 @@
+import utilities.metrics as mt
+import threading
+
+from unittest import TestCase
+
+
+class StageMetrics(TestCase):
+
+    def test_disabled_records_nothing(self):
+        metrics = mt.Metrics()
+        with metrics.span('entities.identify'):
+            pass
+        metrics.inc('entity_dict_hits')
+        self.assertIs(metrics.span('entities.identify'), mt._NULL_SPAN)
+        self.assertEqual(metrics.render(), '\n')
+
+    def test_prometheus_text(self):
+        metrics = mt.Metrics(enabled=True, buckets=(0.1, 1.0))
+        metrics.inc('entity_dict_hits', 3)
+        metrics.observe('sentiment.predict', 0.5)
+        metrics.observe('sentiment.predict', 2.0)
+        text = metrics.render()
+        self.assertIn('# TYPE rps_entity_dict_hits_total counter\nrps_entity_dict_hits_total 3\n', text)
+        self.assertIn('rps_stage_seconds_bucket{stage="sentiment.predict",le="0.1"} 0\n', text)
+        self.assertIn('rps_stage_seconds_bucket{stage="sentiment.predict",le="1.0"} 1\n', text)
+        self.assertIn('rps_stage_seconds_bucket{stage="sentiment.predict",le="+Inf"} 2\n', text)
+        self.assertIn('rps_stage_seconds_sum{stage="sentiment.predict"} 2.5\n', text)
+
+    def test_trace(self):
+        """
+        A trace collects the stages run by its own thread, even while the registry is disabled.
+        """
+        metrics = mt.Metrics()
+        with metrics.trace() as timings:
+            with metrics.span('entities.resolve'):
+                pass
+            with metrics.span('entities.resolve'):
+                pass
+            other = threading.Thread(target=lambda: metrics.observe('reddit.fetch', 1.0))
+            other.start()
+            other.join()
+        with metrics.span('sentiment.predict'):
+            pass
+        self.assertEqual(list(timings), ['entities.resolve'])
+        self.assertEqual(metrics.counters(), {})
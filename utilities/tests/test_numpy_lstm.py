@@ -0,0 +1,44 @@
+import utilities.numpy_lstm as nl
+import numpy as np
+
+from unittest import TestCase
+
+
+def random_weights(vocabulary=50, dim=8, units=6, seed=0):
+    rng = np.random.RandomState(seed)
+    return {'embedding': rng.normal(size=(vocabulary, dim)),
+            'lstm_kernel': rng.normal(scale=0.5, size=(dim + units, 4 * units)),
+            'lstm_bias': rng.normal(scale=0.1, size=4 * units),
+            'dense_kernel': rng.normal(size=(units, 2)),
+            'dense_bias': rng.normal(size=2)}
+
+
+class NumpyInference(TestCase):
+
+    def test_pad_sequences(self):
+        """
+        Sequences are padded and truncated at the end, like tflearn's pad_sequences.
+        """
+        matrix = nl.pad_sequences([[1, 5, 7], [1, 2, 3, 4, 5, 6]], maxlen=4)
+        self.assertEqual(matrix.tolist(), [[1, 5, 7, 0], [1, 2, 3, 4]])
+
+    def test_matches_unbatched_cell(self):
+        """
+        The batched forward pass matches a direct, one text at a time evaluation of tflearn's BasicLSTMCell.
+        """
+        weights = random_weights()
+        model = nl.NumpyLSTM(weights)
+        matrix = nl.pad_sequences([[1, 4, 9], [1, 30, 2, 2, 17]], maxlen=7)
+        probs = model.predict(matrix)
+
+        units = 6
+        for row, ids in enumerate(matrix):
+            h, c = np.zeros(units), np.zeros(units)
+            for word_id in ids:
+                z = np.concatenate([weights['embedding'][word_id], h]) @ weights['lstm_kernel'] + weights['lstm_bias']
+                i, j, f, o = np.split(z, 4)
+                c = c * nl._sigmoid(f + 1.) + nl._sigmoid(i) * np.tanh(j)
+                h = np.tanh(c) * nl._sigmoid(o)
+            logits = h @ weights['dense_kernel'] + weights['dense_bias']
+            expected = np.exp(logits) / np.exp(logits).sum()
+            np.testing.assert_allclose(probs[row], expected, rtol=1e-4, atol=1e-5)
@@ -0,0 +1,70 @@
+from utilities.tests.wikidata_dump import write_dump
+import utilities.party_index as pi
+import os
+import tempfile
+
+from unittest import TestCase
+
+
+class BuildAndLookUp(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def build(self, dump_name='dump.json', **kwargs):
+        dump_path = os.path.join(self.directory, dump_name)
+        write_dump(dump_path)
+        index_path = os.path.join(self.directory, 'parties.idx')
+        count = pi.build_index(dump_path, index_path, **kwargs)
+        index = pi.PartyIndex(index_path)
+        self.addCleanup(index.close)
+        return count, index
+
+    def test_lookup(self):
+        """
+        People with a party are found by their label or an alias, in any case, with the label of their first party.
+        """
+        count, index = self.build()
+        self.assertEqual(count, len(index))
+        self.assertEqual(index.lookup('Barack Obama'), ('Barack Obama', 'Democratic Party'))
+        self.assertEqual(index.lookup('barack  hussein OBAMA ii'), ('Barack Obama', 'Democratic Party'))
+        self.assertEqual(index.lookup('The Donald'), ('Donald Trump', 'Republican Party'))
+        self.assertIn('Michelle Obama', index)
+
+    def test_exclusions(self):
+        """
+        Items which aren't people, people without a party, and parties without a label are left out.
+        """
+        count, index = self.build()
+        for name in ('Douglas Adams', 'Obama Party', 'Nobody Partisan', 'Democratic Party', 'Aaron', 'Zzz', ''):
+            self.assertIsNone(index.lookup(name))
+        self.assertEqual(count, 7)
+
+    def test_label_preferred_over_alias(self):
+        """
+        A name shared by several people belongs to the one whose label it is, otherwise to the first by title.
+        """
+        _, index = self.build()
+        self.assertEqual(index.lookup('Obama'), ('Barack Obama', 'Democratic Party'))
+        self.assertEqual(index.lookup('Trump'), ('Donald Trump', 'Republican Party'))
+
+    def test_external_merge(self):
+        """
+        Building with runs smaller than the dump, and from a compressed dump, gives the same index.
+        """
+        _, whole = self.build()
+        with open(whole.path, 'rb') as infile:
+            expected = infile.read()
+        _, merged = self.build('dump.json.bz2', run_size=2)
+        with open(merged.path, 'rb') as infile:
+            self.assertEqual(infile.read(), expected)
+        self.assertEqual([name for name in os.listdir(self.directory) if name.startswith('party-index-')], [])
+
+    def test_wrong_version(self):
+        path = os.path.join(self.directory, 'other.idx')
+        with open(path, 'wb') as outfile:
+            outfile.write(pi.HEADER.pack(pi.MAGIC, pi.VERSION + 1, 0))
+        with self.assertRaises(ValueError):
+            pi.PartyIndex(path)
@@ -0,0 +1,190 @@
+from praw.models.reddit.more import MoreComments
+from utilities.reddit_scheduler import BATCH, INTERACTIVE, BudgetTimeout, RedditScheduler, SingleFlight, TokenBucket
+from utilities.reddit_toolkit import RedditExplorer
+import os
+import tempfile
+import threading
+import time
+
+from unittest import TestCase
+
+
+class FakeClock(object):
+    """
+    A clock which only moves when slept on, so that refills are exact.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeSubmission(object):
+    def __init__(self, id):
+        self.id = id
+
+
+class FakeExplorer(RedditExplorer):
+    """
+    Stands in for Reddit, counting the requests made of it, each of which takes delay seconds.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def discussions_of_url(self, url):
+        with self._lock:
+            self.calls.append(('search', url))
+        time.sleep(self.delay)
+        return [FakeSubmission(url[-1])]
+
+    def fetch_comments(self, submission):
+        with self._lock:
+            self.calls.append(('comments', submission.id))
+        time.sleep(self.delay)
+        return ['comment of ' + submission.id]
+
+
+class FakeMoreComments(MoreComments):
+    def __init__(self, comments):
+        self._loaded = comments
+
+    def comments(self, update=True):
+        return self._loaded
+
+
+class TokenBuckets(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def bucket(self, path=None, **options):
+        return TokenBucket(path, clock=self.clock, sleep=self.clock.sleep, **options)
+
+    def test_burst_then_rate(self):
+        bucket = self.bucket(rate=2.0, capacity=3)
+        self.assertEqual([bucket.try_acquire() for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(bucket.try_acquire(), 0.5)
+        self.assertEqual(bucket.acquire(), 0.5)
+        self.assertAlmostEqual(bucket.try_acquire(), 0.5)
+
+    def test_batch_leaves_reserve(self):
+        bucket = self.bucket(rate=1.0, capacity=10, batch_reserve=0.5)
+        for _ in range(5):
+            self.assertEqual(bucket.try_acquire(priority=BATCH), 0)
+        # Batch requests wait for the reserve to be exceeded, while interactive ones can still use it.
+        self.assertAlmostEqual(bucket.try_acquire(priority=BATCH), 1.0)
+        for _ in range(5):
+            self.assertEqual(bucket.try_acquire(priority=INTERACTIVE), 0)
+        self.assertAlmostEqual(bucket.try_acquire(priority=BATCH), 6.0)
+
+    def test_timeout(self):
+        bucket = self.bucket(rate=0.1, capacity=1)
+        bucket.acquire()
+        with self.assertRaises(BudgetTimeout):
+            bucket.acquire(timeout=5)
+        self.assertEqual(bucket.acquire(timeout=20), 10.0)
+
+    def test_shared_between_buckets(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'budget.db')
+            first, second = self.bucket(path, rate=1.0, capacity=4), self.bucket(path, rate=1.0, capacity=4)
+            self.addCleanup(first.close)
+            self.addCleanup(second.close)
+            self.assertEqual([first.try_acquire(), second.try_acquire(), first.try_acquire(), second.try_acquire()],
+                             [0, 0, 0, 0])
+            self.assertAlmostEqual(first.try_acquire(), 1.0)
+            self.assertAlmostEqual(second.try_acquire(), 1.0)
+            first.close()
+            second.close()
+
+
+class SingleFlights(TestCase):
+
+    def test_concurrent_calls_coalesced(self):
+        flights = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def slow():
+            calls.append(1)
+            release.wait(5)
+            return 'result'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flights.do('key', slow))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['result'] * 4)
+        self.assertEqual(len(calls), 1)
+
+        # Once finished, the next call is made again.
+        self.assertEqual(flights.do('key', lambda: 'again'), 'again')
+
+    def test_exception_shared(self):
+        flights = SingleFlight()
+        with self.assertRaises(ConnectionError):
+            flights.do('key', self.fail_connection)
+        self.assertEqual(flights.do('key', lambda: 'recovered'), 'recovered')
+
+    @staticmethod
+    def fail_connection():
+        raise ConnectionError('reddit')
+
+
+class ScheduledExplorers(TestCase):
+
+    def test_concurrent_searches_coalesced(self):
+        scheduler = RedditScheduler(rate=100.0, capacity=100)
+        backend = FakeExplorer(delay=0.2)
+        explorers = [scheduler.explorer(backend) for _ in range(3)]
+
+        results = []
+        urls = ['https://www.example.com/a', 'https://example.com/a/', 'https://example.com/a?utm_source=x']
+        threads = [threading.Thread(target=lambda explorer, url: results.append(explorer.discussions_of_url(url)),
+                                    args=(explorer, url)) for explorer, url in zip(explorers, urls)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(backend.calls), 1)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(result is results[0] for result in results))
+
+        self.assertEqual(explorers[0].fetch_comments(FakeSubmission('x')), ['comment of x'])
+        self.assertEqual(backend.calls[-1], ('comments', 'x'))
+
+    def test_requests_rate_limited(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1.0, capacity=2, clock=clock, sleep=clock.sleep)
+        explorer = RedditScheduler(bucket=bucket).explorer(FakeExplorer(), priority=BATCH)
+        for i in range(4):
+            explorer.fetch_comments(FakeSubmission(str(i)))
+        # The first request is free, and each later one waits for a token above the reserve of one.
+        self.assertEqual(clock.now, 1003.0)
+
+    def test_more_comments_scheduled(self):
+        """
+        Expanding "load more comments" links draws on the budget, under the lock of the wrapped explorer's session.
+        """
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1.0, capacity=1, batch_reserve=0, clock=clock, sleep=clock.sleep)
+        backend = FakeExplorer()
+        explorer = RedditScheduler(bucket=bucket).explorer(backend)
+        self.assertIs(explorer._lock, backend._lock)
+
+        explorer.fetch_comments(FakeSubmission('x'))
+        _, key = explorer.extract_comments([FakeMoreComments([])], more_budget=1)
+        self.assertEqual(key, [])
+        self.assertEqual(clock.now, 1001.0)
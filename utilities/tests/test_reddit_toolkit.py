@@ -0,0 +1,118 @@
+import utilities.reddit_toolkit as rt
+import threading
+import time
+
+from praw.models.reddit.more import MoreComments
+from utilities.comment_frame import CommentFrame
+from unittest import TestCase
+
+explorer = rt.RedditExplorer(client_id='client', client_secret='secret')
+
+long_text = ' This sentence pads the comment out past the minimum length of the comments which are analyzed, surely.'
+
+
+class FakeComment(object):
+    def __init__(self, id, score=50, author='user', replies=()):
+        self.id = id
+        self.body = id + long_text
+        self.score = score
+        self.author = author
+        self.replies = list(replies)
+        self.parent_id = 't3_s'
+        for reply in self.replies:
+            reply.parent_id = 't1_' + id
+
+
+class FakeMoreComments(MoreComments):
+    def __init__(self, comments):
+        self._loaded = comments
+        self.expanded = 0
+
+    def comments(self, update=True):
+        self.expanded += 1
+        return self._loaded
+
+
+class FakeSubmission(object):
+    """
+    Loads its comments on first access, as praw's Submission does, recording how many loads overlap.
+    """
+    active = 0
+    most_active = 0
+    lock = threading.Lock()
+
+    @property
+    def comments(self):
+        cls = FakeSubmission
+        with cls.lock:
+            cls.active += 1
+            cls.most_active = max(cls.most_active, cls.active)
+        time.sleep(0.02)
+        with cls.lock:
+            cls.active -= 1
+        return []
+
+
+class CommentExtraction(TestCase):
+
+    def setUp(self):
+        self.more = FakeMoreComments([FakeComment('e'), FakeComment('f')])
+        self.forest = [FakeComment('a', replies=[FakeComment('a1', score=5), FakeComment('a2', author=None)]),
+                       FakeComment('b', author='AutoModerator', replies=[FakeComment('b1', score=-20)]),
+                       FakeComment('c'),
+                       FakeComment('d', replies=[self.more])]
+
+    def test_single_pass(self):
+        """
+        Top comments are exactly the first top-level comments, and analyzed comments are found breadth first.
+        """
+        top, key = explorer.extract_comments(self.forest, num_top_comments=2)
+        self.assertEqual([comment.id for comment in top], ['a', 'c'])
+        self.assertEqual([comment.id for comment in key], ['a', 'c', 'd', 'b1'])
+        self.assertEqual(len(explorer.top_comments(self.forest, 3)), 3)
+
+    def test_comment_frame(self):
+        """
+        The frame holds the analyzed comments, with replies linked to their parents when both are analyzed.
+        """
+        self.forest[2].replies.append(FakeComment('c1'))
+        self.forest[2].replies[0].parent_id = 't1_c'
+        _, key = explorer.extract_comments(self.forest)
+        frame = CommentFrame.from_comments(key)
+        self.assertEqual([comment.id for comment in key], ['a', 'c', 'd', 'b1', 'c1'])
+        self.assertEqual(frame.parents.tolist(), [-1, -1, -1, -1, 1])
+
+    def test_early_termination(self):
+        top, key = explorer.extract_comments(self.forest, num_top_comments=1, max_num_comments=2)
+        self.assertEqual([comment.id for comment in key], ['a', 'c'])
+        self.assertEqual(explorer.all_comments_to_list(self.forest, max_num_comments=1), [('a' + long_text, 50)])
+
+    def test_few_top_comments(self):
+        """
+        A thread with fewer top-level comments than wanted is only walked until the analyzed comments are found.
+        """
+        top, key = explorer.extract_comments(self.forest, num_top_comments=10, max_num_comments=2, more_budget=1)
+        self.assertEqual([comment.id for comment in top], ['a', 'c', 'd'])
+        self.assertEqual([comment.id for comment in key], ['a', 'c'])
+        self.assertEqual(self.more.expanded, 0)
+
+    def test_more_comments_budget(self):
+        """
+        "Load more comments" links are only expanded within the budget.
+        """
+        _, key = explorer.extract_comments(self.forest)
+        self.assertEqual(self.more.expanded, 0)
+        _, key = explorer.extract_comments(self.forest, more_budget=1)
+        self.assertEqual(self.more.expanded, 1)
+        self.assertEqual([comment.id for comment in key], ['a', 'c', 'd', 'b1', 'e', 'f'])
+
+    def test_fetches_serialized(self):
+        """
+        The session isn't thread safe, so comment trees fetched from several threads are loaded one at a time.
+        """
+        threads = [threading.Thread(target=explorer.fetch_comments, args=(FakeSubmission(),)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(FakeSubmission.most_active, 1)
@@ -0,0 +1,86 @@
+import utilities.replay as rp
+import os
+import tempfile
+import time
+
+from unittest import TestCase
+
+
+class FakeComment(object):
+    def __init__(self, id, body, author='user', replies=()):
+        self.id = id
+        self.body = body
+        self.score = 20
+        self.author = author
+        self.permalink = '/r/politics/comments/s1/_/' + id
+        self.parent_id = 't3_s1'
+        self.replies = list(replies)
+
+
+class FakeSubmission(object):
+    id = 's1'
+    title = 'An article'
+    subreddit = 'politics'
+    score = 100
+    permalink = '/r/politics/comments/s1/'
+    num_comments = 3
+    url = 'https://example.com/article'
+
+
+class FakeExplorer(object):
+    def discussions_of_url(self, url):
+        return [FakeSubmission()]
+
+    def fetch_comments(self, submission):
+        return [FakeComment('c1', 'Obama spoke today.', replies=[FakeComment('c2', 'Deleted', author=None)]),
+                FakeComment('c3', 'Trump too.')]
+
+
+class FakeBackend(object):
+    def search(self, query):
+        return ['Barack Obama'] if query == 'Obama' else []
+
+    def page_title_to_political_party(self, title):
+        return 'Democratic Party'
+
+
+class RecordAndReplay(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'snapshots', 'article.jsonl')
+
+    def test_reddit_round_trip(self):
+        """
+        Replayed submissions and comment trees have the same contents as those seen while recording.
+        """
+        recorder = rp.RecordingExplorer(FakeExplorer(), rp.SnapshotStore(self.path))
+        recorded = recorder.fetch_comments(recorder.discussions_of_url('https://example.com/article')[0])
+
+        replayer = rp.ReplayExplorer(rp.SnapshotStore(self.path))
+        submission = replayer.discussions_of_url('https://example.com/article')[0]
+        comments = replayer.fetch_comments(submission)
+        self.assertEqual(replayer.parse_submission_info(submission)['url'],
+                         'https://reddit.com/r/politics/comments/s1/')
+        self.assertEqual([comment.id for comment in comments.list()], ['c1', 'c3', 'c2'])
+        self.assertEqual(rp.forest_to_list(comments), rp.forest_to_list(recorded))
+        self.assertIsNone(comments[0].replies[0].author)
+        self.assertEqual(replayer.top_comments(comments, 3)[0].body, 'Obama spoke today.')
+
+        with self.assertRaises(rp.SnapshotMissing):
+            replayer.discussions_of_url('https://example.com/other')
+
+    def test_wikipedia_round_trip(self):
+        recorder = rp.RecordingBackend(FakeBackend(), rp.SnapshotStore(self.path))
+        recorder.search('Obama')
+        recorder.page_title_to_political_party('Barack Obama')
+
+        replayer = rp.ReplayBackend(rp.SnapshotStore(self.path), latency=0.05)
+        started = time.time()
+        self.assertEqual(replayer.search('Obama'), ['Barack Obama'])
+        self.assertGreaterEqual(time.time() - started, 0.05)
+        self.assertEqual(replayer.page_title_to_political_party('Barack Obama'), 'Democratic Party')
+        with self.assertRaises(rp.SnapshotMissing):
+            replayer.search('Trump')
+        self.assertEqual(rp.ReplayBackend(rp.SnapshotStore(self.path), strict=False).search('Trump'), [])
@@ -2,6 +2,7 @@ import utilities.sentiment_toolkit as st
 import os
 
 from unittest import TestCase
+from utilities.document import Document
 
 # Move up to the parent directory so that we can access the correct files.
 os.chdir("../")
@@ -42,4 +43,54 @@ class BasicSentiment(TestCase):
         ]
 
         for comment in negative_comments:
-            self.assertTrue(classifier.predict(comment), -1)
\ No newline at end of file
+            self.assertTrue(classifier.predict(comment), -1)
+
+class BatchSentiment(TestCase):
+
+    comments = [
+        "This is really great!",
+        "I really hate the smell of cucumbers.",
+        "Writing unit tests is the most fun I have had in my life!",
+        "This whole thing was garbage. Just a pile of garbage without any redeeming quality."
+    ]
+
+    def test_batch_matches_single_predictions(self):
+        """
+        Classifying comments in a batch gives the same results, in the same order, as classifying them one at a time.
+        """
+        self.assertEqual(classifier.predict_batch(self.comments),
+                         [classifier.predict(comment) for comment in self.comments])
+
+    def test_batch_chunking(self):
+        """
+        Splitting a batch into several forward passes does not change the probabilities returned.
+        """
+        whole = classifier.predict_batch(self.comments, full_probs=True)
+        chunked = classifier.predict_batch(self.comments, full_probs=True, batch_size=3)
+        for a, b in zip(whole, chunked):
+            for x, y in zip(a, b):
+                self.assertAlmostEqual(x, y, places=5)
+
+    def test_empty_batch(self):
+        self.assertEqual(classifier.predict_batch([]), [])
+
+    def test_documents(self):
+        """
+        Documents are classified the same as their text.
+        """
+        self.assertEqual(classifier.predict_batch([Document(comment) for comment in self.comments], full_probs=True),
+                         classifier.predict_batch(self.comments, full_probs=True))
+
+
+class NumpyBackend(TestCase):
+
+    def test_parity_with_tflearn(self):
+        """
+        The NumPy backend gives the same probabilities as the tflearn model it was exported from.
+        """
+        numpy_classifier = st.SentimentClassifier(load_path="saved_data/trained_models/model.tfl", backend=st.NUMPY)
+        expected = classifier.predict_batch(BatchSentiment.comments, full_probs=True)
+        actual = numpy_classifier.predict_batch(BatchSentiment.comments, full_probs=True)
+        for a, b in zip(expected, actual):
+            for x, y in zip(a, b):
+                self.assertAlmostEqual(x, y, places=4)
@@ -0,0 +1,180 @@
+import utilities.comment_frame as cf
+import utilities.submission_state as ss
+import os
+import tempfile
+import time
+
+from unittest import TestCase
+
+COMMENTS = [('a', 'Obama was great.', 50), ('b', 'Trump is terrible.', 30), ('c', 'Nothing political here.', 10)]
+
+# The (sentiment, entities, lean) of each comment's body.
+ANALYSES = {'Obama was great.': (0.5, [('Obama', 'PERSON')], -1),
+            'Trump is terrible.': (-0.5, [('Trump', 'PERSON')], 1),
+            'Trump is great.': (0.5, [('Trump', 'PERSON')], 1),
+            'Nothing political here.': (0.25, [], 0)}
+
+
+def totals_from_scratch(comments):
+    r_total = l_total = 0.0
+    for _, body, score in comments:
+        sentiment, _, lean = ANALYSES[body]
+        contribution = sentiment * score * lean
+        if contribution > 0:
+            r_total += contribution
+        else:
+            l_total += abs(contribution)
+    return r_total, l_total
+
+
+class IncrementalRefresh(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.state = ss.SubmissionState(os.path.join(directory.name, 'submissions.db'))
+        self.addCleanup(self.state.close)
+
+    def analyze(self, comments, version='v1'):
+        refresh = self.state.refresh('s1', version, comments)
+        pending = refresh.pending_bodies
+        return pending, refresh.complete([ANALYSES[body] for body in pending])
+
+    def test_first_analysis(self):
+        pending, totals = self.analyze(COMMENTS)
+        self.assertEqual(pending, [body for _, body, _ in COMMENTS])
+        self.assertEqual(totals, totals_from_scratch(COMMENTS))
+        self.assertEqual(totals, (0.0, 40.0))
+
+    def test_unchanged_comments_not_scored(self):
+        self.analyze(COMMENTS)
+        pending, totals = self.analyze(COMMENTS)
+        self.assertEqual(pending, [])
+        self.assertEqual(totals, totals_from_scratch(COMMENTS))
+
+    def test_churn(self):
+        """
+        Only new and edited comments are scored. Comments whose score changed are reweighed, and removed comments no
+        longer count, leaving the same aggregate as analyzing the thread from scratch.
+        """
+        self.analyze(COMMENTS)
+        comments = [('a', 'Obama was great.', 80), ('b', 'Trump is great.', 30), ('d', 'Trump is terrible.', 4)]
+        pending, totals = self.analyze(comments)
+        self.assertEqual(pending, ['Trump is great.', 'Trump is terrible.'])
+        self.assertEqual(totals, totals_from_scratch(comments))
+
+        stored, stored_totals = self.state.load('s1', 'v1')
+        self.assertEqual(sorted(stored), ['a', 'b', 'd'])
+        self.assertEqual(stored['a'].score, 80)
+        self.assertEqual(stored['b'].entities, [('Trump', 'PERSON')])
+        self.assertEqual(stored_totals, totals)
+
+    def test_inherited_lean(self):
+        """
+        A reply with no lean of its own is weighed by its parent's, and is reweighed without being analyzed again when
+        the parent's lean changes.
+        """
+        def frame():
+            return cf.CommentFrame([10, 12], [-1, 0], [50, 10], [body for _, body, _ in comments])
+
+        comments = [('a', 'Obama was great.', 50), ('c', 'Nothing political here.', 10)]
+        refresh = self.state.refresh('s1', 'v1', comments)
+        totals = refresh.complete([ANALYSES[body] for body in refresh.pending_bodies], frame())
+        self.assertEqual(totals, (0.0, 27.5))
+        self.assertEqual(refresh.changed['c'].weight, -1)
+        self.assertEqual(refresh.frame.contributions().tolist(), [-25.0, -2.5])
+
+        comments = [('a', 'Trump is great.', 50), ('c', 'Nothing political here.', 10)]
+        refresh = self.state.refresh('s1', 'v1', comments)
+        self.assertEqual(refresh.pending_bodies, ['Trump is great.'])
+        totals = refresh.complete([ANALYSES[body] for body in refresh.pending_bodies], frame())
+        self.assertEqual(totals, (27.5, 0.0))
+        self.assertEqual(self.state.load('s1', 'v1')[0]['c'].weight, 1)
+
+        # Without inheritance, the reply counts for nothing.
+        refresh = self.state.refresh('s1', 'v1', comments)
+        self.assertEqual(refresh.complete([], frame(), inherit_lean=False), (25.0, 0.0))
+        self.assertEqual(sorted(refresh.changed), ['c'])
+
+    def test_unsettled_comments_not_saved(self):
+        """
+        Comments analyzed without the parties of their entities count for now, but are analyzed again next time, and
+        the stored totals don't include them.
+        """
+        def analyze(comments, unsettled):
+            refresh = self.state.refresh('s1', 'v1', comments)
+            analyses = [ANALYSES[body] for body in refresh.pending_bodies]
+            analyses = [(sentiment, entities, 0) if i in unsettled else (sentiment, entities, lean)
+                        for i, (sentiment, entities, lean) in enumerate(analyses)]
+            return refresh.pending_bodies, refresh.complete(analyses, unsettled=unsettled)
+
+        pending, totals = analyze(COMMENTS, [1])
+        self.assertEqual(totals, (0.0, 25.0))
+        stored, stored_totals = self.state.load('s1', 'v1')
+        self.assertEqual(sorted(stored), ['a', 'c'])
+        self.assertEqual(stored_totals, (0.0, 25.0))
+
+        pending, totals = analyze(COMMENTS, [])
+        self.assertEqual(pending, ['Trump is terrible.'])
+        self.assertEqual(totals, totals_from_scratch(COMMENTS))
+
+        # An edited comment keeps its stored analysis until it is settled.
+        comments = [COMMENTS[0], ('b', 'Trump is great.', 30), COMMENTS[2]]
+        pending, totals = analyze(comments, [0])
+        self.assertEqual(totals, (0.0, 25.0))
+        stored, stored_totals = self.state.load('s1', 'v1')
+        self.assertEqual(stored['b'].digest, ss.body_digest('Trump is terrible.'))
+        self.assertEqual(stored_totals, (0.0, 40.0))
+        pending, totals = analyze(comments, [])
+        self.assertEqual(pending, ['Trump is great.'])
+        self.assertEqual(totals, totals_from_scratch(comments))
+
+    def test_new_version(self):
+        """
+        State saved by other models is discarded.
+        """
+        self.analyze(COMMENTS)
+        pending, totals = self.analyze(COMMENTS[:1], version='v2')
+        self.assertEqual(pending, ['Obama was great.'])
+        self.assertEqual(totals, totals_from_scratch(COMMENTS[:1]))
+        self.assertEqual(sorted(self.state.load('s1', 'v2')[0]), ['a'])
+
+    def test_without_store(self):
+        refresh = ss.SubmissionRefresh(COMMENTS)
+        self.assertEqual(refresh.complete([ANALYSES[body] for body in refresh.pending_bodies]),
+                         totals_from_scratch(COMMENTS))
+
+
+class Eviction(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'submissions.db')
+
+    def save(self, state, submission_id):
+        refresh = state.refresh(submission_id, 'v1', COMMENTS)
+        refresh.complete([ANALYSES[body] for body in refresh.pending_bodies])
+
+    def test_oldest_submissions_evicted(self):
+        state = ss.SubmissionState(self.path, max_submissions=2, evict_every=1)
+        self.addCleanup(state.close)
+        for submission_id in ('s1', 's2', 's3'):
+            self.save(state, submission_id)
+            time.sleep(0.01)
+        self.assertEqual(len(state), 2)
+        self.assertEqual(state.load('s1', 'v1'), ({}, (0.0, 0.0)))
+        self.assertEqual(sorted(state.load('s3', 'v1')[0]), ['a', 'b', 'c'])
+
+        # The comments of evicted submissions are deleted with them.
+        count = state._db.execute('SELECT COUNT(*) FROM comments').fetchone()[0]
+        self.assertEqual(count, 6)
+
+    def test_expired_submissions_evicted(self):
+        state = ss.SubmissionState(self.path, max_age=0, evict_every=100)
+        self.addCleanup(state.close)
+        self.save(state, 's1')
+        self.assertEqual(len(state), 1)
+        time.sleep(0.01)
+        state.evict()
+        self.assertEqual(len(state), 0)
@@ -0,0 +1,117 @@
+import utilities.training as tr
+import numpy as np
+import os
+import tempfile
+
+from unittest import TestCase
+
+
+class Interrupted(Exception):
+    pass
+
+
+class FakeModel(object):
+    """
+    Records the rows it is fit on, identified by their first id, and fails once after fail_after fits.
+    """
+
+    def __init__(self, fail_after=None):
+        self.fitted = []
+        self.loaded = []
+        self.saved = []
+        self.fail_after = fail_after
+
+    def fit(self, x, y, **kwargs):
+        if self.fail_after is not None and len(self.fitted) >= self.fail_after:
+            self.fail_after = None
+            raise Interrupted()
+        self.fitted.append(x[:, 0].tolist())
+
+    def evaluate(self, x, y, batch_size=128):
+        return [0.5]
+
+    def save(self, path):
+        self.saved.append(path)
+
+    def load(self, path):
+        self.loaded.append(path)
+
+
+class StreamingTraining(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        examples = [([i, i % 7], i % 2) for i in range(1, 101)]
+        self.data = tr.build_dataset(examples, os.path.join(self.directory, 'data', 'train'), maxlen=5,
+                                     chunk_size=30)
+
+    def test_dataset(self):
+        data = tr.TrainingData(os.path.join(self.directory, 'data', 'train'))
+        self.assertEqual(len(data), 100)
+        x, y = data.gather(np.array([0, 9]))
+        self.assertEqual(x.tolist(), [[1, 1, 0, 0, 0], [10, 3, 0, 0, 0]])
+        self.assertEqual(y.tolist(), [[0., 1.], [1., 0.]])
+
+    def test_chunks_cover_epoch(self):
+        """
+        Each epoch yields every row once, in an order that differs between epochs but not between runs.
+        """
+        def rows(epoch, start=0):
+            return [row for _, x, _ in self.data.chunks(16, epoch=epoch, start=start, workers=3)
+                    for row in x[:, 0].tolist()]
+
+        self.assertEqual(sorted(rows(0)), list(range(1, 101)))
+        self.assertEqual(rows(1), rows(1))
+        self.assertNotEqual(rows(0), rows(1))
+        self.assertEqual(rows(1, start=2), rows(1)[32:])
+
+    def test_resume_after_interruption(self):
+        """
+        An interrupted run resumes from its last checkpoint, and every epoch still sees every row exactly once.
+        """
+        save_path = os.path.join(self.directory, 'model.tfl')
+        model = FakeModel(fail_after=9)
+        with self.assertRaises(Interrupted):
+            tr.train(model, save_path, self.data, n_epoch=2, batch_size=4, checkpoint_every=5, report=lambda line: None)
+
+        lines = []
+        resumed = FakeModel()
+        history = tr.train(resumed, save_path, self.data, validation_data=self.data, n_epoch=2, batch_size=4,
+                           checkpoint_every=5, report=lines.append)
+
+        self.assertEqual(resumed.loaded, [os.path.join(save_path + '.training', 'checkpoint.tfl')])
+        fitted = model.fitted + resumed.fitted
+        self.assertEqual(len(fitted), 10)
+        for epoch in range(2):
+            self.assertEqual(sorted(row for chunk in fitted[epoch*5:(epoch+1)*5] for row in chunk),
+                             list(range(1, 101)))
+        self.assertEqual(resumed.saved[-1], save_path)
+        self.assertEqual([stats['epoch'] for stats in history], [2])
+        self.assertIn('examples/sec', lines[-1])
+
+    def test_finished_run_cleaned_up(self):
+        """
+        Once the model is saved its checkpoints are deleted, so that training again starts from scratch.
+        """
+        save_path = os.path.join(self.directory, 'model.tfl')
+        for _ in range(2):
+            model = FakeModel()
+            tr.train(model, save_path, self.data, n_epoch=1, batch_size=4, checkpoint_every=5, report=lambda line: None)
+            self.assertEqual(len(model.fitted), 5)
+            self.assertEqual(model.loaded, [])
+            self.assertFalse(os.path.exists(save_path + '.training'))
+
+    def test_refuses_other_run(self):
+        save_path = os.path.join(self.directory, 'model.tfl')
+        with self.assertRaises(Interrupted):
+            tr.train(FakeModel(fail_after=2), save_path, self.data, n_epoch=1, batch_size=4, checkpoint_every=5,
+                     report=lambda line: None)
+        with self.assertRaises(ValueError):
+            tr.train(FakeModel(), save_path, self.data, n_epoch=1, batch_size=8, checkpoint_every=5,
+                     report=lambda line: None)
+        other = tr.build_dataset([([1], 1)] * 10, os.path.join(self.directory, 'data', 'other'), maxlen=5)
+        with self.assertRaises(ValueError):
+            tr.train(FakeModel(), save_path, other, n_epoch=1, batch_size=4, checkpoint_every=5,
+                     report=lambda line: None)
@@ -0,0 +1,51 @@
+import utilities.vocabulary as vc
+import os
+import tempfile
+
+from unittest import TestCase
+
+word_index = {'the': 1, 'movie': 17, 'great': 84, 'Terrible': 400, 'rare': 9996, 'rarer': 9997}
+stop_words = ['the', 'I']
+
+
+class VocabularyEncoding(TestCase):
+
+    def setUp(self):
+        self.vocabulary = vc.Vocabulary.build(word_index, stop_words, max_id=10000)
+
+    def test_usable_words_only(self):
+        """
+        Only words with ids below max_id are kept, so every id is a valid index into the model's embedding.
+        """
+        self.assertEqual(self.vocabulary.word_ids['rare'], 10000 - 1)
+        self.assertNotIn('rarer', self.vocabulary.word_ids)
+        self.assertEqual(self.vocabulary.encode(['rarer']), [vc.START, vc.UNK])
+
+    def test_encoding(self):
+        """
+        Words are matched regardless of case, stop words are dropped, and unknown words are UNK.
+        """
+        self.assertEqual(self.vocabulary.encode(['I', 'thought', 'The', 'Movie', 'was', 'terrible']),
+                         [vc.START, vc.UNK, 20, vc.UNK, 403])
+        self.assertEqual(self.vocabulary.encode(['great', 'terrible'], max_id=100), [vc.START, 87, vc.UNK])
+        self.assertEqual(self.vocabulary.decode([vc.START, 20, vc.UNK]), '<START> movie <UNK>')
+
+    def test_artifact_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'models', 'vocabulary.tsv')
+            self.vocabulary.save(path)
+            loaded = vc.Vocabulary.load(path)
+            self.assertEqual(loaded.word_ids, self.vocabulary.word_ids)
+            self.assertEqual(loaded.max_id, 10000)
+
+            with open(path, 'w') as outfile:
+                outfile.write('#vocabulary version=0 max_id=10000 size=0\n')
+            with self.assertRaises(ValueError):
+                vc.Vocabulary.load(path)
+
+    def test_missing_artifact(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'vocabulary.tsv')
+            with self.assertRaises(FileNotFoundError) as raised:
+                vc.Vocabulary.load(path)
+            self.assertIn('python3 -m utilities.vocabulary', str(raised.exception))
@@ -0,0 +1,85 @@
+import utilities.wikidata_api as wd
+import json
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import TestCase
+from urllib.parse import parse_qs
+
+# A few Wikidata items, by enwiki title and by id.
+PEOPLE = {'Barack Obama': ('Q76', 'Q29552'), 'Donald Trump': ('Q22686', 'Q29468'),
+          'Michelle Obama': ('Q13133', 'Q29552'), 'Obama (surname)': ('Q3351460', None)}
+PARTIES = {'Q29552': 'Democratic Party', 'Q29468': 'Republican Party'}
+
+
+class FakeWikidataHandler(BaseHTTPRequestHandler):
+    """
+    Answers wbgetentities requests from PEOPLE and PARTIES, recording each request's parameters.
+    """
+
+    def do_POST(self):
+        params = {key: values[0] for key, values in
+                  parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode()).items()}
+        self.server.requests.append(params)
+
+        entities = {}
+        if 'titles' in params:
+            for i, title in enumerate(params['titles'].split('|')):
+                if title not in PEOPLE:
+                    entities[str(-1 - i)] = {'site': 'enwiki', 'title': title, 'missing': ''}
+                    continue
+                item, party = PEOPLE[title]
+                claims = {}
+                if party:
+                    claims['P102'] = [{'mainsnak': {'datavalue': {'value': {'entity-type': 'item', 'id': party}}}}]
+                entities[item] = {'id': item, 'claims': claims, 'sitelinks': {'enwiki': {'title': title}}}
+        else:
+            for item in params['ids'].split('|'):
+                entities[item] = {'id': item, 'labels': {'en': {'language': 'en', 'value': PARTIES[item]}}}
+
+        body = json.dumps({'entities': entities}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class BatchedPartyLookup(TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), FakeWikidataHandler)
+        self.server.requests = []
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.resolver = wd.WikidataResolver(endpoint='http://127.0.0.1:{}/w/api.php'.format(self.server.server_port))
+        self.addCleanup(self.resolver.session.close)
+
+    def test_parties_of_titles(self):
+        """
+        Every title is resolved with one request for the items and one for the party labels.
+        """
+        parties = self.resolver.parties_of_titles(['Barack Obama', 'Obama (surname)', 'Michelle Obama', 'Nobody'])
+        self.assertEqual(parties, {'Barack Obama': 'Democratic Party', 'Obama (surname)': None,
+                                   'Michelle Obama': 'Democratic Party', 'Nobody': None})
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.requests[1]['ids'], 'Q29552')
+
+    def test_batches_and_label_cache(self):
+        self.resolver.batch_size = 2
+        self.resolver.parties_of_titles(['Barack Obama', 'Michelle Obama', 'Donald Trump'])
+        self.assertEqual(len(self.server.requests), 3)
+
+        # The labels of both parties are now known, so only the item is fetched.
+        self.assertEqual(self.resolver.party_of_title('Donald Trump'), 'Republican Party')
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_connection_errors(self):
+        resolver = wd.WikidataResolver(endpoint='http://127.0.0.1:1/w/api.php', timeout=1)
+        with self.assertRaises(ConnectionError):
+            resolver.party_of_title('Barack Obama')
@@ -0,0 +1,36 @@
+# A small dump in the format of the Wikidata json dumps, shared by the tests of the party index and of its use in
+# entity linking.
+
+import bz2
+import json
+
+
+def item(qid, label, *, aliases=(), instance_of=None, parties=(), title=None):
+    entity = {'id': qid, 'type': 'item', 'labels': {'en': {'language': 'en', 'value': label}},
+              'aliases': {'en': [{'language': 'en', 'value': alias} for alias in aliases]}, 'claims': {}}
+    if instance_of:
+        entity['claims']['P31'] = [{'mainsnak': {'datavalue': {'value': {'id': instance_of}}}}]
+    if parties:
+        entity['claims']['P102'] = [{'mainsnak': {'datavalue': {'value': {'id': party}}}} for party in parties]
+    if title:
+        entity['sitelinks'] = {'enwiki': {'site': 'enwiki', 'title': title}}
+    return entity
+
+
+# Parties are listed after their members.
+FIXTURE = [item('Q76', 'Barack Obama', aliases=['Obama', 'Barack Hussein Obama II'], instance_of='Q5',
+                parties=['Q29552'], title='Barack Obama'),
+           item('Q22686', 'Donald Trump', aliases=['Trump', 'The Donald'], instance_of='Q5',
+                parties=['Q29468', 'Q29552'], title='Donald Trump'),
+           item('Q13133', 'Michelle Obama', aliases=['Obama'], instance_of='Q5', parties=['Q29552'],
+                title='Michelle Obama'),
+           item('Q42', 'Douglas Adams', instance_of='Q5', title='Douglas Adams'),
+           item('Q1', 'Obama Party', aliases=['Trump'], instance_of='Q7278', parties=['Q29552']),
+           item('Q9', 'Nobody Partisan', instance_of='Q5', parties=['Q404']),
+           item('Q29552', 'Democratic Party'),
+           item('Q29468', 'Republican Party')]
+
+
+def write_dump(path, entities=FIXTURE):
+    with (bz2.open(path, 'wt') if path.endswith('.bz2') else open(path, 'w')) as outfile:
+        outfile.write('[\n' + ',\n'.join(json.dumps(entity) for entity in entities) + '\n]\n')
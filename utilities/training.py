@@ -0,0 +1,246 @@
+# Streaming training for the sentiment model. Examples are stored once as padded word ids in memory-mapped files, then
+# fed to the model a chunk at a time, so that memory use is bounded and training can be checkpointed and resumed.
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from utilities.numpy_lstm import pad_sequences
+
+import numpy as np
+import json
+import os
+import shutil
+import sys
+import time
+
+# Datasets written by other versions of the format must be rebuilt.
+FORMAT_VERSION = 1
+
+
+def imdb_examples(split='train', num_words=10000):
+    """
+    :param split: 'train' or 'test'.
+    :param num_words: Words with ids at or above this are replaced by the unknown word id.
+    :return: An iterator of (word ids, label) pairs from the Keras IMDB dataset.
+    """
+    from keras.datasets import imdb
+
+    train, test = imdb.load_data(num_words=num_words, index_from=3)
+    x, y = train if split == 'train' else test
+    return zip(x, y)
+
+
+def reddit_examples(path, vocabulary, tokenizer=None):
+    """
+    :param path: Path of a labeled comment corpus, a file with one json object per line with the comment's 'body' and
+                 its 'label', which is positive if greater than 0 and negative otherwise.
+    :param vocabulary: The Vocabulary used by the classifier being trained.
+    :param tokenizer: The tokenizer used by the classifier, by default the same word tokenizer.
+    :return: An iterator of (word ids, label) pairs, with labels of 0 or 1.
+    """
+    if tokenizer is None:
+        from nltk.tokenize import RegexpTokenizer
+        tokenizer = RegexpTokenizer(r'\w+')
+    with open(path, encoding='utf-8') as infile:
+        for line in infile:
+            if not line.strip():
+                continue
+            comment = json.loads(line)
+            yield vocabulary.encode(tokenizer.tokenize(comment['body'])), int(float(comment['label']) > 0)
+
+
+def build_dataset(examples, path, *, maxlen=100, chunk_size=10000):
+    """
+    :param examples: An iterable of (word ids, label) pairs, which is read a chunk at a time.
+    :param path: Path prefix of the dataset. The padded ids are written to path.x, the labels to path.y, and the shape
+                 to path.json, which is written last so that an interrupted build is not mistaken for a dataset.
+    :param maxlen: The length every example is padded or truncated to.
+    :param chunk_size: The number of examples held in memory at once.
+    :return: A TrainingData of the written dataset.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    rows = 0
+    examples = iter(examples)
+    with open(path + '.x', 'wb') as x_file, open(path + '.y', 'wb') as y_file:
+        while True:
+            chunk = [example for _, example in zip(range(chunk_size), examples)]
+            if not chunk:
+                break
+            pad_sequences([ids for ids, _ in chunk], maxlen=maxlen).tofile(x_file)
+            np.array([label for _, label in chunk], dtype=np.uint8).tofile(y_file)
+            rows += len(chunk)
+
+    _write_json(path + '.json', {'version': FORMAT_VERSION, 'rows': rows, 'maxlen': maxlen})
+    return TrainingData(path)
+
+
+def _write_json(path, value):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as outfile:
+        json.dump(value, outfile)
+    os.replace(temp_path, path)
+
+
+class TrainingData(object):
+    """
+    A dataset written by build_dataset. The ids and labels are memory-mapped, so only the rows being used are read.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The path prefix the dataset was built with.
+        :raises ValueError: If the dataset was built by another version of this module.
+        """
+        with open(path + '.json') as infile:
+            meta = json.load(infile)
+        if meta.get('version') != FORMAT_VERSION:
+            raise ValueError("{} is not a version {} dataset".format(path, FORMAT_VERSION))
+        self.path = path
+        self.rows = meta['rows']
+        self.maxlen = meta['maxlen']
+        self.x = np.memmap(path + '.x', dtype=np.int32, mode='r', shape=(self.rows, self.maxlen))
+        self.y = np.memmap(path + '.y', dtype=np.uint8, mode='r', shape=(self.rows,))
+
+    def __len__(self):
+        return self.rows
+
+    def gather(self, indices):
+        """
+        :param indices: A sorted array of row indices.
+        :return: The padded ids of the rows, and their labels one-hot encoded as (negative, positive).
+        """
+        return np.asarray(self.x[indices]), np.eye(2, dtype=np.float32)[self.y[indices]]
+
+    def chunks(self, chunk_rows, *, epoch=0, seed=0, start=0, workers=4):
+        """
+        Yields the whole dataset in a random order, a chunk at a time. The order depends only on seed and epoch, so
+        an epoch can be resumed part way through. Up to workers chunks are read ahead by a pool of threads.
+        :param chunk_rows: The number of rows in each chunk.
+        :param epoch: The epoch number, which varies the order.
+        :param seed: Seed of the order.
+        :param start: The index of the first chunk yielded, to resume an epoch.
+        :param workers: The number of threads reading chunks.
+        :return: A generator of (chunk index, ids, one-hot labels) tuples.
+        """
+        order = np.random.RandomState(seed + epoch).permutation(self.rows)
+        # Rows are read in file order within each chunk; the model shuffles each chunk while fitting it.
+        parts = [np.sort(order[i:i+chunk_rows]) for i in range(0, self.rows, chunk_rows)]
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for index in range(start, len(parts)):
+                pending.append((index, executor.submit(self.gather, parts[index])))
+                if len(pending) >= workers:
+                    index, future = pending.popleft()
+                    yield (index,) + future.result()
+            while pending:
+                index, future = pending.popleft()
+                yield (index,) + future.result()
+
+
+def imdb_datasets(directory, *, maxlen=100):
+    """
+    :param directory: Where the IMDB datasets are kept.
+    :return: The TrainingData of the IMDB training and test sets, building them first if they don't exist yet.
+    """
+    datasets = []
+    for split in ('train', 'test'):
+        path = os.path.join(directory, 'imdb-' + split)
+        try:
+            datasets.append(TrainingData(path))
+        except (IOError, ValueError):
+            datasets.append(build_dataset(imdb_examples(split), path, maxlen=maxlen))
+    return datasets
+
+
+def train(model, save_path, training_data, *, validation_data=None, n_epoch=10, batch_size=32,
+          checkpoint_every=500, workers=4, seed=0, report=print):
+    """
+    Fits a model a chunk of checkpoint_every batches at a time, saving a checkpoint after each chunk. If a previous run
+    with the same save_path was interrupted, training resumes from its latest checkpoint. The checkpoints are deleted
+    once the model is saved.
+    :param model: A tflearn DNN, or anything with its fit, evaluate, save and load methods.
+    :param save_path: Path to save the trained model to. Checkpoints are kept in the directory save_path.training.
+    :param training_data: A TrainingData to fit.
+    :param validation_data: An optional TrainingData to evaluate after each epoch.
+    :param n_epoch: The number of passes over the training data.
+    :param batch_size: The number of examples in each training step.
+    :param checkpoint_every: The number of steps between checkpoints.
+    :param workers: The number of threads preparing chunks.
+    :param seed: Seed of the order of the examples.
+    :param report: Called with a line of text after each epoch.
+    :return: A list with a dictionary of statistics for each epoch run.
+    :raises ValueError: If the checkpoints were made of other training data or with other options.
+    """
+    state_directory = save_path + '.training'
+    checkpoint_path = os.path.join(state_directory, 'checkpoint.tfl')
+    progress_path = os.path.join(state_directory, 'progress.json')
+    if not os.path.isdir(state_directory):
+        os.makedirs(state_directory)
+
+    # A checkpoint is only resumed by a run over the same data, split into the same chunks.
+    run = {'data': _fingerprint(training_data), 'n_epoch': n_epoch, 'batch_size': batch_size,
+           'checkpoint_every': checkpoint_every}
+    progress = {'run': run, 'epoch': 0, 'chunk': 0, 'seed': seed}
+    if os.path.isfile(progress_path):
+        with open(progress_path) as infile:
+            saved = json.load(infile)
+        if saved.get('run') != run:
+            raise ValueError("{} holds the checkpoints of another training run. Delete it to start over."
+                             .format(state_directory))
+        progress = saved
+        if progress['epoch'] or progress['chunk']:
+            model.load(checkpoint_path)
+            report("Resuming from epoch {}, step {}".format(progress['epoch'] + 1,
+                                                            progress['chunk'] * checkpoint_every))
+    seed = progress['seed']
+
+    history = []
+    for epoch in range(progress['epoch'], n_epoch):
+        start = progress['chunk'] if epoch == progress['epoch'] else 0
+        examples = 0
+        started = time.time()
+        for chunk, x, y in training_data.chunks(batch_size * checkpoint_every, epoch=epoch, seed=seed, start=start,
+                                                workers=workers):
+            model.fit(x, y, n_epoch=1, batch_size=batch_size, shuffle=True, show_metric=True)
+            examples += len(x)
+            model.save(checkpoint_path)
+            _write_json(progress_path, {'run': run, 'epoch': epoch, 'chunk': chunk + 1, 'seed': seed})
+        elapsed = time.time() - started
+
+        stats = {'epoch': epoch + 1, 'examples': examples, 'seconds': elapsed,
+                 'examples_per_second': examples / elapsed if elapsed else 0.0}
+        line = "Epoch {}: {} examples in {:.1f}s, {:.1f} examples/sec".format(
+            epoch + 1, examples, elapsed, stats['examples_per_second'])
+        if validation_data is not None:
+            x, y = validation_data.gather(np.arange(len(validation_data)))
+            stats['validation_accuracy'] = float(model.evaluate(x, y, batch_size=256)[0])
+            line += ", validation accuracy {:.4f}".format(stats['validation_accuracy'])
+        report(line)
+        history.append(stats)
+        _write_json(progress_path, {'run': run, 'epoch': epoch + 1, 'chunk': 0, 'seed': seed})
+
+    model.save(save_path)
+    shutil.rmtree(state_directory)
+    return history
+
+
+def _fingerprint(data):
+    """
+    :param data: A TrainingData.
+    :return: The absolute path, size and modification time of the dataset's ids, which change if it is rebuilt.
+    """
+    stat = os.stat(data.path + '.x')
+    return {'path': os.path.abspath(data.path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+if __name__ == '__main__':
+    # If run individually, we build a dataset from a labeled Reddit comment corpus, for SentimentClassifier's
+    # training_data option: python training.py corpus.jsonl saved_data/training/reddit-train
+    from utilities.vocabulary import Vocabulary
+
+    vocabulary = Vocabulary.load_or_build('saved_data/trained_models/vocabulary.tsv')
+    dataset = build_dataset(reddit_examples(sys.argv[1], vocabulary), sys.argv[2])
+    print("Wrote {} examples to {}".format(len(dataset), sys.argv[2]))
@@ -0,0 +1,144 @@
+# The vocabulary used to turn text into the word ids expected by the sentiment model, stored as a compact artifact.
+
+import os
+import sys
+
+# Artifacts from other versions of the format are rebuilt rather than read.
+VERSION = 1
+
+# Ids reserved by the Keras IMDB dataset the model was trained on, and the id of words which are dropped entirely.
+PAD, START, UNK = 0, 1, 2
+DROP = -1
+
+# Offset of the Keras IMDB word index's ranks from the ids used in training, as with imdb.load_data(index_from=3).
+INDEX_FROM = 3
+
+
+class Vocabulary(object):
+    """
+    Maps lowercased words to model ids. Only the words the model can use, those with ids below max_id, are kept,
+    along with the stop words, which map to DROP. Encoding a word is a single lookup.
+    """
+    version = VERSION
+
+    def __init__(self, word_ids, *, max_id=10000):
+        """
+        :param word_ids: A dictionary of lowercased words to ids, with stop words mapping to DROP.
+        :param max_id: The number of ids the model's embedding layer accepts.
+        """
+        self.word_ids = word_ids
+        self.max_id = max_id
+        self._id_words = None
+
+    def __len__(self):
+        return len(self.word_ids)
+
+    @classmethod
+    def build(cls, word_index=None, stop_words=None, *, max_id=10000):
+        """
+        :param word_index: A dictionary of words to their frequency rank, by default the Keras IMDB word index.
+        :param stop_words: Words removed before classification, by default nltk's English stop words.
+        :param max_id: See __init__.
+        :return: A Vocabulary of the words whose ids are below max_id, and of the stop words.
+        """
+        if word_index is None:
+            from keras.datasets import imdb
+            word_index = imdb.get_word_index()
+        if stop_words is None:
+            from nltk.corpus import stopwords
+            stop_words = stopwords.words('english')
+
+        word_ids = {}
+        for word, rank in word_index.items():
+            word_id = rank + INDEX_FROM
+            if word_id < max_id and word.lower() not in word_ids:
+                word_ids[word.lower()] = word_id
+        for word in stop_words:
+            word_ids[word.lower()] = DROP
+        return cls(word_ids, max_id=max_id)
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: Path of an artifact written by save.
+        :return: The Vocabulary stored there.
+        :raises FileNotFoundError: If there is no artifact at path.
+        :raises ValueError: If the artifact is of another version.
+        """
+        if not os.path.isfile(path):
+            raise FileNotFoundError("No vocabulary at {0}. Build it with python3 -m utilities.vocabulary {0}"
+                                    .format(path))
+        with open(path, encoding='utf-8') as infile:
+            header = infile.readline().split()
+            fields = dict(field.split('=', 1) for field in header[1:])
+            if header[:1] != ['#vocabulary'] or int(fields.get('version', 0)) != VERSION:
+                raise ValueError("{} is not a version {} vocabulary".format(path, VERSION))
+            word_ids = {}
+            for line in infile:
+                word, word_id = line.rstrip('\n').split('\t')
+                word_ids[word] = int(word_id)
+        return cls(word_ids, max_id=int(fields['max_id']))
+
+    def save(self, path):
+        """
+        :action: Writes the vocabulary, sorted by word, to a tab-separated file, replacing any existing one atomically.
+        :return: None
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as outfile:
+            outfile.write('#vocabulary version={} max_id={} size={}\n'.format(VERSION, self.max_id, len(self)))
+            for word in sorted(self.word_ids):
+                outfile.write('{}\t{}\n'.format(word, self.word_ids[word]))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load_or_build(cls, path, *, max_id=10000):
+        """
+        :return: The Vocabulary at path, first building and saving it there if it is missing or out of date.
+        """
+        try:
+            vocabulary = cls.load(path)
+            if vocabulary.max_id == max_id:
+                return vocabulary
+        except (IOError, ValueError):
+            pass
+        vocabulary = cls.build(max_id=max_id)
+        vocabulary.save(path)
+        return vocabulary
+
+    def encode(self, words, max_id=None, *, lowercase=True):
+        """
+        :param words: A list of string words.
+        :param max_id: Ids at or above this are replaced by UNK, by default the vocabulary's max_id.
+        :param lowercase: Whether the words are lowercased before being looked up. Pass False for words which
+                          already are, such as those of a Document.
+        :return: A list of ids starting with START, with stop words removed and unknown words as UNK.
+        """
+        word_ids = self.word_ids
+        if lowercase:
+            words = [word.lower() for word in words]
+        ids = [word_ids.get(word, UNK) for word in words]
+        if max_id is not None and max_id < self.max_id:
+            ids = [word_id if word_id < max_id else UNK for word_id in ids]
+        return [START] + [word_id for word_id in ids if word_id != DROP]
+
+    def decode(self, vector):
+        """
+        :param vector: A list of ids.
+        :return: A string of the words corresponding to the ids.
+        """
+        if self._id_words is None:
+            self._id_words = {word_id: word for word, word_id in self.word_ids.items() if word_id != DROP}
+            self._id_words.update({PAD: '<PAD>', START: '<START>', UNK: '<UNK>'})
+        return ' '.join(self._id_words.get(word_id, '<UNK>') for word_id in vector)
+
+
+if __name__ == '__main__':
+    # If run individually, we build the vocabulary artifact at the given path.
+    path = sys.argv[1] if len(sys.argv) > 1 else 'saved_data/trained_models/vocabulary.tsv'
+    vocabulary = Vocabulary.build()
+    vocabulary.save(path)
+    print("Wrote {} words to {}".format(len(vocabulary), path))
@@ -0,0 +1,113 @@
+# Batched lookups of the political parties of Wikipedia pages through the Wikidata API, on one pooled HTTP session.
+
+from requests.adapters import HTTPAdapter
+
+import requests
+import threading
+
+WIKIDATA_API = 'https://www.wikidata.org/w/api.php'
+
+# The Wikidata property "member of political party".
+PARTY_PROPERTY = 'P102'
+
+USER_AGENT = 'RedditPoliticalSentiment (https://github.com/klingj3/RedditPoliticalSentiment)'
+
+
+class WikidataResolver(object):
+    """
+    Finds the political party of many English Wikipedia pages at once. The Wikidata items of every title are fetched
+    in one request per batch_size titles, and the labels of their parties in one more, skipping parties whose labels
+    were already fetched. All requests share one session, so connections are reused.
+    """
+
+    def __init__(self, *, endpoint=WIKIDATA_API, session=None, batch_size=50, timeout=10, pool_size=16):
+        """
+        :param endpoint: The URL of the Wikidata API.
+        :param session: The requests Session to use, by default a new one with a pool of pool_size connections.
+        :param batch_size: The most titles or items requested at once, which is 50 for the public API.
+        :param timeout: Seconds to wait for each response.
+        :param pool_size: The number of connections kept open to the API.
+        """
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.timeout = timeout
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+            session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+            session.headers['User-Agent'] = USER_AGENT
+        self.session = session
+
+        # English labels of party items, which are shared by most of the people looked up.
+        self._labels = {}
+        self._lock = threading.Lock()
+
+    def parties_of_titles(self, titles):
+        """
+        :param titles: An iterable of English Wikipedia page titles.
+        :return: A dictionary mapping each title to the English label of the first political party listed on its
+                 Wikidata item, or to None if it has no item, no party, or a party without an English label.
+        """
+        titles = list(dict.fromkeys(titles))
+        party_ids = {}
+        for start in range(0, len(titles), self.batch_size):
+            batch = titles[start:start+self.batch_size]
+            entities = self._get_entities(sites='enwiki', titles='|'.join(batch), props='claims|sitelinks',
+                                          sitefilter='enwiki')
+            found = {}
+            for entity in entities.values():
+                title = entity.get('sitelinks', {}).get('enwiki', {}).get('title', entity.get('title'))
+                found[title] = self._party_id(entity)
+            for title in batch:
+                party_ids[title] = found.get(title)
+
+        with self._lock:
+            unknown = sorted({party_id for party_id in party_ids.values()
+                              if party_id is not None and party_id not in self._labels})
+        labels = {}
+        for start in range(0, len(unknown), self.batch_size):
+            entities = self._get_entities(ids='|'.join(unknown[start:start+self.batch_size]), props='labels',
+                                          languages='en')
+            for party_id, entity in entities.items():
+                labels[party_id] = entity.get('labels', {}).get('en', {}).get('value')
+        with self._lock:
+            self._labels.update(labels)
+            return {title: None if party_id is None else self._labels.get(party_id)
+                    for title, party_id in party_ids.items()}
+
+    def party_of_title(self, title):
+        """
+        :param title: A string page title.
+        :return: See parties_of_titles.
+        """
+        return self.parties_of_titles([title])[title]
+
+    @staticmethod
+    def _party_id(entity):
+        """
+        :param entity: A Wikidata entity, as returned by wbgetentities.
+        :return: The item id of the first political party in the entity's claims, or None.
+        """
+        claims = entity.get('claims', {}).get(PARTY_PROPERTY)
+        if not claims:
+            return None
+        value = claims[0].get('mainsnak', {}).get('datavalue', {}).get('value')
+        return value.get('id') if isinstance(value, dict) else None
+
+    def _get_entities(self, **params):
+        """
+        :param params: Parameters of a wbgetentities request.
+        :return: The entities of the response, keyed by id. Missing pages are keyed by negative numbers.
+        :raises ConnectionError: If the request fails, or the API responds with an error, as both are usually
+                                 transient and are treated by the Interface as failed lookups.
+        """
+        params.update(action='wbgetentities', format='json')
+        try:
+            response = self.session.post(self.endpoint, data=params, timeout=self.timeout)
+            response.raise_for_status()
+            body = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise ConnectionError("Wikidata request failed: {}".format(e)) from e
+        if 'error' in body:
+            raise ConnectionError("Wikidata error: {}".format(body['error'].get('info', body['error'])))
+        return body.get('entities', {})